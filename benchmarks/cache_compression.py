@@ -0,0 +1,84 @@
+# Fills response caches with synthetic feed pages and compares the memory
+# they retain, the compression ratio and the latency of a cache hit for the
+# plain cache and the compressed caches.
+#
+#   PYTHONPATH=. python benchmarks/cache_compression.py --pages 2000
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from interning_memory import PAGE_SIZE, synthetic_track
+
+from pyhearthis.compression import (
+    CompressedResponseCache,
+    ZlibCodec,
+    ZstdCodec,
+    track_samples,
+    train_dictionary,
+    zstandard,
+)
+from pyhearthis.resilience import ResponseCache
+
+WORDS = ["deep", "house", "live", "set", "recorded", "at", "club", "mix", "vinyl"]
+
+
+def synthetic_page(page: int, artists: int) -> list:
+    tracks = []
+    for index in range(page * PAGE_SIZE, (page + 1) * PAGE_SIZE):
+        track = synthetic_track(index, artists)
+        words = random.Random(index).choices(WORDS, k=60)
+        track["description"] = " ".join(words)
+        track["waveform_data_json"] = str(
+            [random.Random(index + i).randint(0, 255) for i in range(200)]
+        )
+        tracks.append(track)
+    return tracks
+
+
+def create_caches(pages: int, artists: int) -> dict:
+    caches = {
+        "plain": ResponseCache(max_entries=pages),
+        "zlib": CompressedResponseCache(max_entries=pages, codec=ZlibCodec()),
+    }
+    if zstandard is not None:
+        samples = track_samples(synthetic_page(pages + 1, artists))
+        caches["zstd+dict"] = CompressedResponseCache(
+            max_entries=pages, codec=ZstdCodec(dictionary=train_dictionary(samples))
+        )
+    return caches
+
+
+def measure(cache: ResponseCache, pages: int, artists: int) -> tuple:
+    tracemalloc.start()
+    for page in range(pages):
+        cache.put(("feed", page), synthetic_page(page, artists))
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for page in range(pages):
+        cache.get(("feed", page))
+    hit_seconds = (time.perf_counter() - started) / pages
+    return retained, hit_seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--artists", type=int, default=3000)
+    args = parser.parse_args()
+
+    print(f"{'cache':<10}{'retained MiB':>14}{'ratio':>8}{'hit ms':>10}")
+    for name, cache in create_caches(args.pages, args.artists).items():
+        retained, hit_seconds = measure(cache, args.pages, args.artists)
+        ratio = cache.stats().ratio if hasattr(cache, "stats") else 1.0
+        print(
+            f"{name:<10}{retained / 2**20:>14.1f}{ratio:>8.1f}"
+            f"{hit_seconds * 1000:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Replays synthetic feed pages through the client with the allocation
+# profiler and fails when the peak of a decode exceeds the given budget, so
+# memory regressions in the decode path show up in CI.
+#
+#   PYTHONPATH=. python benchmarks/decode_memory.py --pages 50 --max-peak-kib 512
+
+import argparse
+import asyncio
+import sys
+
+from interning_memory import PAGE_SIZE, synthetic_track
+
+from pyhearthis.hearthis import HearThis
+from pyhearthis.models import LoggedinUser
+from pyhearthis.profiling import AllocationProfiler
+from pyhearthis.recording import Cassette, ReplaySession, create_interaction
+
+
+def create_session(pages: int) -> ReplaySession:
+    cassette = Cassette()
+    for page in range(1, pages + 1):
+        start = (page - 1) * PAGE_SIZE
+        tracks = [synthetic_track(i, 100) for i in range(start, start + PAGE_SIZE)]
+        params = dict(key="key", secret="secret", page=page, count=PAGE_SIZE)
+        url = f"{HearThis.api_endpoint}feed/"
+        cassette.append(create_interaction("GET", url, tracks, params=params))
+
+    return ReplaySession(cassette)
+
+
+async def run(pages: int, profiler: AllocationProfiler) -> None:
+    user = LoggedinUser(*[None] * len(LoggedinUser._fields))._replace(
+        key="key", secret="secret"
+    )
+    hearthis = HearThis(create_session(pages), profiler=profiler)
+    for page in range(1, pages + 1):
+        await hearthis.get_feeds(user, page=page, count=PAGE_SIZE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--sample-rate", type=float, default=1.0)
+    parser.add_argument("--max-peak-kib", type=float, default=None)
+    args = parser.parse_args()
+
+    profiler = AllocationProfiler(sample_rate=args.sample_rate)
+    asyncio.run(run(args.pages, profiler))
+    profiler.stop()
+    print(profiler.format_report())
+
+    peak = max(item.peak for item in profiler.report()) / 1024
+    if args.max_peak_kib is not None and peak > args.max_peak_kib:
+        print(f"peak of {peak:.1f} KiB exceeds {args.max_peak_kib} KiB")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
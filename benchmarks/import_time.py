@@ -0,0 +1,112 @@
+# Measures the cold import of a module with `python -X importtime` in fresh
+# interpreters. Fails when the best run exceeds the budget or when a module
+# which has to stay lazy got imported, so startup regressions show up in CI.
+#
+#   python benchmarks/import_time.py --module pyhearthis.hearthis \
+#       --max-ms 120 --forbid aiohttp
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ImportTiming(NamedTuple):
+    name: str
+    self_us: int
+    cumulative_us: int
+    top_level: bool
+
+
+def _import_times(code: str) -> List[ImportTiming]:
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(
+        path for path in [ROOT, environment.get("PYTHONPATH")] if path
+    )
+    # without cached bytecode the compile time would be measured as well
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=environment,
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+
+    timings = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time: self | cumulative | name", nested imports are indented
+        self_us, cumulative_us, name = line.split("|")
+        timings.append(
+            ImportTiming(
+                name.strip(),
+                int(self_us.split(":")[1]),
+                int(cumulative_us),
+                not name[1:].startswith(" "),
+            )
+        )
+    return timings
+
+
+def measure(module: str) -> List[ImportTiming]:
+    # the modules of the interpreter startup are not part of the import
+    startup = {timing.name for timing in _import_times("pass")}
+    return [
+        timing
+        for timing in _import_times(f"import {module}")
+        if timing.name not in startup
+    ]
+
+
+def total_us(timings: List[ImportTiming]) -> int:
+    return sum(timing.cumulative_us for timing in timings if timing.top_level)
+
+
+def forbidden_imports(timings: List[ImportTiming], forbidden: List[str]) -> list:
+    imported = {timing.name for timing in timings}
+    return [
+        name
+        for name in forbidden
+        if any(module == name or module.startswith(f"{name}.") for module in imported)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="pyhearthis.hearthis")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None)
+    parser.add_argument("--forbid", action="append", default=[])
+    parser.add_argument("--top", type=int, default=10)
+    arguments = parser.parse_args()
+
+    # the best run is the least disturbed by the rest of the machine
+    runs = [measure(arguments.module) for _ in range(arguments.runs)]
+    best = min(runs, key=total_us)
+    best_ms = total_us(best) / 1000
+
+    print(f"import {arguments.module}: {best_ms:.1f} ms (best of {len(runs)})")
+    slowest: Dict[str, int] = {t.name: t.self_us for t in best}
+    for name in sorted(slowest, key=slowest.get, reverse=True)[: arguments.top]:
+        print(f"  {slowest[name] / 1000:8.2f} ms  {name}")
+
+    failed = False
+    forbidden = forbidden_imports(best, arguments.forbid)
+    if forbidden:
+        print(f"imported lazy modules: {', '.join(forbidden)}")
+        failed = True
+    if arguments.max_ms is not None and best_ms > arguments.max_ms:
+        print(f"exceeds the budget of {arguments.max_ms:.1f} ms")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Compares the memory retained by a synthetic track ingest with and without
+# an InternRegistry. Every mode runs in its own interpreter, so the resident
+# size is not influenced by the other run.
+#
+#   PYTHONPATH=. python benchmarks/interning_memory.py --tracks 100000 --artists 3000
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+from pyhearthis.decoding import json_to_track
+from pyhearthis.interning import InternRegistry
+from pyhearthis.models import SingleTrack, cast_list
+
+GENRES = ["Drum & Bass", "House", "Techno", "Ambient", "Dubstep", "Jazz"]
+TYPES = ["DJ-Set", "Track", "Podcast"]
+PAGE_SIZE = 20
+
+
+def synthetic_track(index: int, artists: int) -> dict:
+    artist = index % artists
+    genre = GENRES[index % len(GENRES)]
+    track = {field: "0" if "_count" in field else "" for field in SingleTrack._fields}
+    track.update(
+        {
+            "id": str(index),
+            "user_id": str(artist),
+            "duration": "3600",
+            "bpm": "124",
+            "release_timestamp": "0",
+            "permalink": f"track-{index}",
+            "title": f"Track {index}",
+            "genre": genre,
+            "genre_slush": genre.lower().replace(" ", ""),
+            "type": TYPES[index % len(TYPES)],
+            "license": "cc-by",
+            "geopoint": [],
+            "tags_arr": [],
+            "taged_artists_arr": [],
+            "subcategories_arr": [],
+            "counts": {},
+            "stream_url": f"https://hearthis.at/artist-{artist}/track-{index}/listen/",
+            "user": {
+                "id": str(artist),
+                "permalink": f"artist-{artist}",
+                "username": f"Artist {artist}",
+                "uri": f"https://api-v2.hearthis.at/artist-{artist}/",
+                "permalink_url": f"https://hearthis.at/artist-{artist}/",
+                "avatar_url": f"https://hearthis.at/images/user/{artist}.jpg",
+            },
+        }
+    )
+    return track
+
+
+def ingest(tracks: int, artists: int, interned: bool) -> list:
+    registry = InternRegistry() if interned else None
+    result = []
+    for start in range(0, tracks, PAGE_SIZE):
+        page = [synthetic_track(i, artists) for i in range(start, start + PAGE_SIZE)]
+        # decode from text, like responses from the API, so that every page
+        # contains fresh string objects
+        items = cast_list(json.loads(json.dumps(page)))
+        if registry is None:
+            result.extend(map(json_to_track, items))
+        else:
+            result.extend(map(registry.track, items))
+
+    return result
+
+
+def run_mode(tracks: int, artists: int, interned: bool) -> None:
+    tracemalloc.start()
+    result = ingest(tracks, artists, interned)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    users = len({id(track.user) for track in result})
+    print(json.dumps({"retained": current, "max_rss_kb": max_rss, "users": users}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=100000)
+    parser.add_argument("--artists", type=int, default=3000)
+    parser.add_argument("--mode", choices=["plain", "interned"])
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        run_mode(args.tracks, args.artists, args.mode == "interned")
+        return
+
+    print(f"{'mode':<10}{'retained MiB':>14}{'max RSS MiB':>14}{'users':>10}")
+    for mode in ["plain", "interned"]:
+        output = subprocess.check_output(
+            [sys.executable, __file__, "--mode", mode]
+            + ["--tracks", str(args.tracks), "--artists", str(args.artists)]
+        )
+        stats = json.loads(output)
+        print(
+            f"{mode:<10}{stats['retained'] / 2**20:>14.1f}"
+            f"{stats['max_rss_kb'] / 2**10:>14.1f}{stats['users']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
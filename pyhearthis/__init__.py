@@ -0,0 +1,57 @@
+import importlib
+
+# The main classes are available from the package, e.g. pyhearthis.HearThis.
+# Their modules are imported on first access, so importing the package does
+# not load aiohttp or any subsystem which is not used.
+_LAZY_ATTRIBUTES = {
+    "HearThis": "hearthis",
+    "FeedType": "hearthis",
+    "SearchType": "hearthis",
+    "ArtistTracklistType": "hearthis",
+    "LoggedinUser": "models",
+    "SingleTrack": "models",
+    "SingleArtist": "models",
+    "Playlist": "models",
+    "Category": "models",
+    "User": "models",
+    "RequestError": "errors",
+    "AuthenticationError": "errors",
+    "DeadlineExceededError": "errors",
+    "CircuitOpenError": "errors",
+    "HearThisSync": "sync",
+    "HearThisPool": "pool",
+    "CircuitBreakers": "resilience",
+    "ResponseCache": "resilience",
+    "InternRegistry": "interning",
+    "AllocationProfiler": "profiling",
+    "RequestScheduler": "scheduler",
+    "Priority": "scheduler",
+    "DownloadManager": "download_manager",
+    "StreamRelay": "relay",
+    "WaveformCache": "waveform",
+    "FederatedSearch": "federated",
+    "SessionManager": "session_store",
+    "Pipeline": "pipeline",
+    "FeedBackfill": "backfill",
+    "Watchlist": "watchlist",
+    "CatalogStatistics": "statistics",
+    "SqliteWorkQueue": "work_queue",
+    "CrawlWorker": "work_queue",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    # later lookups find the attribute without calling __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+from datetime import date, timedelta
+from typing import AsyncIterator, Dict, List, NamedTuple, Set
+
+from .hearthis import FeedType, HearThis
+from .models import LoggedinUser, SingleTrack
+from .ranking import RankKey, rank_value
+
+
+class FeedWindow(NamedTuple):
+    # both days are included
+    start: date
+    end: date
+
+    @property
+    def days(self) -> int:
+        return (self.end - self.start).days + 1
+
+    def split(self) -> List["FeedWindow"]:
+        middle = self.start + timedelta(days=(self.days - 1) // 2)
+        return [
+            FeedWindow(self.start, middle),
+            FeedWindow(middle + timedelta(days=1), self.end),
+        ]
+
+
+class WindowResult(NamedTuple):
+    window: FeedWindow
+    tracks: List[SingleTrack]
+
+
+class CheckpointMismatchError(Exception):
+    pass
+
+
+def partition(start: date, end: date, window: timedelta) -> List[FeedWindow]:
+    assert start <= end, "start has to be before end"
+    assert window.days >= 1, "windows span at least one day"
+
+    windows = []
+    while start <= end:
+        window_end = min(start + window - timedelta(days=1), end)
+        windows.append(FeedWindow(start, window_end))
+        start = window_end + timedelta(days=1)
+
+    return windows
+
+
+def _time_key(track: SingleTrack):
+    return (rank_value(track, RankKey.RECENCY), str(track.id))
+
+
+class FeedBackfill:
+    # Pages a long feed date range through many small windows at once.
+    #
+    # A window costs one request when its first page is short. Otherwise the
+    # page `dense_pages` is probed: when it is still full the window is split
+    # in halves, else the remaining pages are requested concurrently. Windows
+    # of a single day are paged until a short page arrives.
+    #
+    # Windows are emitted in time order with their tracks sorted from old to
+    # new, tracks seen in an earlier window are dropped. With a checkpoint
+    # file a window is recorded once the caller asks for the next one, and
+    # recorded windows are skipped by a later run. The checkpoint keeps the
+    # track ids of the last recorded window as well, the next window starts
+    # with tracks of that one.
+
+    def __init__(
+        self,
+        hearthis: HearThis,
+        user: LoggedinUser,
+        start: date,
+        end: date,
+        category: str = "",
+        feed_type: FeedType = FeedType.UNDEFINED,
+        window: timedelta = timedelta(days=7),
+        count: int = 20,
+        concurrency: int = 8,
+        dense_pages: int = 10,
+        checkpoint_path: str = None,
+    ) -> None:
+        assert dense_pages > 1, "dense_pages has to be larger than one"
+
+        self._hearthis = hearthis
+        self._user = user
+        self.start = start
+        self.end = end
+        self.category = category
+        self.feed_type = feed_type
+        self.window = window
+        self.count = count
+        self.dense_pages = dense_pages
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._seen: Set = set()
+        self.requests = 0
+        self.splits = 0
+
+    def _parameters(self) -> dict:
+        return dict(
+            start=self.start.isoformat(),
+            end=self.end.isoformat(),
+            category=self.category,
+            feed_type=self.feed_type.name,
+        )
+
+    def _load_checkpoint(self) -> List[FeedWindow]:
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return []
+
+        with open(self.checkpoint_path, "r") as file:
+            checkpoint = json.load(file)
+
+        if checkpoint["parameters"] != self._parameters():
+            raise CheckpointMismatchError(self.checkpoint_path)
+
+        self._seen.update(checkpoint.get("seen", []))
+        return [
+            FeedWindow(date.fromisoformat(start), date.fromisoformat(end))
+            for (start, end) in checkpoint["done"]
+        ]
+
+    def _save_checkpoint(self, done: List[FeedWindow], seen: List) -> None:
+        checkpoint = dict(
+            parameters=self._parameters(),
+            done=[
+                [window.start.isoformat(), window.end.isoformat()] for window in done
+            ],
+            seen=seen,
+        )
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(checkpoint, file)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def _open_windows(self, done: List[FeedWindow]) -> List[FeedWindow]:
+        # the initial windows without the days which are already done
+        done_days = set()
+        for window in done:
+            done_days.update(
+                window.start + timedelta(days=day) for day in range(window.days)
+            )
+
+        windows = []
+        for window in partition(self.start, self.end, self.window):
+            run_start = None
+            for day in range(window.days + 1):
+                current = window.start + timedelta(days=day)
+                is_open = day < window.days and current not in done_days
+                if is_open and run_start is None:
+                    run_start = current
+                elif not is_open and run_start is not None:
+                    windows.append(FeedWindow(run_start, current - timedelta(days=1)))
+                    run_start = None
+
+        return windows
+
+    async def _page(self, window: FeedWindow, page: int) -> List[SingleTrack]:
+        async with self._semaphore:
+            self.requests += 1
+            return await self._hearthis.get_feeds(
+                self._user,
+                category=self.category,
+                feed_type=self.feed_type,
+                page=page,
+                count=self.count,
+                feed_start=window.start,
+                feed_end=window.end,
+            )
+
+    async def _pages(self, window: FeedWindow, pages: range) -> List[list]:
+        return await asyncio.gather(*[self._page(window, page) for page in pages])
+
+    async def _fetch(self, window: FeedWindow) -> List[SingleTrack]:
+        # returns None when the window has to be split
+        first = await self._page(window, 1)
+        if len(first) < self.count:
+            return first
+
+        probe = await self._page(window, self.dense_pages)
+        if len(probe) == self.count and window.days > 1:
+            return None
+
+        tracks = list(first)
+        for page in await self._pages(window, range(2, self.dense_pages)):
+            tracks.extend(page)
+        tracks.extend(probe)
+
+        # a single day may have any number of pages
+        next_page = self.dense_pages + 1
+        last = probe
+        while len(last) == self.count:
+            batch = range(next_page, next_page + self.concurrency)
+            pages = await self._pages(window, batch)
+            for last in pages:
+                tracks.extend(last)
+                if len(last) < self.count:
+                    break
+            next_page = batch.stop
+
+        return tracks
+
+    async def windows(self) -> AsyncIterator[WindowResult]:
+        done = self._load_checkpoint()
+        pending = self._open_windows(done)
+        tasks: Dict[FeedWindow, asyncio.Future] = dict()
+        # only windows close to the oldest open one are fetched, so a slow
+        # window does not make the results of all later ones pile up
+        lookahead = 2 * self.concurrency
+
+        try:
+            while pending:
+                for window in pending[:lookahead]:
+                    if window not in tasks:
+                        tasks[window] = asyncio.ensure_future(self._fetch(window))
+
+                window = pending[0]
+                tracks = await tasks.pop(window)
+                if tracks is None:
+                    self.splits += 1
+                    pending[0:1] = window.split()
+                    continue
+
+                pending.pop(0)
+                unique = []
+                for track in sorted(tracks, key=_time_key):
+                    if track.id not in self._seen:
+                        self._seen.add(track.id)
+                        unique.append(track)
+
+                yield WindowResult(window, unique)
+
+                done.append(window)
+                if self.checkpoint_path is not None:
+                    self._save_checkpoint(done, [track.id for track in tracks])
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def run(self) -> List[SingleTrack]:
+        tracks = []
+        async for result in self.windows():
+            tracks.extend(result.tracks)
+
+        return tracks
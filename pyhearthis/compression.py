@@ -0,0 +1,185 @@
+import json
+import time
+import zlib
+from typing import Any, Hashable, Iterable, NamedTuple, Union
+
+from .models import SingleTrack
+from .resilience import CacheEntry, ResponseCache
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+class ZlibCodec:
+    name = "zlib"
+
+    def __init__(self, level: int = 6) -> None:
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCodec:
+    # A dictionary trained on similar payloads (train_dictionary) lets even
+    # a single small track compress well, the shared keys and url prefixes
+    # are then not repeated in every entry.
+
+    name = "zstd"
+
+    def __init__(self, level: int = 3, dictionary: bytes = None) -> None:
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+
+        self.level = level
+        self.dictionary = dictionary
+        options = dict()
+        if dictionary is not None:
+            options["dict_data"] = zstandard.ZstdCompressionDict(dictionary)
+        self._compressor = zstandard.ZstdCompressor(level=level, **options)
+        self._decompressor = zstandard.ZstdDecompressor(**options)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+
+def track_samples(tracks: Iterable[Union[SingleTrack, dict]]) -> list:
+    # serialized tracks, e.g. to train a zstd dictionary
+    return [
+        json.dumps(track._asdict() if hasattr(track, "_asdict") else track).encode()
+        for track in tracks
+    ]
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = 16 * 1024) -> bytes:
+    if zstandard is None:
+        raise ValueError("training a dictionary requires the zstandard package")
+
+    return zstandard.train_dictionary(size, list(samples)).as_bytes()
+
+
+def create_codec(dictionary: bytes = None, level: int = None):
+    # zstd when it is installed, zlib otherwise
+    if zstandard is not None:
+        return ZstdCodec(3 if level is None else level, dictionary)
+
+    return ZlibCodec(6 if level is None else level)
+
+
+def pack_record(record: Union[SingleTrack, dict], codec) -> bytes:
+    # compresses the json of a record, e.g. to persist raw tracks
+    data = record._asdict() if hasattr(record, "_asdict") else record
+    return codec.compress(json.dumps(data).encode())
+
+
+def unpack_record(data: bytes, codec) -> dict:
+    return json.loads(codec.decompress(data))
+
+
+class CompressedPayload(NamedTuple):
+    data: bytes
+    raw_size: int
+    # str payloads are stored utf-8 encoded
+    is_text: bool
+
+
+class CompressionStats(NamedTuple):
+    codec: str
+    entries: int
+    raw_bytes: int
+    stored_bytes: int
+    ratio: float
+    hits: int
+    mean_hit_seconds: float
+    max_hit_seconds: float
+
+
+class CompressedResponseCache(ResponseCache):
+    # A response cache which keeps its payloads compressed. They are only
+    # decompressed when an entry is hit. With max_bytes the cache is bounded
+    # by the compressed size instead of only by the number of entries.
+
+    def __init__(
+        self,
+        ttl: float = 60.0,
+        stale_ttl: float = 3600.0,
+        max_entries: int = 10240,
+        stale_while_revalidate: bool = False,
+        codec=None,
+        max_bytes: int = None,
+    ) -> None:
+        super().__init__(ttl, stale_ttl, max_entries, stale_while_revalidate)
+        self.codec = codec or create_codec()
+        self.max_bytes = max_bytes
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.hits = 0
+        self._hit_seconds = 0.0
+        self._max_hit_seconds = 0.0
+
+    def _encode(self, value: Any, is_json: bool) -> CompressedPayload:
+        is_text = isinstance(value, str)
+        if is_json:
+            raw = json.dumps(value).encode()
+        elif is_text:
+            raw = value.encode()
+        else:
+            raw = bytes(value)
+
+        payload = CompressedPayload(self.codec.compress(raw), len(raw), is_text)
+        self.raw_bytes += payload.raw_size
+        self.stored_bytes += len(payload.data)
+        return payload
+
+    def _decode(self, entry: CacheEntry) -> Any:
+        started = time.perf_counter()
+        payload: CompressedPayload = entry.payload
+        raw = self.codec.decompress(payload.data)
+        if entry.is_json:
+            value = json.loads(raw)
+        elif payload.is_text:
+            value = raw.decode()
+        else:
+            value = raw
+
+        elapsed = time.perf_counter() - started
+        self.hits += 1
+        self._hit_seconds += elapsed
+        self._max_hit_seconds = max(self._max_hit_seconds, elapsed)
+        return value
+
+    def _over_capacity(self) -> bool:
+        if self.max_bytes is not None and self.stored_bytes > self.max_bytes:
+            return True
+        return super()._over_capacity()
+
+    def _remove(self, key: Hashable) -> None:
+        payload: CompressedPayload = self._entries[key].payload
+        self.raw_bytes -= payload.raw_size
+        self.stored_bytes -= len(payload.data)
+        super()._remove(key)
+
+    def clear(self) -> None:
+        super().clear()
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def stats(self) -> CompressionStats:
+        return CompressionStats(
+            self.codec.name,
+            len(self),
+            self.raw_bytes,
+            self.stored_bytes,
+            self.raw_bytes / self.stored_bytes if self.stored_bytes else 0.0,
+            self.hits,
+            self._hit_seconds / self.hits if self.hits else 0.0,
+            self._max_hit_seconds,
+        )
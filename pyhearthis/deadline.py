@@ -0,0 +1,72 @@
+import asyncio
+import functools
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict
+
+from .errors import DeadlineExceededError
+
+# Absolute loop time at which the current call has to be finished. The value
+# is inherited by every task spawned while it is set, so all sub-requests of
+# a call share the same budget.
+_deadline: ContextVar[float] = ContextVar("pyhearthis_deadline", default=None)
+
+
+def remaining_budget() -> float:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+
+    return deadline - asyncio.get_running_loop().time()
+
+
+async def within(budget: float, awaitable):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget
+
+    outer_deadline = _deadline.get()
+    if outer_deadline is not None:
+        deadline = min(deadline, outer_deadline)
+
+    token = _deadline.set(deadline)
+    try:
+        return await asyncio.wait_for(awaitable, max(0.0, deadline - loop.time()))
+    except asyncio.TimeoutError as error:
+        raise DeadlineExceededError() from error
+    finally:
+        _deadline.reset(token)
+
+
+def budgeted(method):
+    # adds a `deadline` keyword argument to a coroutine method, the budget in
+    # seconds of the whole call as with within()
+    @functools.wraps(method)
+    async def call(*args, deadline: float = None, **kwargs):
+        if deadline is None:
+            return await method(*args, **kwargs)
+
+        return await within(deadline, method(*args, **kwargs))
+
+    return call
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self._window = window
+        self._min_samples = min_samples
+        self._samples: Dict[str, deque] = dict()
+
+    def record(self, route_family: str, seconds: float) -> None:
+        if route_family not in self._samples:
+            self._samples[route_family] = deque(maxlen=self._window)
+
+        self._samples[route_family].append(seconds)
+
+    def percentile(self, route_family: str, percentile: float) -> float:
+        samples = self._samples.get(route_family)
+        if samples is None or len(samples) < self._min_samples:
+            return None
+
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(percentile * len(ordered)))
+        return ordered[index]
@@ -0,0 +1,80 @@
+import json
+import os
+import sys
+from concurrent.futures import Executor
+from typing import List, Union
+
+from .models import Playlist, SingleTrack, User, cast_list
+
+# The functions of this module are executed inside worker processes when the
+# client runs in executor mode. They have to stay importable module level
+# functions and must only return picklable values. Model NamedTuples pickle
+# as a class reference plus a plain tuple, which keeps the transfer compact.
+
+
+def filter_json_response(json_data):
+    if json_data is None:
+        return dict()
+
+    if "success" in json_data:
+        if json_data["success"] is False:
+            return dict()
+
+    if isinstance(json_data, list):
+        return list(filter(lambda itm: not isinstance(itm, bool), json_data))
+
+    return json_data
+
+
+def json_to_track(json_dict: dict) -> SingleTrack:
+    user_dict = json_dict.pop("user")
+    return SingleTrack(**json_dict, user=User(**user_dict))
+
+
+def json_to_playlist(json_dict: dict) -> Playlist:
+    user_dict = json_dict.pop("user")
+    return Playlist(**json_dict, user=User(**user_dict))
+
+
+def _loads(raw: Union[bytes, str]):
+    if raw is None or len(raw) == 0:
+        return None
+
+    return json.loads(raw)
+
+
+def decode_tracks(raw: Union[bytes, str]) -> List[SingleTrack]:
+    json_data = filter_json_response(_loads(raw))
+    return list(map(json_to_track, cast_list(json_data)))
+
+
+def decode_playlists(raw: Union[bytes, str]) -> List[Playlist]:
+    json_data = filter_json_response(_loads(raw))
+    return list(map(json_to_playlist, cast_list(json_data)))
+
+
+def decode_waveform(raw: Union[bytes, str]) -> List[int]:
+    json_data = _loads(raw)
+    if not isinstance(json_data, list):
+        return []
+
+    return [int(value) for value in json_data]
+
+
+def is_free_threaded() -> bool:
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def create_decode_executor(max_workers: int = None) -> Executor:
+    # Without a GIL, threads already run the decoding in parallel and avoid
+    # pickling the results back to the event loop.
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if is_free_threaded():
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    return ProcessPoolExecutor(max_workers=max_workers)
@@ -0,0 +1,113 @@
+import hashlib
+import mmap
+import os
+import uuid
+from typing import NamedTuple
+
+from .errors import RequestError
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover - optional dependency
+    xxhash = None
+
+
+class DownloadResult(NamedTuple):
+    path: str
+    size: int
+    algorithm: str
+    digest: str
+
+
+class IncompleteDownloadError(RequestError):
+    pass
+
+
+def create_digest(algorithm: str):
+    if algorithm.startswith("xxh"):
+        if xxhash is None:
+            raise ValueError(f"{algorithm} requires the xxhash package")
+        return getattr(xxhash, algorithm)()
+
+    return hashlib.new(algorithm)
+
+
+def _expected_size(response) -> int:
+    # with a content encoding the length describes the compressed body
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        return None
+
+    return response.content_length
+
+
+def _preallocate(file, size: int) -> None:
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(file.fileno(), 0, size)
+            return
+        except OSError:
+            pass
+
+    file.truncate(size)
+
+
+async def _write_mapped(response, file, size: int, digest) -> int:
+    _preallocate(file, size)
+    with mmap.mmap(file.fileno(), size) as mapped:
+        view = memoryview(mapped)
+        position = 0
+        try:
+            async for chunk in response.content.iter_any():
+                end = position + len(chunk)
+                if end > size:
+                    raise IncompleteDownloadError(f"more than {size} bytes received")
+
+                view[position:end] = chunk
+                digest.update(chunk)
+                position = end
+        finally:
+            view.release()
+
+    return position
+
+
+async def _write_streamed(response, file, digest) -> int:
+    position = 0
+    async for chunk in response.content.iter_any():
+        file.write(chunk)
+        digest.update(chunk)
+        position += len(chunk)
+
+    return position
+
+
+async def write_response_to_file(
+    response, path: str, algorithm: str = "sha256"
+) -> DownloadResult:
+    # Every received chunk lands directly in the memory mapped target file and
+    # is hashed while it is still in the CPU cache. The body is never joined
+    # into a single bytes object. The file is written under a temporary name
+    # and only moved to path when it is complete, a failed download never
+    # leaves a preallocated file which looks finished.
+    digest = create_digest(algorithm)
+    expected_size = _expected_size(response)
+
+    temporary_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(temporary_path, "xb+") as file:
+            if expected_size is None:
+                size = await _write_streamed(response, file, digest)
+            elif expected_size == 0:
+                size = 0
+            else:
+                size = await _write_mapped(response, file, expected_size, digest)
+                if size != expected_size:
+                    raise IncompleteDownloadError(f"{size} of {expected_size} bytes")
+
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+        raise
+
+    return DownloadResult(path, size, algorithm, digest.hexdigest())
@@ -0,0 +1,336 @@
+import asyncio
+import os
+import re
+import sqlite3
+import time
+from enum import Enum
+from typing import Callable, List, NamedTuple
+
+from .errors import RequestError
+from .hearthis import HearThis
+from .models import SingleTrack
+from .ratelimit import TokenBucket
+
+
+# characters which may appear in a file name taken from the api
+_UNSAFE_FILENAME_CHARACTERS = re.compile(r"[^A-Za-z0-9._ ()\[\]-]")
+
+
+def safe_filename(name: str, fallback: str) -> str:
+    # the last path component with unsafe characters replaced, a name like
+    # "../x" can not escape the download directory
+    name = os.path.basename((name or "").replace("\\", "/"))
+    name = _UNSAFE_FILENAME_CHARACTERS.sub("_", name).lstrip(". ")
+    return name or fallback
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class DownloadJob(NamedTuple):
+    track_id: str
+    url: str
+    path: str
+    priority: int
+    status: JobStatus
+    attempts: int
+    bytes_done: int
+    total_bytes: int
+    error: str
+
+
+class DownloadMetrics(NamedTuple):
+    queued: int
+    running: int
+    done: int
+    failed: int
+    bytes_downloaded: int
+    bytes_per_second: float
+
+
+class DownloadQueue:
+    # SQLite backed job queue. Jobs are keyed by track id, so enqueueing the
+    # same track twice keeps the first job. Jobs which were running when the
+    # process died are queued again on open. A queued job is not claimed
+    # before its retry_at time.
+
+    def __init__(self, path: str) -> None:
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                track_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                path TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                bytes_done INTEGER NOT NULL DEFAULT 0,
+                total_bytes INTEGER,
+                error TEXT,
+                created_at REAL NOT NULL,
+                retry_at REAL NOT NULL DEFAULT 0
+            )"""
+        )
+        columns = [
+            row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")
+        ]
+        if "retry_at" not in columns:
+            self._connection.execute(
+                "ALTER TABLE jobs ADD COLUMN retry_at REAL NOT NULL DEFAULT 0"
+            )
+        self._connection.execute(
+            "UPDATE jobs SET status = ? WHERE status = ?",
+            (JobStatus.QUEUED.value, JobStatus.RUNNING.value),
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def _to_job(row) -> DownloadJob:
+        return DownloadJob(*row[:4], JobStatus(row[4]), *row[5:])
+
+    def add(self, track_id, url: str, path: str, priority: int = 0) -> bool:
+        cursor = self._connection.execute(
+            """INSERT OR IGNORE INTO jobs
+               (track_id, url, path, priority, status, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (str(track_id), url, path, priority, JobStatus.QUEUED.value, time.time()),
+        )
+        self._connection.commit()
+        return cursor.rowcount == 1
+
+    def claim(self) -> DownloadJob:
+        row = self._connection.execute(
+            """SELECT track_id, url, path, priority, status, attempts, bytes_done,
+                      total_bytes, error
+               FROM jobs WHERE status = ? AND retry_at <= ?
+               ORDER BY priority DESC, created_at LIMIT 1""",
+            (JobStatus.QUEUED.value, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+
+        self._connection.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1 WHERE track_id = ?",
+            (JobStatus.RUNNING.value, row[0]),
+        )
+        self._connection.commit()
+        return self._to_job(row)._replace(status=JobStatus.RUNNING, attempts=row[5] + 1)
+
+    def update_progress(self, track_id: str, bytes_done: int, total_bytes: int):
+        self._connection.execute(
+            "UPDATE jobs SET bytes_done = ?, total_bytes = ? WHERE track_id = ?",
+            (bytes_done, total_bytes, track_id),
+        )
+        self._connection.commit()
+
+    def finish(
+        self,
+        track_id: str,
+        status: JobStatus,
+        error: str = None,
+        retry_at: float = 0.0,
+    ) -> None:
+        self._connection.execute(
+            "UPDATE jobs SET status = ?, error = ?, retry_at = ? WHERE track_id = ?",
+            (status.value, error, retry_at, track_id),
+        )
+        self._connection.commit()
+
+    def next_retry_at(self) -> float:
+        # the earliest retry time of the queued jobs, None without queued jobs
+        row = self._connection.execute(
+            "SELECT MIN(retry_at) FROM jobs WHERE status = ?",
+            (JobStatus.QUEUED.value,),
+        ).fetchone()
+        return row[0]
+
+    def get(self, track_id) -> DownloadJob:
+        row = self._connection.execute(
+            """SELECT track_id, url, path, priority, status, attempts, bytes_done,
+                      total_bytes, error
+               FROM jobs WHERE track_id = ?""",
+            (str(track_id),),
+        ).fetchone()
+        return None if row is None else self._to_job(row)
+
+    def all(self) -> List[DownloadJob]:
+        rows = self._connection.execute(
+            """SELECT track_id, url, path, priority, status, attempts, bytes_done,
+                      total_bytes, error
+               FROM jobs ORDER BY priority DESC, created_at"""
+        ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def counts(self) -> dict:
+        rows = self._connection.execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ).fetchall()
+        return {JobStatus(status): count for (status, count) in rows}
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class DownloadManager:
+    def __init__(
+        self,
+        hearthis: HearThis,
+        queue_path: str,
+        directory: str,
+        concurrency: int = 4,
+        bytes_per_second: float = None,
+        max_attempts: int = 3,
+        chunk_size: int = 64 * 1024,
+        on_progress: Callable[[DownloadJob, int], None] = None,
+        retry_backoff: float = 1.0,
+        max_retry_backoff: float = 300.0,
+    ) -> None:
+        self._hearthis = hearthis
+        self._queue = DownloadQueue(queue_path)
+        self._directory = directory
+        self._concurrency = concurrency
+        self._bandwidth = None
+        if bytes_per_second is not None:
+            self._bandwidth = TokenBucket(bytes_per_second, bytes_per_second)
+        self._max_attempts = max_attempts
+        self._chunk_size = chunk_size
+        self._on_progress = on_progress
+        self._retry_backoff = retry_backoff
+        self._max_retry_backoff = max_retry_backoff
+        self._bytes_downloaded = 0
+        self._started_at = None
+        self._stopping = False
+
+    @property
+    def queue(self) -> DownloadQueue:
+        return self._queue
+
+    def enqueue(
+        self,
+        track: SingleTrack,
+        priority: int = 0,
+        path: str = None,
+        use_stream_url: bool = False,
+    ) -> bool:
+        url = track.stream_url if use_stream_url else track.download_url
+        if path is None:
+            filename = safe_filename(track.download_filename, f"{track.id}.mp3")
+            path = os.path.join(self._directory, filename)
+
+        return self._queue.add(track.id, url, path, priority)
+
+    def metrics(self) -> DownloadMetrics:
+        counts = self._queue.counts()
+        elapsed = 0 if self._started_at is None else time.monotonic() - self._started_at
+        throughput = self._bytes_downloaded / elapsed if elapsed > 0 else 0.0
+        return DownloadMetrics(
+            counts.get(JobStatus.QUEUED, 0),
+            counts.get(JobStatus.RUNNING, 0),
+            counts.get(JobStatus.DONE, 0),
+            counts.get(JobStatus.FAILED, 0),
+            self._bytes_downloaded,
+            throughput,
+        )
+
+    async def _download(self, job: DownloadJob) -> None:
+        partial_path = f"{job.path}.part"
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+
+        async with self._hearthis.open_download(job.url, offset) as response:
+            if response.status == 416 and self._is_complete(response, offset):
+                # the partial file was complete when the process died
+                self._queue.update_progress(job.track_id, offset, offset)
+                os.replace(partial_path, job.path)
+                return
+
+            if response.status == 200:
+                offset = 0
+            elif response.status != 206:
+                raise RequestError(response.status)
+
+            total = None
+            if response.content_length is not None:
+                total = offset + response.content_length
+
+            bytes_done = offset
+            unsaved = 0
+            with open(partial_path, "ab" if offset > 0 else "wb") as file:
+                async for chunk in response.content.iter_chunked(self._chunk_size):
+                    if self._bandwidth is not None:
+                        await self._bandwidth.acquire(len(chunk))
+                    file.write(chunk)
+                    bytes_done += len(chunk)
+                    unsaved += len(chunk)
+                    self._bytes_downloaded += len(chunk)
+                    if self._on_progress is not None:
+                        self._on_progress(job, bytes_done)
+                    if unsaved >= 16 * self._chunk_size:
+                        self._queue.update_progress(job.track_id, bytes_done, total)
+                        unsaved = 0
+
+        self._queue.update_progress(job.track_id, bytes_done, total)
+        os.replace(partial_path, job.path)
+
+    @staticmethod
+    def _is_complete(response, offset: int) -> bool:
+        # "Content-Range: bytes */size" of a range beyond the end of the file
+        content_range = response.headers.get("Content-Range", "")
+        if offset == 0 or not content_range.startswith("bytes */"):
+            return False
+
+        return content_range[len("bytes */") :].strip() == str(offset)
+
+    def _retry_at(self, attempts: int) -> float:
+        delay = self._retry_backoff * 2 ** (attempts - 1)
+        return time.time() + min(delay, self._max_retry_backoff)
+
+    async def _worker(self, until_empty: bool) -> None:
+        while not self._stopping:
+            job = self._queue.claim()
+            if job is None:
+                retry_at = self._queue.next_retry_at()
+                if until_empty and retry_at is None:
+                    return
+                delay = 1.0 if retry_at is None else retry_at - time.time()
+                await asyncio.sleep(min(max(delay, 0.0), 1.0))
+                continue
+
+            try:
+                await self._download(job)
+            except asyncio.CancelledError:
+                self._queue.finish(job.track_id, JobStatus.QUEUED)
+                raise
+            except Exception as error:
+                if job.attempts >= self._max_attempts:
+                    self._queue.finish(job.track_id, JobStatus.FAILED, repr(error))
+                else:
+                    self._queue.finish(
+                        job.track_id,
+                        JobStatus.QUEUED,
+                        repr(error),
+                        self._retry_at(job.attempts),
+                    )
+            else:
+                self._queue.finish(job.track_id, JobStatus.DONE)
+
+    async def run(self, until_empty: bool = True) -> DownloadMetrics:
+        os.makedirs(self._directory, exist_ok=True)
+        self._stopping = False
+        self._started_at = time.monotonic()
+        workers = [self._worker(until_empty) for _ in range(self._concurrency)]
+        await asyncio.gather(*workers)
+        return self.metrics()
+
+    def stop(self) -> None:
+        # workers finish their current download and exit
+        self._stopping = True
+
+    def close(self) -> None:
+        self._queue.close()
+
+    def jobs(self) -> List[DownloadJob]:
+        return self._queue.all()
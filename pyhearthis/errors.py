@@ -0,0 +1,27 @@
+import asyncio
+
+
+class RequestError(Exception):
+    @property
+    def status(self) -> int:
+        # the http status of the response, if the error was raised for one
+        if len(self.args) > 0 and isinstance(self.args[0], int):
+            return self.args[0]
+
+        return None
+
+
+class DeletePlaylistError(Exception):
+    pass
+
+
+class DeadlineExceededError(RequestError, asyncio.TimeoutError):
+    pass
+
+
+class CircuitOpenError(RequestError):
+    pass
+
+
+class AuthenticationError(RequestError):
+    pass
@@ -0,0 +1,151 @@
+import asyncio
+import base64
+import json
+from typing import AsyncIterator, Dict, Iterable, List, NamedTuple, Union
+
+from .hearthis import HearThis, SearchType
+from .models import LoggedinUser, Playlist, SingleTrack, User
+
+
+class SearchHit(NamedTuple):
+    kind: SearchType
+    rank: int
+    item: Union[SingleTrack, User, Playlist]
+
+
+class FederatedPage(NamedTuple):
+    hits: List[SearchHit]
+    cursor: str
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+class FederatedSearch:
+    # Runs track, user and playlist searches (several pages each) at the same
+    # time and merges them into one ranked result. Hits are ranked by their
+    # position within their own search and interleaved in the order of
+    # `types` for equal positions, so the merged order is stable.
+
+    def __init__(
+        self,
+        hearthis: HearThis,
+        user: LoggedinUser,
+        types: Iterable[SearchType] = (
+            SearchType.TRACKS,
+            SearchType.USER,
+            SearchType.PLAYLISTS,
+        ),
+        pages: int = 2,
+        count: int = 20,
+        concurrency: int = 6,
+    ) -> None:
+        self._hearthis = hearthis
+        self._user = user
+        self._types = list(types)
+        self._pages = pages
+        self._count = count
+        self._concurrency = concurrency
+
+    @staticmethod
+    def _encode_cursor(query: str, next_pages: Dict[SearchType, int]) -> str:
+        if all(page is None for page in next_pages.values()):
+            return None
+
+        state = {"q": query, "p": {t.name: p for (t, p) in next_pages.items()}}
+        return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+    def _decode_cursor(self, query: str, cursor: str) -> Dict[SearchType, int]:
+        if cursor is None:
+            return {search_type: 1 for search_type in self._types}
+
+        # a malformed or tampered cursor must not leak its decoding errors
+        try:
+            state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            cursor_query = state["q"]
+            next_pages = {SearchType[name]: p for (name, p) in state["p"].items()}
+        except (ValueError, KeyError, AttributeError, TypeError) as error:
+            raise InvalidCursorError(f"malformed search cursor {cursor!r}") from error
+
+        if any(p is not None and type(p) is not int for p in next_pages.values()):
+            raise InvalidCursorError(f"malformed search cursor {cursor!r}")
+        if cursor_query != query:
+            raise InvalidCursorError(f"search cursor {cursor!r} is not for {query!r}")
+
+        return next_pages
+
+    async def _search(self, search_type: SearchType, query: str, page: int):
+        if search_type is SearchType.USER:
+            return await self._hearthis.search_users(
+                self._user, query, page, self._count
+            )
+        if search_type is SearchType.PLAYLISTS:
+            return await self._hearthis.search_playlists(
+                self._user, query, page, self._count
+            )
+
+        return await self._hearthis.search(
+            self._user, query, SearchType.TRACKS, page=page, count=self._count
+        )
+
+    def _start(self, query: str, first_pages: Dict[SearchType, int]):
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def run(search_type: SearchType, page: int):
+            async with semaphore:
+                items = await self._search(search_type, query, page)
+            return search_type, page, items
+
+        return [
+            asyncio.ensure_future(run(search_type, page))
+            for (search_type, first_page) in first_pages.items()
+            if first_page is not None
+            for page in range(first_page, first_page + self._pages)
+        ]
+
+    def _hits(self, search_type: SearchType, page: int, items: list):
+        offset = (page - 1) * self._count
+        return [
+            SearchHit(search_type, offset + position, item)
+            for (position, item) in enumerate(items)
+        ]
+
+    async def stream(self, query: str, cursor: str = None) -> AsyncIterator[SearchHit]:
+        # yields the hits of every backend query as soon as it has finished
+        tasks = self._start(query, self._decode_cursor(query, cursor))
+        seen = set()
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                search_type, page, items = await next_done
+                for hit in self._hits(search_type, page, items):
+                    if (hit.kind, hit.item.id) not in seen:
+                        seen.add((hit.kind, hit.item.id))
+                        yield hit
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def search(self, query: str, cursor: str = None) -> FederatedPage:
+        first_pages = self._decode_cursor(query, cursor)
+        results = await asyncio.gather(*self._start(query, first_pages))
+
+        hits = []
+        next_pages = {search_type: None for search_type in first_pages}
+        for search_type, page, items in results:
+            hits.extend(self._hits(search_type, page, items))
+            last_page = first_pages[search_type] + self._pages - 1
+            if page == last_page and len(items) == self._count:
+                next_pages[search_type] = page + 1
+
+        order = {search_type: index for (index, search_type) in enumerate(self._types)}
+        hits.sort(key=lambda hit: (hit.rank, order.get(hit.kind, len(order))))
+
+        seen = set()
+        merged = []
+        for hit in hits:
+            if (hit.kind, hit.item.id) not in seen:
+                seen.add((hit.kind, hit.item.id))
+                merged.append(hit)
+
+        return FederatedPage(merged, self._encode_cursor(query, next_pages))
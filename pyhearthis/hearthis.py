@@ -1,10 +1,14 @@
-import aiohttp
+import asyncio
 import json
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from enum import Enum
-from typing import List
+from typing import TYPE_CHECKING, Iterable, List, Set, Union
 from datetime import date, timedelta
 
-from aiohttp.client_exceptions import InvalidURL
+from .profiling import mark_route
+from .resilience import mark_response
 from .models import (
     SingleArtist,
     SingleTrack,
@@ -12,9 +16,29 @@ from .models import (
     as_query_param,
     cast_dict,
     cast_list,
+    create_model,
     LoggedinUser,
     Category,
     Playlist,
+    PlaylistSyncResult,
+    FollowOutcome,
+    FollowResult,
+)
+from .deadline import LatencyTracker, budgeted, remaining_budget, within
+from .decoding import (
+    decode_playlists,
+    decode_tracks,
+    decode_waveform,
+    filter_json_response,
+    json_to_playlist,
+    json_to_track,
+)
+from .errors import (
+    AuthenticationError,
+    CircuitOpenError,
+    DeadlineExceededError,
+    DeletePlaylistError,
+    RequestError,
 )
 from .hearthis_requests import (
     AddToExistingPlaylistRequest,
@@ -33,6 +57,31 @@ from .hearthis_requests import (
     ArtistTracksRequest,
 )
 
+# aiohttp and the optional subsystems are imported on first use, importing
+# the client stays cheap for short lived processes
+if TYPE_CHECKING:  # pragma: no cover
+    import aiohttp
+    from .download import DownloadResult
+    from .interning import InternRegistry
+    from .profiling import AllocationProfiler
+    from .resilience import CircuitBreakers, ResponseCache
+    from .scheduler import RequestScheduler
+
+
+# Set while a read-modify-write call reads remote state, e.g. sync_playlist.
+# Such reads bypass the response cache, a cached answer would be outdated
+# by the edits of the same call.
+_fresh_reads: ContextVar[bool] = ContextVar("pyhearthis_fresh_reads", default=False)
+
+
+@contextmanager
+def fresh_reads():
+    token = _fresh_reads.set(True)
+    try:
+        yield
+    finally:
+        _fresh_reads.reset(token)
+
 
 class FeedType(Enum):
     UNDEFINED = 1
@@ -42,24 +91,16 @@ class FeedType(Enum):
 
 class SearchType(Enum):
     TRACKS = 1
-    USER = (2,)
+    USER = 2
     PLAYLISTS = 3
 
 
 class ArtistTracklistType(Enum):
     LIKES = 1
-    PLAYLISTS = (2,)
+    PLAYLISTS = 2
     TRACKS = 3
 
 
-class RequestError(Exception):
-    pass
-
-
-class DeletePlaylistError(Exception):
-    pass
-
-
 class HearThis:
     api_endpoint = "https://api-v2.hearthis.at/"
 
@@ -103,91 +144,385 @@ class HearThis:
 
         return ""
 
-    async def _get_as_bytes(self, url):
-        try:
-            async with self._client_session.get(url) as response:
-                if response.status == 200:
-                    return await response.read()
-                return None
-        except InvalidURL:
-            return None
+    @staticmethod
+    def _route_family(url: str) -> str:
+        if not url.startswith(HearThis.api_endpoint):
+            return "media"
+
+        path = url[len(HearThis.api_endpoint) :].split("?", 1)[0]
+        first_segment = path.split("/", 1)[0]
+        if first_segment in ("feed", "search", "categories", "set"):
+            return first_segment
+        if first_segment in ("login", "logout"):
+            return "auth"
+        if first_segment.endswith(".php"):
+            return "edit"
+        if path.endswith("/"):
+            return "artist_tracks"
+
+        return "artist"
 
-    async def _get_as_json(self, route, request=None):
-        query = f"{HearThis.api_endpoint}{route}"
+    @staticmethod
+    def _build_query(route, request=None, with_endpoint: bool = True) -> str:
+        endpoint = HearThis.api_endpoint if with_endpoint else ""
+        query = f"{endpoint}{route}"
 
         if request is not None:
             param = as_query_param(request)
             query = query + f"?{param}"
 
-        async with self._client_session.get(query) as response:
-            json_data = await response.json()
+        return query
 
-            if json_data is None:
-                return dict()
+    @asynccontextmanager
+    async def _slot(self, route_family: str):
+        if self._scheduler is None:
+            yield
+            return
 
-            if "success" in json_data:
-                if json_data["success"] is False:
-                    return dict()
+        async with self._scheduler.slot(route_family):
+            yield
 
-            if isinstance(json_data, list):
-                return list(filter(lambda itm: not isinstance(itm, bool), json_data))
+    @staticmethod
+    def _request_options() -> dict:
+        budget = remaining_budget()
+        if budget is None:
+            return dict()
 
-            return json_data
+        if budget <= 0:
+            raise DeadlineExceededError()
 
-    async def _get_as_text(self, route, request=None, with_endpoint: bool = True):
-        endpoint = HearThis.api_endpoint if with_endpoint else ""
-        query = f"{endpoint}{route}"
+        from aiohttp import ClientTimeout
 
-        if request is not None:
-            param = as_query_param(request)
-            query = query + f"?{param}"
+        return dict(timeout=ClientTimeout(total=budget))
 
-        async with self._client_session.get(query) as response:
-            if response.status != 200:
-                return ""
+    @staticmethod
+    def _raise_for_authentication(response) -> None:
+        if response.status in (401, 403):
+            raise AuthenticationError(response.status)
+
+    @staticmethod
+    async def _read_json(response):
+        HearThis._raise_for_authentication(response)
+        HearThis._raise_for_status(response)
+        json_data = await response.json()
+        return filter_json_response(json_data)
+
+    @staticmethod
+    def _raise_for_status(response) -> None:
+        if response.status != 200:
+            raise RequestError(response.status)
+
+    @staticmethod
+    def _is_answer(error: Exception) -> bool:
+        # The api did answer, e.g. with a missing resource or rejected
+        # credentials. This says nothing about its health.
+        if not isinstance(error, RequestError) or error.status is None:
+            return False
+
+        return error.status < 500 and error.status != 429
 
-            return await response.text()
+    @staticmethod
+    async def _read_raw(response):
+        HearThis._raise_for_authentication(response)
+        HearThis._raise_for_status(response)
+        return await response.read()
+
+    @staticmethod
+    async def _read_text(response):
+        HearThis._raise_for_authentication(response)
+        HearThis._raise_for_status(response)
+        return await response.text()
+
+    @staticmethod
+    async def _read_bytes(response):
+        HearThis._raise_for_authentication(response)
+        HearThis._raise_for_status(response)
+        return await response.read()
+
+    async def _get_once(self, route_family: str, query: str, read):
+        loop = asyncio.get_running_loop()
+        started = None
+        try:
+            async with self._slot(route_family):
+                started = loop.time()
+                options = HearThis._request_options()
+                async with self._client_session.get(query, **options) as response:
+                    result = await read(response)
+        except asyncio.CancelledError:
+            # A cancelled request, e.g. the loser of a hedge, took at least
+            # this long. Leaving it out would compute the p95 of the winners
+            # only and the hedge threshold would keep shrinking.
+            if started is not None:
+                self._latencies.record(route_family, loop.time() - started)
+            raise
+
+        self._latencies.record(route_family, loop.time() - started)
+        return result
+
+    async def _get_hedged(self, route_family: str, query: str, read):
+        # Sends a duplicate request when the first one is slower than the
+        # observed p95 of its route family and returns the first success.
+        delay = self._latencies.percentile(route_family, 0.95)
+        if delay is None:
+            return await self._get_once(route_family, query, read)
+
+        first = asyncio.ensure_future(self._get_once(route_family, query, read))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if first in done:
+                return first.result()
+
+            second = asyncio.ensure_future(self._get_once(route_family, query, read))
+            pending = {first, second}
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+
+            return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _get_uncached(self, route_family: str, query: str, read, hedge: bool):
+        if self._hedging and hedge:
+            return await self._get_hedged(route_family, query, read)
+
+        return await self._get_once(route_family, query, read)
+
+    async def _get_guarded(self, route_family: str, query: str, read, hedge: bool):
+        breaker = None
+        if self._circuit_breakers is not None:
+            breaker = self._circuit_breakers.for_family(route_family)
+
+        if breaker is None:
+            return await self._get_uncached(route_family, query, read, hedge)
+
+        if not breaker.allow_request():
+            raise CircuitOpenError(route_family)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            result = await self._get_uncached(route_family, query, read, hedge)
+        except Exception as error:
+            if HearThis._is_answer(error):
+                breaker.record_success(loop.time() - started)
+            else:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            # cancelled, e.g. by a deadline or as the loser of a hedge
+            breaker.release()
+            raise
+
+        breaker.record_success(loop.time() - started)
+        return result
+
+    async def _refresh(self, cache_key, route_family: str, query: str, read):
+        try:
+            result = await self._get_guarded(route_family, query, read, False)
+            self._response_cache.put(cache_key, result)
+        except Exception:
+            pass
+        finally:
+            self._refreshes.pop(cache_key, None)
+
+    async def _get(self, query: str, read, hedge: bool = True):
+        route_family = HearThis._route_family(query)
+        mark_route(route_family)
+        cacheable = self._response_cache is not None and route_family not in (
+            "media",
+            "auth",
+            "edit",
+        )
+        if not cacheable:
+            return await self._get_guarded(route_family, query, read, hedge)
+
+        cache_key = (read.__name__, query)
+        if _fresh_reads.get():
+            result = await self._get_guarded(route_family, query, read, hedge)
+            self._response_cache.put(cache_key, result)
+            return result
+
+        cached = self._response_cache.get(cache_key)
+        if cached is not None and cached.fresh:
+            mark_response(from_cache=True)
+            return cached.value
+
+        if cached is not None and self._response_cache.stale_while_revalidate:
+            if cache_key not in self._refreshes:
+                self._refreshes[cache_key] = asyncio.ensure_future(
+                    self._refresh(cache_key, route_family, query, read)
+                )
+            mark_response(from_cache=True, stale=True)
+            return cached.value
+
+        try:
+            result = await self._get_guarded(route_family, query, read, hedge)
+        except Exception as error:
+            # an open circuit or a failing API is answered with stale data
+            if cached is None or HearThis._is_answer(error):
+                raise
+
+            mark_response(from_cache=True, stale=True)
+            return cached.value
+
+        self._response_cache.put(cache_key, result)
+        return result
+
+    def _invalidate(self, *routes: str) -> None:
+        # drops the cached reads of the given routes after an edit
+        if self._response_cache is None:
+            return
+
+        def matches(cache_key) -> bool:
+            query = cache_key[1]
+            if not query.startswith(HearThis.api_endpoint):
+                return False
+            path = query[len(HearThis.api_endpoint) :].split("?", 1)[0]
+            return path in routes
+
+        self._response_cache.invalidate(matches)
+
+    async def _get_or_default(self, query: str, read, default, hedge: bool = True):
+        # answers other than 200, e.g. a missing resource, read as empty
+        try:
+            return await self._get(query, read, hedge)
+        except AuthenticationError:
+            raise
+        except RequestError as error:
+            if not HearThis._is_answer(error):
+                raise
+
+            return default
+
+    async def _get_as_bytes(self, url):
+        from aiohttp.client_exceptions import InvalidURL
+
+        try:
+            return await self._get_or_default(
+                url, HearThis._read_bytes, None, hedge=False
+            )
+        except InvalidURL:
+            return None
+
+    async def _get_as_json(self, route, request=None):
+        query = HearThis._build_query(route, request)
+        # an answer like a missing resource reads as {"success": false} did
+        return await self._get_or_default(query, HearThis._read_json, dict())
+
+    async def _get_raw(self, route, request=None) -> bytes:
+        query = HearThis._build_query(route, request)
+        return await self._get_or_default(query, HearThis._read_raw, b"")
+
+    async def _decode(self, decoder, raw):
+        if self._executor is None:
+            return decoder(raw)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, decoder, raw)
+
+    async def _get_tracks(self, route, request=None) -> List[SingleTrack]:
+        if self._executor is None:
+            json_data = await self._get_as_json(route, request)
+            return list(map(self._json_to_track, cast_list(json_data)))
+
+        raw = await self._get_raw(route, request)
+        return await self._decode_tracks(raw)
+
+    async def _get_as_text(self, route, request=None, with_endpoint: bool = True):
+        query = HearThis._build_query(route, request, with_endpoint)
+        return await self._get_or_default(query, HearThis._read_text, "")
 
     async def _post_json(self, route, request, expected_status_code: int = 201):
         url = f"{HearThis.api_endpoint}{route}"
         data = json.dumps(cast_dict(request._asdict()))
+        route_family = HearThis._route_family(url)
+        mark_route(route_family)
 
-        async with self._client_session.post(url, json=data) as response:
-            if response.status != expected_status_code:
-                raise RequestError()
+        async with self._slot(route_family):
+            options = HearThis._request_options()
+            async with self._client_session.post(url, json=data, **options) as response:
+                HearThis._raise_for_authentication(response)
+                if response.status != expected_status_code:
+                    raise RequestError(response.status)
 
-            if response.content_type == "text/html":
-                return await response.text()
+                if response.content_type == "text/html":
+                    return await response.text()
 
-            return await response.json()
+                return await response.json()
 
     async def _post_as_form_data(
         self, route, request, expected_status_code: int = 201, force_json: bool = False
     ):
         url = f"{HearThis.api_endpoint}{route}"
         payload = cast_dict(request._asdict(), True)
+        route_family = HearThis._route_family(url)
+        mark_route(route_family)
 
-        async with self._client_session.post(url, data=payload) as response:
-            if response.status != expected_status_code:
-                raise RequestError()
+        async with self._slot(route_family):
+            options = HearThis._request_options()
+            async with self._client_session.post(
+                url, data=payload, **options
+            ) as response:
+                HearThis._raise_for_authentication(response)
+                if response.status != expected_status_code:
+                    raise RequestError(response.status)
 
-            if response.content_type == "text/html" and not force_json:
-                return await response.text()
+                if response.content_type == "text/html" and not force_json:
+                    return await response.text()
 
-            return await response.json()
+                return await response.json()
 
-    @staticmethod
-    def _json_to_track(json_dict: dict) -> SingleTrack:
-        user_dict = json_dict.pop("user")
-        return SingleTrack(**json_dict, user=User(**user_dict))
+    def _json_to_track(self, json_dict: dict) -> SingleTrack:
+        if self._interning is None:
+            return json_to_track(json_dict)
 
-    @staticmethod
-    def _json_to_playlist(json_dict: dict) -> Playlist:
-        user_dict = json_dict.pop("user")
-        return Playlist(**json_dict, user=User(**user_dict))
+        return self._interning.track(json_dict)
 
-    def __init__(self, client_session: aiohttp.ClientSession) -> None:
+    def _json_to_playlist(self, json_dict: dict) -> Playlist:
+        if self._interning is None:
+            return json_to_playlist(json_dict)
+
+        return self._interning.playlist(json_dict)
+
+    async def _decode_tracks(self, raw) -> List[SingleTrack]:
+        tracks = await self._decode(decode_tracks, raw)
+        if self._interning is None:
+            return tracks
+
+        return self._interning.canonicalize_all(tracks)
+
+    def __init__(
+        self,
+        client_session: "aiohttp.ClientSession",
+        executor: Executor = None,
+        hedging: bool = False,
+        circuit_breakers: "CircuitBreakers" = None,
+        response_cache: "ResponseCache" = None,
+        interning: "InternRegistry" = None,
+        profiler: "AllocationProfiler" = None,
+        scheduler: "RequestScheduler" = None,
+    ) -> None:
         self._client_session = client_session
+        self._executor = executor
+        self._hedging = hedging
+        self._latencies = LatencyTracker()
+        self._circuit_breakers = circuit_breakers
+        self._response_cache = response_cache
+        self._refreshes = dict()
+        self._interning = interning
+        self._scheduler = scheduler
+        if profiler is not None:
+            profiler.wrap(self)
+
+    async def with_deadline(self, budget: float, awaitable):
+        return await within(budget, awaitable)
 
     async def login(self, email: str, password: str) -> LoggedinUser:
         json_data = await self._get_as_json("login", LoginRequest(email, password))
@@ -203,13 +538,21 @@ class HearThis:
             status = await response.status
             return status == 200
 
+    @budgeted
     async def get_categories(self) -> List[Category]:
         json_data = await self._get_as_json("categories/")
         return list(map(lambda data: Category(**data), json_data))
 
+    @budgeted
     async def get_waveform_data(self, track: SingleTrack) -> str:
         return await self._get_as_text(track.waveform_data, with_endpoint=False)
 
+    @budgeted
+    async def get_waveform_samples(self, track: SingleTrack) -> List[int]:
+        text = await self.get_waveform_data(track)
+        return await self._decode(decode_waveform, text)
+
+    @budgeted
     async def get_feeds(
         self,
         user: LoggedinUser,
@@ -241,20 +584,20 @@ class HearThis:
             count,
         )
 
-        json_data = await self._get_as_json("feed/", request)
-        return list(map(HearThis._json_to_track, cast_list(json_data)))
+        return await self._get_tracks("feed/", request)
 
+    @budgeted
     async def get_category_tracks(
         self, user: LoggedinUser, category: Category, page: int = 1, count: int = 5
     ) -> List[SingleTrack]:
         assert count <= 20, "maximum allowed pagecount is 20"
 
         route = f"categories/{category.id}"
-        json_data = await self._get_as_json(
+        return await self._get_tracks(
             route, PagedRequest(user.key, user.secret, page, count)
         )
-        return list(map(HearThis._json_to_track, cast_list(json_data)))
 
+    @budgeted
     async def get_artist_tracks(
         self,
         user: LoggedinUser,
@@ -266,7 +609,7 @@ class HearThis:
         assert count <= 20, "maximum allowed pagecount is 20"
 
         route = f"{user_permalink}/"
-        json_data = await self._get_as_json(
+        return await self._get_tracks(
             route,
             ArtistTracksRequest(
                 user.key,
@@ -276,39 +619,50 @@ class HearThis:
                 count,
             ),
         )
-        return list(map(HearThis._json_to_track, cast_list(json_data)))
 
+    @budgeted
     async def get_playlists(
         self, user: LoggedinUser, page: int = 1, count: int = 5
     ) -> List[Playlist]:
         assert count <= 20, "maximum allowed pagecount is 20"
 
         route = f"{user.permalink}"
-        json_data = await self._get_as_json(
-            route, PlaylistsRequest(user.key, user.secret, page, count)
-        )
-        return list(map(HearThis._json_to_playlist, cast_list(json_data)))
+        request = PlaylistsRequest(user.key, user.secret, page, count)
+        if self._executor is None:
+            json_data = await self._get_as_json(route, request)
+            return list(map(self._json_to_playlist, cast_list(json_data)))
+
+        raw = await self._get_raw(route, request)
+        return await self._decode(decode_playlists, raw)
 
     async def create_playlist(
         self, user: LoggedinUser, playlist_name: str, private_set: bool = True
     ) -> None:
         route = "set_ajax_add.php"
         privat = 1 if private_set else 0
-        await self._post_as_form_data(
-            route,
-            AddPlaylistRequest(user.key, user.secret, playlist_name, privat=privat),
-            200,
-        )
+        try:
+            await self._post_as_form_data(
+                route,
+                AddPlaylistRequest(user.key, user.secret, playlist_name, privat=privat),
+                200,
+            )
+        finally:
+            self._invalidate(user.permalink)
 
     async def add_track_to_playlist(
         self, user: LoggedinUser, track: SingleTrack, playlist: Playlist
     ) -> Playlist:
         route = "set_ajax_add.php"
-        json_str = await self._post_as_form_data(
-            route,
-            AddToExistingPlaylistRequest(user.key, user.secret, track.id, playlist.id),
-            200,
-        )
+        try:
+            json_str = await self._post_as_form_data(
+                route,
+                AddToExistingPlaylistRequest(
+                    user.key, user.secret, track.id, playlist.id
+                ),
+                200,
+            )
+        finally:
+            self._invalidate(user.permalink, f"set/{playlist.permalink}/")
         obj = json.loads(json_str)
         return Playlist(**cast_dict(obj))
 
@@ -316,14 +670,18 @@ class HearThis:
         self, user: LoggedinUser, track: SingleTrack, playlist_name: str
     ):
         route = "set_ajax_add.php"
-        json_str = await self._post_as_form_data(
-            route,
-            AddToNewPlaylistRequest(user.key, user.secret, track.id, playlist_name),
-            200,
-        )
+        try:
+            json_str = await self._post_as_form_data(
+                route,
+                AddToNewPlaylistRequest(user.key, user.secret, track.id, playlist_name),
+                200,
+            )
+        finally:
+            self._invalidate(user.permalink)
         obj = json.loads(json_str)
         return Playlist(**cast_dict(obj))
 
+    @budgeted
     async def get_playlist_tracks(
         self, user: LoggedinUser, playlist: Playlist
     ) -> List[SingleTrack]:
@@ -334,28 +692,107 @@ class HearThis:
         if json_data == "":
             return []
 
-        return list(map(HearThis._json_to_track, cast_list(json.loads(json_data))))
+        if self._executor is not None:
+            return await self._decode_tracks(json_data)
+
+        return list(map(self._json_to_track, cast_list(json.loads(json_data))))
 
     async def delete_track_from_playlist(
         self, user: LoggedinUser, track: SingleTrack, playlist: Playlist
     ) -> Playlist:
         route = "set_ajax_add.php"
-        json_str = await self._post_as_form_data(
-            route,
-            DeleteFromPlaylistRequest(user.key, user.secret, track.id, playlist.id),
-            200,
-        )
+        try:
+            json_str = await self._post_as_form_data(
+                route,
+                DeleteFromPlaylistRequest(user.key, user.secret, track.id, playlist.id),
+                200,
+            )
+        finally:
+            self._invalidate(user.permalink, f"set/{playlist.permalink}/")
         obj = json.loads(json_str)
         return Playlist(**cast_dict(obj))
 
     async def delete_playlist(self, user: LoggedinUser, playlist: Playlist) -> None:
         route = "set_ajax_edit.php"
-        response = await self._post_as_form_data(
-            route, DeletePlaylistRequest(user.key, user.secret, playlist.id), 200
-        )
+        try:
+            response = await self._post_as_form_data(
+                route, DeletePlaylistRequest(user.key, user.secret, playlist.id), 200
+            )
+        finally:
+            self._invalidate(user.permalink, f"set/{playlist.permalink}/")
         if response != "DELETED":
             raise DeletePlaylistError()
 
+    async def _find_playlist(self, user: LoggedinUser, title: str) -> Playlist:
+        page = 1
+        while True:
+            with fresh_reads():
+                playlists = await self.get_playlists(user, page, 20)
+            for playlist in playlists:
+                if playlist.title == title:
+                    return playlist
+
+            if len(playlists) < 20:
+                return None
+            page += 1
+
+    async def sync_playlist(
+        self,
+        user: LoggedinUser,
+        name_or_playlist: Union[str, Playlist],
+        desired_track_ids: Iterable[int],
+        private_set: bool = True,
+        concurrency: int = 4,
+    ) -> PlaylistSyncResult:
+        # Makes the playlist contain exactly the desired tracks with as few
+        # remote operations as possible. Running it again is a no-op. The
+        # current state is always read from the api, never from the cache.
+        created = False
+        playlist = name_or_playlist
+        if not isinstance(name_or_playlist, Playlist):
+            playlist = await self._find_playlist(user, name_or_playlist)
+            if playlist is None:
+                await self.create_playlist(user, name_or_playlist, private_set)
+                created = True
+                playlist = await self._find_playlist(user, name_or_playlist)
+                if playlist is None:
+                    raise RequestError(f"playlist {name_or_playlist} was not created")
+
+        current_ids = []
+        if not created:
+            with fresh_reads():
+                tracks = await self.get_playlist_tracks(user, playlist)
+            current_ids = list(dict.fromkeys(int(track.id) for track in tracks))
+
+        desired_ids = list(
+            dict.fromkeys(int(track_id) for track_id in desired_track_ids)
+        )
+        current_set = set(current_ids)
+        desired_set = set(desired_ids)
+        added = [track_id for track_id in desired_ids if track_id not in current_set]
+        removed = [track_id for track_id in current_ids if track_id not in desired_set]
+
+        route = "set_ajax_add.php"
+        requests = [
+            AddToExistingPlaylistRequest(user.key, user.secret, track_id, playlist.id)
+            for track_id in added
+        ] + [
+            DeleteFromPlaylistRequest(user.key, user.secret, track_id, playlist.id)
+            for track_id in removed
+        ]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def apply(request):
+            async with semaphore:
+                await self._post_as_form_data(route, request, 200)
+
+        try:
+            await asyncio.gather(*[apply(request) for request in requests])
+        finally:
+            self._invalidate(user.permalink, f"set/{playlist.permalink}/")
+        return PlaylistSyncResult(playlist, added, removed, created)
+
+    @budgeted
     async def search(
         self,
         user: LoggedinUser,
@@ -376,17 +813,57 @@ class HearThis:
         request = SearchRequest(
             user.key, user.secret, query, type, duration_in_minutes, page, count
         )
-        json_data = await self._get_as_json(route, request)
+        return await self._get_tracks(route, request)
+
+    @budgeted
+    async def search_users(
+        self, user: LoggedinUser, query: str, page: int = 1, count: int = 5
+    ) -> List[User]:
+        assert count <= 20, "maximum allowed pagecount is 20"
+
+        request = SearchRequest(
+            user.key,
+            user.secret,
+            query,
+            HearThis._search_type_as_string(SearchType.USER),
+            page=page,
+            count=count,
+        )
+        json_data = await self._get_as_json("search/", request)
+        return [create_model(User, data) for data in cast_list(json_data)]
+
+    @budgeted
+    async def search_playlists(
+        self, user: LoggedinUser, query: str, page: int = 1, count: int = 5
+    ) -> List[Playlist]:
+        assert count <= 20, "maximum allowed pagecount is 20"
+
+        request = SearchRequest(
+            user.key,
+            user.secret,
+            query,
+            HearThis._search_type_as_string(SearchType.PLAYLISTS),
+            page=page,
+            count=count,
+        )
+        json_data = await self._get_as_json("search/", request)
 
-        return list(map(HearThis._json_to_track, cast_list(json_data)))
+        playlists = []
+        for data in cast_list(json_data):
+            user_data = data.pop("user", None)
+            playlist_user = None if user_data is None else create_model(User, user_data)
+            playlists.append(create_model(Playlist, dict(data, user=playlist_user)))
+        return playlists
 
+    @budgeted
     async def reload_single_track(
         self, user: LoggedinUser, track: SingleTrack
     ) -> SingleTrack:
         route = f"{track.user.permalink}/{track.permalink}"
         data = await self._get_as_json(route)
-        return HearThis._json_to_track(data)
+        return self._json_to_track(data)
 
+    @budgeted
     async def get_single_artist(
         self, user: LoggedinUser, permalink: str
     ) -> SingleArtist:
@@ -395,17 +872,153 @@ class HearThis:
         self._replace_key(json_data, "720p_url", "p_url")
         return SingleArtist(**cast_dict(json_data))
 
+    @budgeted
     async def download_track(self, user: LoggedinUser, track: SingleTrack) -> bytes:
         return await self._get_as_bytes(track.download_url)
 
+    def open_download(self, url: str, offset: int = 0, length: int = None):
+        # Returns the response context of a (ranged) download, e.g. to resume
+        # partial files. Servers without range support answer with 200.
+        headers = dict()
+        if length is not None:
+            headers["Range"] = f"bytes={offset}-{offset + length - 1}"
+        elif offset > 0:
+            headers["Range"] = f"bytes={offset}-"
+        return self._open_scheduled(url, headers)
+
+    @asynccontextmanager
+    async def _open_scheduled(self, url: str, headers: dict):
+        async with self._slot("media"):
+            options = HearThis._request_options()
+            async with self._client_session.get(
+                url, headers=headers, **options
+            ) as response:
+                yield response
+
+    async def download_track_to_file(
+        self,
+        user: LoggedinUser,
+        track: SingleTrack,
+        path: str,
+        algorithm: str = "sha256",
+    ) -> "DownloadResult":
+        from aiohttp.client_exceptions import InvalidURL
+        from .download import write_response_to_file
+
+        try:
+            async with self._open_scheduled(track.download_url, dict()) as response:
+                if response.status != 200:
+                    return None
+
+                return await write_response_to_file(response, path, algorithm)
+        except InvalidURL:
+            return None
+
     async def toggle_follow_user_from_track(
         self, user: LoggedinUser, track: SingleTrack
     ) -> bool:
-        artist = await self.get_single_artist(user, track.user.permalink)
+        with fresh_reads():
+            artist = await self.get_single_artist(user, track.user.permalink)
         if not artist.following:
-            route = "user_ajax_function.php"
+            return await self._post_follow(user, track.user.id, track.user.permalink)
+
+    async def _post_follow(self, user: LoggedinUser, user_id, permalink: str) -> bool:
+        route = "user_ajax_function.php"
+        try:
             response = await self._post_as_form_data(
-                route, FollowRequest(user.key, user.secret, track.user.id), 200
+                route, FollowRequest(user.key, user.secret, user_id), 200
             )
-            data = json.loads(response)
-            return data["follow"]
+        finally:
+            self._invalidate(permalink)
+        data = json.loads(response)
+        return data["follow"]
+
+    async def follow_users(
+        self,
+        user: LoggedinUser,
+        artists_or_tracks: Iterable[Union[SingleArtist, User, SingleTrack]],
+        concurrency: int = 8,
+        following: Set[str] = None,
+    ) -> List[FollowResult]:
+        # Follows the artists (of the tracks) once each, in input order. Their
+        # state is checked concurrently and only artists which are not
+        # followed yet get a follow request. Ids in `following`, e.g. a cache
+        # of the followed artists, are not checked and followed ids are added.
+        return await self._set_following(
+            user, artists_or_tracks, True, concurrency, following
+        )
+
+    async def unfollow_users(
+        self,
+        user: LoggedinUser,
+        artists_or_tracks: Iterable[Union[SingleArtist, User, SingleTrack]],
+        concurrency: int = 8,
+        following: Set[str] = None,
+    ) -> List[FollowResult]:
+        # The counterpart of follow_users, only followed artists get a
+        # request. Unfollowed ids are removed from `following`.
+        return await self._set_following(
+            user, artists_or_tracks, False, concurrency, following
+        )
+
+    async def _set_following(
+        self,
+        user: LoggedinUser,
+        artists_or_tracks: Iterable[Union[SingleArtist, User, SingleTrack]],
+        follow: bool,
+        concurrency: int,
+        following: Set[str],
+    ) -> List[FollowResult]:
+        # The api only toggles the follow state. A reply with the other state
+        # means the checked state was outdated and the toggle undid it, the
+        # request is sent once more to reach the wanted state.
+        artists = dict()
+        for item in artists_or_tracks:
+            artist = item.user if isinstance(item, SingleTrack) else item
+            artists.setdefault(str(artist.id), artist)
+
+        if following is None:
+            following = set()
+        semaphore = asyncio.Semaphore(concurrency)
+        if follow:
+            changed, unchanged = FollowOutcome.FOLLOWED, FollowOutcome.ALREADY_FOLLOWING
+        else:
+            changed, unchanged = FollowOutcome.UNFOLLOWED, FollowOutcome.NOT_FOLLOWING
+
+        def remember(user_id: str) -> None:
+            if follow:
+                following.add(user_id)
+            else:
+                following.discard(user_id)
+
+        async def apply(user_id: str, artist) -> FollowResult:
+            permalink = artist.permalink
+            if follow and user_id in following:
+                return FollowResult(user_id, permalink, unchanged)
+
+            try:
+                async with semaphore:
+                    with fresh_reads():
+                        artist = await self.get_single_artist(user, permalink)
+                if artist.following == follow:
+                    remember(user_id)
+                    return FollowResult(user_id, permalink, unchanged)
+
+                async with semaphore:
+                    state = await self._post_follow(user, artist.id, permalink)
+                    if state != follow:
+                        state = await self._post_follow(user, artist.id, permalink)
+                if state != follow:
+                    action = "followed" if follow else "unfollowed"
+                    raise RequestError(f"{permalink} was not {action}")
+            except AuthenticationError:
+                raise
+            except Exception as error:
+                return FollowResult(user_id, permalink, FollowOutcome.FAILED, error)
+
+            remember(user_id)
+            return FollowResult(user_id, permalink, changed)
+
+        return await asyncio.gather(
+            *[apply(user_id, artist) for (user_id, artist) in artists.items()]
+        )
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from typing import List
+
+from .models import Playlist, SingleTrack, User
+
+
+class InternRegistry:
+    # Deduplicates values which repeat across large result sets. Every user id
+    # maps to one canonical User instance (LRU bounded, model NamedTuples can
+    # not be weak referenced) and low cardinality string fields share a single
+    # string object. Nearly unique values such as timestamps are left out,
+    # they would only churn the bounded string table.
+
+    track_fields = (
+        "genre",
+        "genre_slush",
+        "genre_own",
+        "license",
+        "type",
+        "key",
+        "version",
+        "private",
+        "geo",
+    )
+
+    user_fields = ("permalink", "username", "uri", "permalink_url", "avatar_url")
+
+    def __init__(self, max_users: int = 10000, max_strings: int = 100000) -> None:
+        self.max_users = max_users
+        self.max_strings = max_strings
+        self._users: "OrderedDict[object, User]" = OrderedDict()
+        self._strings = dict()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def string(self, value):
+        if not isinstance(value, str):
+            return value
+
+        interned = self._strings.get(value)
+        if interned is not None:
+            return interned
+
+        if len(self._strings) < self.max_strings:
+            self._strings[value] = value
+
+        return value
+
+    def _store_user(self, user: User) -> User:
+        existing = self._users.get(user.id)
+        if existing is not None and existing == user:
+            self._users.move_to_end(user.id)
+            return existing
+
+        self._users[user.id] = user
+        self._users.move_to_end(user.id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+        return user
+
+    def user(self, user_dict: dict) -> User:
+        for field in self.user_fields:
+            if field in user_dict:
+                user_dict[field] = self.string(user_dict[field])
+
+        return self._store_user(User(**user_dict))
+
+    def track(self, json_dict: dict) -> SingleTrack:
+        user = self.user(json_dict.pop("user"))
+        for field in self.track_fields:
+            if field in json_dict:
+                json_dict[field] = self.string(json_dict[field])
+
+        return SingleTrack(**json_dict, user=user)
+
+    def playlist(self, json_dict: dict) -> Playlist:
+        user = self.user(json_dict.pop("user"))
+        return Playlist(**json_dict, user=user)
+
+    def canonicalize(self, track: SingleTrack) -> SingleTrack:
+        # for tracks which were decoded elsewhere, e.g. in a worker process
+        user = self._store_user(track.user._replace(**self._user_strings(track.user)))
+        interned = {
+            field: self.string(getattr(track, field)) for field in self.track_fields
+        }
+        return track._replace(user=user, **interned)
+
+    def canonicalize_all(self, tracks: List[SingleTrack]) -> List[SingleTrack]:
+        return [self.canonicalize(track) for track in tracks]
+
+    def _user_strings(self, user: User) -> dict:
+        return {field: self.string(getattr(user, field)) for field in self.user_fields}
+
+    def clear(self) -> None:
+        self._users.clear()
+        self._strings.clear()
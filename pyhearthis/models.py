@@ -1,4 +1,5 @@
-from typing import NamedTuple
+from enum import Enum
+from typing import List, NamedTuple
 from urllib.parse import urlencode
 
 
@@ -54,6 +55,17 @@ def cast_list(items: dict) -> list:
     return list(map(cast_dict, items))
 
 
+def create_model(model, data: dict):
+    # tolerant constructor for responses which do not exactly match a model,
+    # unknown keys are dropped and missing fields are set to None
+    values = {k: v for (k, v) in data.items() if k in model._fields}
+    for field in model._fields:
+        if field not in values and field not in model._field_defaults:
+            values[field] = None
+
+    return model(**values)
+
+
 class LoggedinUser(NamedTuple):
     id: str
     permalink: str
@@ -181,6 +193,28 @@ class Playlist(NamedTuple):
     user: User
 
 
+class PlaylistSyncResult(NamedTuple):
+    playlist: Playlist
+    added: List[int]
+    removed: List[int]
+    created: bool
+
+
+class FollowOutcome(Enum):
+    FOLLOWED = 1
+    ALREADY_FOLLOWING = 2
+    FAILED = 3
+    UNFOLLOWED = 4
+    NOT_FOLLOWING = 5
+
+
+class FollowResult(NamedTuple):
+    user_id: str
+    permalink: str
+    outcome: FollowOutcome
+    error: Exception = None
+
+
 class SingleArtist(NamedTuple):
     id: str
     permalink: str
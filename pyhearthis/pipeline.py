@@ -0,0 +1,413 @@
+import asyncio
+import inspect
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Union,
+)
+
+from .hearthis import FeedType, HearThis
+from .models import Category, LoggedinUser, Playlist, SingleArtist, SingleTrack
+
+_END = object()
+_DEFAULT_QUEUE_SIZE = 64
+
+
+class ErrorPolicy(Enum):
+    # FAIL stops the pipeline and raises the error from run, DROP records the
+    # item as poisoned and continues with the next one
+    FAIL = 1
+    DROP = 2
+
+
+class PoisonItem(NamedTuple):
+    stage: str
+    item: object
+    error: Exception
+
+
+class StageStats(NamedTuple):
+    name: str
+    workers: int
+    processed: int
+    emitted: int
+    failed: int
+    retried: int
+    queued: int
+    busy_seconds: float
+    blocked_seconds: float
+    items_per_second: float
+
+
+class EnrichedTrack(NamedTuple):
+    track: SingleTrack
+    artist: SingleArtist = None
+    waveform_data: str = None
+
+
+class Stage:
+    # A step of a pipeline. The function is called for every item with up to
+    # `workers` calls in flight. With flatten the returned iterable is emitted
+    # item by item, e.g. to turn pages into tracks. Ordered stages emit their
+    # results in input order, at most `window` results wait for a slow
+    # predecessor. on_close is called (and awaited) when the pipeline ends,
+    # also after an error, e.g. to cancel requests the stage started.
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable[[object], Union[Awaitable, object]],
+        workers: int = 1,
+        ordered: bool = False,
+        flatten: bool = False,
+        retries: int = 0,
+        on_error: ErrorPolicy = ErrorPolicy.DROP,
+        queue_size: int = None,
+        window: int = None,
+        on_close: Callable[[], Union[Awaitable, None]] = None,
+    ) -> None:
+        assert workers > 0, "at least one worker is required"
+
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.ordered = ordered
+        self.flatten = flatten
+        self.retries = retries
+        self.on_error = on_error
+        self.queue_size = queue_size
+        self.window = window or 2 * workers
+        self.on_close = on_close
+
+
+class _StageRunner:
+    def __init__(self, pipeline: "Pipeline", stage: Stage, output: asyncio.Queue):
+        self._pipeline = pipeline
+        self.stage = stage
+        self.input = asyncio.Queue(stage.queue_size or pipeline.queue_size)
+        self._output = output
+        self._active = stage.workers
+        self._emit_lock = asyncio.Lock()
+        self._window = asyncio.Semaphore(stage.window)
+        self._pending: Dict[int, list] = dict()
+        self._next_sequence = 0
+        self._output_sequence = 0
+        self._started = None
+        self._finished = None
+        self.processed = 0
+        self.emitted = 0
+        self.failed = 0
+        self.retried = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+
+    async def _call(self, item):
+        attempt = 0
+        while True:
+            try:
+                result = self.stage.function(item)
+                if inspect.isawaitable(result):
+                    result = await result
+                return result
+            except Exception:
+                if attempt >= self.stage.retries:
+                    raise
+                attempt += 1
+                self.retried += 1
+
+    async def _put(self, item) -> None:
+        started = time.monotonic()
+        await self._output.put((self._output_sequence, item))
+        self.blocked_seconds += time.monotonic() - started
+        self._output_sequence += 1
+        self.emitted += 1
+
+    async def _emit(self, sequence: int, results: list) -> None:
+        async with self._emit_lock:
+            if not self.stage.ordered:
+                for result in results:
+                    await self._put(result)
+                return
+
+            self._pending[sequence] = results
+            while self._next_sequence in self._pending:
+                for result in self._pending.pop(self._next_sequence):
+                    await self._put(result)
+                self._next_sequence += 1
+                self._window.release()
+
+    async def _process(self, sequence: int, item) -> None:
+        started = time.monotonic()
+        try:
+            result = await self._call(item)
+            results = list(result) if self.stage.flatten else [result]
+        except Exception as error:
+            self.failed += 1
+            if self.stage.on_error is ErrorPolicy.FAIL:
+                raise
+            self._pipeline.poisoned.append(PoisonItem(self.stage.name, item, error))
+            results = []
+        finally:
+            self.busy_seconds += time.monotonic() - started
+            self.processed += 1
+
+        await self._emit(sequence, results)
+        if not self.stage.ordered:
+            self._window.release()
+
+    async def work(self) -> None:
+        if self._started is None:
+            self._started = time.monotonic()
+
+        while True:
+            await self._window.acquire()
+            sequence, item = await self.input.get()
+            if item is _END:
+                self._window.release()
+                # leave the marker for the other workers of this stage
+                await self.input.put((sequence, _END))
+                break
+
+            await self._process(sequence, item)
+
+        self._active -= 1
+        if self._active == 0:
+            self._finished = time.monotonic()
+            await self._output.put((self._output_sequence, _END))
+
+    def stats(self) -> StageStats:
+        elapsed = 0.0
+        if self._started is not None:
+            end = self._finished or time.monotonic()
+            elapsed = end - self._started
+
+        return StageStats(
+            self.stage.name,
+            self.stage.workers,
+            self.processed,
+            self.emitted,
+            self.failed,
+            self.retried,
+            self.input.qsize(),
+            self.busy_seconds,
+            self.blocked_seconds,
+            self.processed / elapsed if elapsed > 0 else 0.0,
+        )
+
+
+class Pipeline:
+    # Connects a source with stages through bounded queues. A full queue
+    # blocks the stage in front of it, so a slow sink slows the fetching
+    # down instead of letting results pile up in memory.
+
+    def __init__(
+        self,
+        source: Union[AsyncIterator, Iterable],
+        stages: List[Stage],
+        queue_size: int = _DEFAULT_QUEUE_SIZE,
+    ) -> None:
+        assert len(stages) > 0, "at least one stage is required"
+
+        self._source = source
+        self.queue_size = queue_size
+        self.poisoned: List[PoisonItem] = list()
+        self._output = asyncio.Queue(queue_size)
+        self._runners: List[_StageRunner] = list()
+        self._tasks: List[asyncio.Task] = list()
+        self._error = None
+
+        output = self._output
+        for stage in reversed(stages):
+            runner = _StageRunner(self, stage, output)
+            self._runners.insert(0, runner)
+            output = runner.input
+
+    async def _feed(self) -> None:
+        queue = self._runners[0].input
+        sequence = 0
+        if hasattr(self._source, "__aiter__"):
+            async for item in self._source:
+                await queue.put((sequence, item))
+                sequence += 1
+        else:
+            for item in self._source:
+                await queue.put((sequence, item))
+                sequence += 1
+
+        await queue.put((sequence, _END))
+
+    async def _guard(self, coroutine) -> None:
+        try:
+            await coroutine
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            if self._error is None:
+                self._error = error
+            current = asyncio.current_task()
+            for task in self._tasks:
+                if task is not current:
+                    task.cancel()
+            await self._output.put((0, _END))
+
+    def _start(self) -> None:
+        coroutines = [self._feed()]
+        for runner in self._runners:
+            coroutines.extend(runner.work() for _ in range(runner.stage.workers))
+
+        self._tasks = [asyncio.ensure_future(self._guard(c)) for c in coroutines]
+
+    async def results(self) -> AsyncIterator:
+        # yields the items leaving the last stage
+        self._start()
+        try:
+            while True:
+                _, item = await self._output.get()
+                if item is _END:
+                    break
+                yield item
+
+            if self._error is not None:
+                raise self._error
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._close_stages()
+
+    async def _close_stages(self) -> None:
+        for runner in self._runners:
+            if runner.stage.on_close is None:
+                continue
+            result = runner.stage.on_close()
+            if inspect.isawaitable(result):
+                await result
+
+    async def run(self) -> List[StageStats]:
+        async for _ in self.results():
+            pass
+
+        return self.stats()
+
+    def stats(self) -> List[StageStats]:
+        return [runner.stats() for runner in self._runners]
+
+
+async def paged_source(
+    fetch_page: Callable[..., Awaitable[list]],
+    *args,
+    count: int = 20,
+    start_page: int = 1,
+    max_pages: int = None,
+    **kwargs,
+) -> AsyncIterator:
+    # Yields the items of consecutive pages until a page comes back short.
+    # The next page is only requested when the pipeline takes items again.
+    page = start_page
+    while max_pages is None or page < start_page + max_pages:
+        items = await fetch_page(*args, page=page, count=count, **kwargs)
+        for item in items:
+            yield item
+
+        if len(items) < count:
+            return
+        page += 1
+
+
+def feed_source(
+    hearthis: HearThis,
+    user: LoggedinUser,
+    feed_type: FeedType = FeedType.UNDEFINED,
+    **kwargs,
+) -> AsyncIterator[SingleTrack]:
+    return paged_source(hearthis.get_feeds, user, feed_type=feed_type, **kwargs)
+
+
+def category_source(
+    hearthis: HearThis, user: LoggedinUser, category: Category, **kwargs
+) -> AsyncIterator[SingleTrack]:
+    return paged_source(hearthis.get_category_tracks, user, category, **kwargs)
+
+
+def artist_tracks_source(
+    hearthis: HearThis, user: LoggedinUser, permalink: str, **kwargs
+) -> AsyncIterator[SingleTrack]:
+    return paged_source(hearthis.get_artist_tracks, user, permalink, **kwargs)
+
+
+def playlists_source(
+    hearthis: HearThis, user: LoggedinUser, **kwargs
+) -> AsyncIterator[Playlist]:
+    return paged_source(hearthis.get_playlists, user, **kwargs)
+
+
+def search_source(
+    hearthis: HearThis, user: LoggedinUser, query: str, **kwargs
+) -> AsyncIterator[SingleTrack]:
+    return paged_source(hearthis.search, user, query, **kwargs)
+
+
+def _as_enriched(item) -> EnrichedTrack:
+    return item if isinstance(item, EnrichedTrack) else EnrichedTrack(item)
+
+
+def artist_stage(
+    hearthis: HearThis, user: LoggedinUser, workers: int = 4, **kwargs
+) -> Stage:
+    # Adds the artist of every track. Every artist is requested once, tracks
+    # of the same artist share the request. Only the most recent artists are
+    # kept, as many as the stage queue holds tracks.
+    artists: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+    max_artists = kwargs.get("queue_size") or _DEFAULT_QUEUE_SIZE
+
+    def forget_oldest() -> None:
+        # requests in flight are kept, tracks are waiting for them
+        for permalink in list(artists):
+            if len(artists) <= max_artists:
+                return
+            if artists[permalink].done():
+                del artists[permalink]
+
+    async def enrich(item) -> EnrichedTrack:
+        item = _as_enriched(item)
+        permalink = item.track.user.permalink
+        artist = artists.get(permalink)
+        if artist is None:
+            artist = asyncio.ensure_future(hearthis.get_single_artist(user, permalink))
+            artists[permalink] = artist
+            forget_oldest()
+        else:
+            artists.move_to_end(permalink)
+        try:
+            return item._replace(artist=await asyncio.shield(artist))
+        except Exception:
+            # a failed request is tried again by the next track
+            if artists.get(permalink) is artist:
+                del artists[permalink]
+            raise
+
+    async def close() -> None:
+        requests = [artist for artist in artists.values() if not artist.done()]
+        artists.clear()
+        for request in requests:
+            request.cancel()
+        await asyncio.gather(*requests, return_exceptions=True)
+
+    return Stage("artist", enrich, workers, on_close=close, **kwargs)
+
+
+def waveform_stage(hearthis: HearThis, workers: int = 4, **kwargs) -> Stage:
+    async def enrich(item) -> EnrichedTrack:
+        item = _as_enriched(item)
+        waveform_data = await hearthis.get_waveform_data(item.track)
+        return item._replace(waveform_data=waveform_data)
+
+    return Stage("waveform", enrich, workers, **kwargs)
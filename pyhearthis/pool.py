@@ -0,0 +1,365 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from enum import Enum
+from typing import Iterable, List, NamedTuple, Set, Union
+
+from .errors import CircuitOpenError, DeadlineExceededError, RequestError
+from .hearthis import ArtistTracklistType, FeedType, HearThis, SearchType
+from .models import (
+    Category,
+    FollowResult,
+    LoggedinUser,
+    Playlist,
+    PlaylistSyncResult,
+    SingleArtist,
+    SingleTrack,
+    User,
+)
+
+
+class PoolStrategy(Enum):
+    ROUND_ROBIN = 1
+    LEAST_LOADED = 2
+
+
+class UnknownCredentialError(Exception):
+    pass
+
+
+class CredentialStats(NamedTuple):
+    user_id: int
+    in_flight: int
+    total_requests: int
+    failures: int
+    consecutive_failures: int
+    backoff_remaining: float
+
+
+class CredentialState:
+    def __init__(self, user: LoggedinUser) -> None:
+        self.user = user
+        self.in_flight = 0
+        self.total_requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.backoff_until = 0.0
+
+    def is_available(self, now: float) -> bool:
+        return now >= self.backoff_until
+
+    def stats(self, now: float) -> CredentialStats:
+        return CredentialStats(
+            self.user.id,
+            self.in_flight,
+            self.total_requests,
+            self.failures,
+            self.consecutive_failures,
+            max(0.0, self.backoff_until - now),
+        )
+
+
+class HearThisPool:
+    # Spreads read calls of a single HearThis client over several credentials.
+    # Every credential is rate limited on its own by the API, so the sustained
+    # read throughput grows with the number of accounts in the pool. Calls
+    # which modify or read account owned data (playlists, follows) are always
+    # executed with the credentials of the given user.
+
+    def __init__(
+        self,
+        hearthis: HearThis,
+        users: List[LoggedinUser],
+        strategy: PoolStrategy = PoolStrategy.LEAST_LOADED,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        max_in_flight: int = None,
+    ) -> None:
+        assert len(users) > 0, "at least one credential is required"
+
+        self._hearthis = hearthis
+        self._states = [CredentialState(user) for user in users]
+        self._strategy = strategy
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._max_in_flight = max_in_flight
+        self._next_index = 0
+        # set whenever a lease ends, waiting acquires select again
+        self._released = None
+
+    @property
+    def users(self) -> List[LoggedinUser]:
+        return [state.user for state in self._states]
+
+    def stats(self) -> List[CredentialStats]:
+        now = time.monotonic()
+        return [state.stats(now) for state in self._states]
+
+    def _is_selectable(self, state: CredentialState, now: float) -> bool:
+        if not state.is_available(now):
+            return False
+
+        if self._max_in_flight is None:
+            return True
+
+        return state.in_flight < self._max_in_flight
+
+    def _select(self, now: float) -> CredentialState:
+        if self._strategy is PoolStrategy.ROUND_ROBIN:
+            for offset in range(len(self._states)):
+                index = (self._next_index + offset) % len(self._states)
+                state = self._states[index]
+                if self._is_selectable(state, now):
+                    self._next_index = index + 1
+                    return state
+            return None
+
+        candidates = [s for s in self._states if self._is_selectable(s, now)]
+        if len(candidates) == 0:
+            return None
+
+        return min(candidates, key=lambda s: (s.in_flight, s.total_requests))
+
+    async def _acquire(self) -> CredentialState:
+        if self._released is None:
+            self._released = asyncio.Event()
+
+        while True:
+            now = time.monotonic()
+            state = self._select(now)
+            if state is not None:
+                return state
+
+            # either every credential backs off or all of them are busy, wait
+            # for the end of a lease or of the shortest backoff
+            backoffs = [s.backoff_until - now for s in self._states]
+            backoffs = [backoff for backoff in backoffs if backoff > 0]
+            self._released.clear()
+            try:
+                await asyncio.wait_for(
+                    self._released.wait(), min(backoffs) if backoffs else None
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _is_credential_failure(error: Exception) -> bool:
+        # Only errors of the transport, rate limits and server errors say
+        # something about a credential. Exhausted deadlines, open circuits and
+        # errors of the caller do not back it off.
+        if isinstance(error, (DeadlineExceededError, CircuitOpenError)):
+            return False
+        if isinstance(error, RequestError):
+            status = error.status
+            return status is not None and (status == 429 or status >= 500)
+        if isinstance(error, (OSError, asyncio.TimeoutError)):
+            return True
+
+        from aiohttp import ClientError
+
+        return isinstance(error, ClientError)
+
+    def _record_success(self, state: CredentialState) -> None:
+        state.consecutive_failures = 0
+        state.backoff_until = 0.0
+
+    def _record_failure(self, state: CredentialState) -> None:
+        state.failures += 1
+        state.consecutive_failures += 1
+        delay = self._base_backoff * 2 ** (state.consecutive_failures - 1)
+        state.backoff_until = time.monotonic() + min(delay, self._max_backoff)
+
+    @asynccontextmanager
+    async def _lease(self, state: CredentialState = None, track_health=True):
+        if state is None:
+            state = await self._acquire()
+
+        state.in_flight += 1
+        state.total_requests += 1
+        try:
+            yield state
+        except Exception as error:
+            if track_health and HearThisPool._is_credential_failure(error):
+                self._record_failure(state)
+            raise
+        else:
+            if track_health:
+                self._record_success(state)
+        finally:
+            state.in_flight -= 1
+            if self._released is not None:
+                self._released.set()
+
+    def _owner(self, user: LoggedinUser) -> CredentialState:
+        for state in self._states:
+            if state.user.id == user.id:
+                return state
+
+        raise UnknownCredentialError(user.id)
+
+    async def _read(self, method_name: str, *args, **kwargs):
+        async with self._lease() as state:
+            method = getattr(self._hearthis, method_name)
+            return await method(state.user, *args, **kwargs)
+
+    async def _owned(self, method_name: str, user: LoggedinUser, *args, **kwargs):
+        async with self._lease(self._owner(user), track_health=False) as state:
+            method = getattr(self._hearthis, method_name)
+            return await method(state.user, *args, **kwargs)
+
+    async def get_categories(self) -> List[Category]:
+        return await self._hearthis.get_categories()
+
+    async def get_waveform_data(self, track: SingleTrack) -> str:
+        return await self._hearthis.get_waveform_data(track)
+
+    async def get_feeds(
+        self,
+        category: str = "",
+        feed_type=FeedType.UNDEFINED,
+        duration: timedelta = None,
+        page: int = 1,
+        count: int = 5,
+        feed_start: date = None,
+        feed_end: date = None,
+    ) -> List[SingleTrack]:
+        return await self._read(
+            "get_feeds",
+            category,
+            feed_type,
+            duration,
+            page,
+            count,
+            feed_start,
+            feed_end,
+        )
+
+    async def get_category_tracks(
+        self, category: Category, page: int = 1, count: int = 5
+    ) -> List[SingleTrack]:
+        return await self._read("get_category_tracks", category, page, count)
+
+    async def get_artist_tracks(
+        self,
+        user_permalink: str,
+        track_type: ArtistTracklistType = ArtistTracklistType.TRACKS,
+        page: int = 1,
+        count: int = 5,
+    ) -> List[SingleTrack]:
+        return await self._read(
+            "get_artist_tracks", user_permalink, track_type, page, count
+        )
+
+    async def search(
+        self,
+        query: str,
+        search_type: SearchType = None,
+        duration: timedelta = None,
+        page: int = 1,
+        count: int = 5,
+    ) -> List[SingleTrack]:
+        return await self._read("search", query, search_type, duration, page, count)
+
+    async def reload_single_track(self, track: SingleTrack) -> SingleTrack:
+        return await self._read("reload_single_track", track)
+
+    async def get_single_artist(self, permalink: str) -> SingleArtist:
+        return await self._read("get_single_artist", permalink)
+
+    async def download_track(self, track: SingleTrack) -> bytes:
+        return await self._read("download_track", track)
+
+    async def download_track_to_file(
+        self, track: SingleTrack, path: str, algorithm: str = "sha256"
+    ):
+        return await self._read("download_track_to_file", track, path, algorithm)
+
+    async def search_users(
+        self, query: str, page: int = 1, count: int = 5
+    ) -> List[User]:
+        return await self._read("search_users", query, page, count)
+
+    async def search_playlists(
+        self, query: str, page: int = 1, count: int = 5
+    ) -> List[Playlist]:
+        return await self._read("search_playlists", query, page, count)
+
+    async def get_playlists(
+        self, user: LoggedinUser, page: int = 1, count: int = 5
+    ) -> List[Playlist]:
+        return await self._owned("get_playlists", user, page, count)
+
+    async def get_playlist_tracks(
+        self, user: LoggedinUser, playlist: Playlist
+    ) -> List[SingleTrack]:
+        return await self._owned("get_playlist_tracks", user, playlist)
+
+    async def create_playlist(
+        self, user: LoggedinUser, playlist_name: str, private_set: bool = True
+    ) -> None:
+        return await self._owned("create_playlist", user, playlist_name, private_set)
+
+    async def add_track_to_playlist(
+        self, user: LoggedinUser, track: SingleTrack, playlist: Playlist
+    ) -> Playlist:
+        return await self._owned("add_track_to_playlist", user, track, playlist)
+
+    async def add_track_to_new_playlist(
+        self, user: LoggedinUser, track: SingleTrack, playlist_name: str
+    ):
+        return await self._owned(
+            "add_track_to_new_playlist", user, track, playlist_name
+        )
+
+    async def delete_track_from_playlist(
+        self, user: LoggedinUser, track: SingleTrack, playlist: Playlist
+    ) -> Playlist:
+        return await self._owned("delete_track_from_playlist", user, track, playlist)
+
+    async def delete_playlist(self, user: LoggedinUser, playlist: Playlist) -> None:
+        return await self._owned("delete_playlist", user, playlist)
+
+    async def toggle_follow_user_from_track(
+        self, user: LoggedinUser, track: SingleTrack
+    ) -> bool:
+        return await self._owned("toggle_follow_user_from_track", user, track)
+
+    async def sync_playlist(
+        self,
+        user: LoggedinUser,
+        name_or_playlist: Union[str, Playlist],
+        desired_track_ids: Iterable[int],
+        private_set: bool = True,
+        concurrency: int = 4,
+    ) -> PlaylistSyncResult:
+        return await self._owned(
+            "sync_playlist",
+            user,
+            name_or_playlist,
+            desired_track_ids,
+            private_set,
+            concurrency,
+        )
+
+    async def follow_users(
+        self,
+        user: LoggedinUser,
+        artists_or_tracks: Iterable[Union[SingleArtist, User, SingleTrack]],
+        concurrency: int = 8,
+        following: Set[str] = None,
+    ) -> List[FollowResult]:
+        return await self._owned(
+            "follow_users", user, artists_or_tracks, concurrency, following
+        )
+
+    async def unfollow_users(
+        self,
+        user: LoggedinUser,
+        artists_or_tracks: Iterable[Union[SingleArtist, User, SingleTrack]],
+        concurrency: int = 8,
+        following: Set[str] = None,
+    ) -> List[FollowResult]:
+        return await self._owned(
+            "unfollow_users", user, artists_or_tracks, concurrency, following
+        )
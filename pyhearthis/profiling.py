@@ -0,0 +1,212 @@
+import functools
+import inspect
+import random
+import tracemalloc
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List, NamedTuple, Set, Tuple
+
+_routes: ContextVar = ContextVar("pyhearthis_profiled_routes", default=None)
+
+_ignored_files = (tracemalloc.__file__, __file__, "<frozen importlib._bootstrap>")
+
+
+class AllocationSite(NamedTuple):
+    location: str
+    size: int
+    count: int
+
+
+class MethodAllocations(NamedTuple):
+    method: str
+    route: str
+    calls: int
+    samples: int
+    peak: int
+    mean_peak: float
+    mean_retained: float
+    sites: List[AllocationSite]
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.samples = 0
+        self.peak = 0
+        self.total_peak = 0
+        self.total_retained = 0
+        self.sites: Dict[str, List[int]] = dict()
+
+
+def mark_route(route_family: str) -> None:
+    routes = _routes.get()
+    if routes is not None:
+        routes.add(route_family)
+
+
+class AllocationProfiler:
+    # Attributes allocations to client methods and the route families they
+    # requested. A sampled call is measured with tracemalloc: peak is the
+    # highest traced memory during the call, retained the memory still
+    # allocated when it returns (e.g. the returned models). Allocation sites
+    # come from comparing snapshots taken before and after the call.
+    #
+    # tracemalloc traces the whole process, so only one call is measured at
+    # a time and calls made while another one is measured are not sampled.
+    # Allocations of other tasks running concurrently with a sampled call are
+    # attributed to that call as well. Tracing is only active during sampled
+    # calls (unless it was started by someone else), calls which are not
+    # sampled do not pay for it.
+
+    def __init__(self, sample_rate: float = 0.01, frames: int = 1) -> None:
+        self.sample_rate = sample_rate
+        self.frames = frames
+        self._stats: Dict[Tuple[str, str], _Stats] = dict()
+        self._measuring = False
+        self._started_tracing = False
+
+    def _start_tracing(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+
+    def stop(self) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def reset(self) -> None:
+        self._stats.clear()
+
+    def _entry(self, method: str, routes: Set[str]) -> _Stats:
+        key = (method, ",".join(sorted(routes)) or "-")
+        entry = self._stats.get(key)
+        if entry is None:
+            entry = self._stats[key] = _Stats()
+        return entry
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces(
+            [tracemalloc.Filter(False, name) for name in _ignored_files]
+        )
+
+    @asynccontextmanager
+    async def measure(self, method: str):
+        # routes of nested client calls count for the outer call as well
+        parent = _routes.get()
+        routes = set()
+        token = _routes.set(routes)
+        sampled = not self._measuring and random.random() < self.sample_rate
+        if not sampled:
+            try:
+                yield
+            finally:
+                _routes.reset(token)
+                self._entry(method, routes).calls += 1
+                if parent is not None:
+                    parent.update(routes)
+            return
+
+        self._measuring = True
+        self._start_tracing()
+        before = self._snapshot()
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        try:
+            yield
+        finally:
+            _routes.reset(token)
+            if parent is not None:
+                parent.update(routes)
+            current, peak = tracemalloc.get_traced_memory()
+            after = self._snapshot()
+            self.stop()
+            self._measuring = False
+            self._record(method, routes, peak - start, current - start, before, after)
+
+    def _record(self, method, routes, peak, retained, before, after) -> None:
+        entry = self._entry(method, routes)
+        entry.calls += 1
+        entry.samples += 1
+        entry.peak = max(entry.peak, peak)
+        entry.total_peak += peak
+        entry.total_retained += retained
+
+        for statistic in after.compare_to(before, "lineno"):
+            if statistic.size_diff <= 0:
+                continue
+
+            frame = statistic.traceback[0]
+            site = entry.sites.setdefault(f"{frame.filename}:{frame.lineno}", [0, 0])
+            site[0] += statistic.size_diff
+            site[1] += statistic.count_diff
+
+    def wrap(self, client) -> None:
+        # replaces the public coroutine methods of a client instance by
+        # measured ones
+        for name, method in inspect.getmembers(client, inspect.iscoroutinefunction):
+            if not name.startswith("_"):
+                setattr(client, name, self._wrap_method(name, method))
+
+    def _wrap_method(self, name: str, method):
+        @functools.wraps(method)
+        async def measured(*args, **kwargs):
+            async with self.measure(name):
+                return await method(*args, **kwargs)
+
+        return measured
+
+    @staticmethod
+    def _top_sites(sites: Dict[str, List[int]], limit: int) -> List[AllocationSite]:
+        ranked = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)
+        return [
+            AllocationSite(location, size, count)
+            for (location, (size, count)) in ranked[:limit]
+        ]
+
+    def report(self, sites: int = 10) -> List[MethodAllocations]:
+        # sampled methods first, ordered by their highest peak
+        result = []
+        for (method, route), entry in self._stats.items():
+            samples = max(entry.samples, 1)
+            result.append(
+                MethodAllocations(
+                    method,
+                    route,
+                    entry.calls,
+                    entry.samples,
+                    entry.peak,
+                    entry.total_peak / samples,
+                    entry.total_retained / samples,
+                    self._top_sites(entry.sites, sites),
+                )
+            )
+
+        return sorted(result, key=lambda item: (item.peak, item.calls), reverse=True)
+
+    def top_sites(self, limit: int = 10) -> List[AllocationSite]:
+        sites: Dict[str, List[int]] = dict()
+        for entry in self._stats.values():
+            for location, (size, count) in entry.sites.items():
+                site = sites.setdefault(location, [0, 0])
+                site[0] += size
+                site[1] += count
+
+        return self._top_sites(sites, limit)
+
+    def format_report(self, sites: int = 3) -> str:
+        lines = [
+            f"{'method':<28}{'route':<16}{'calls':>8}{'samples':>9}"
+            f"{'peak KiB':>11}{'retained KiB':>14}"
+        ]
+        for item in self.report(sites):
+            lines.append(
+                f"{item.method:<28}{item.route:<16}{item.calls:>8}{item.samples:>9}"
+                f"{item.peak / 1024:>11.1f}{item.mean_retained / 1024:>14.1f}"
+            )
+            for site in item.sites:
+                lines.append(f"    {site.size / 1024:>9.1f} KiB  {site.location}")
+
+        return "\n".join(lines)
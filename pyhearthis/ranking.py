@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+from enum import Enum
+from itertools import count as counter
+from typing import Callable, Iterable, List, NamedTuple, Union
+
+from .hearthis import FeedType, HearThis
+from .models import Category, LoggedinUser, SingleTrack
+from .statistics import HyperLogLog
+
+
+class RankKey(Enum):
+    PLAYBACK_COUNT = 1
+    FAVORITINGS_COUNT = 2
+    RECENCY = 3
+
+
+def _as_number(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def rank_value(track: SingleTrack, key: RankKey):
+    if key is RankKey.PLAYBACK_COUNT:
+        return _as_number(track.playback_count)
+    if key is RankKey.FAVORITINGS_COUNT:
+        return _as_number(track.favoritings_count)
+    if key is RankKey.RECENCY:
+        return _as_number(track.unix_created_at) or _as_number(track.release_timestamp)
+
+    return key(track)
+
+
+class TopTracks:
+    # Keeps the n best tracks seen so far in a min heap. Duplicates are
+    # detected against the ids in the heap only, a track which did not make
+    # it into the heap is rejected again anyway. The distinct tracks are
+    # counted with a sketch, so memory stays bounded over long scans.
+
+    def __init__(
+        self, n: int, key: Union[RankKey, Callable[[SingleTrack], int]]
+    ) -> None:
+        self.n = n
+        self.key = key
+        self._heap = []
+        self._ids = set()
+        self._seen = HyperLogLog()
+        self._sequence = counter()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def seen_count(self) -> int:
+        # approximate for large scans
+        return self._seen.count()
+
+    def offer(self, track: SingleTrack) -> None:
+        self._seen.add(track.id)
+        if track.id in self._ids:
+            return
+
+        # the sequence number keeps the order stable for equal values
+        entry = (rank_value(track, self.key), -next(self._sequence), track)
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, entry)
+            self._ids.add(track.id)
+        elif entry[:2] > self._heap[0][:2]:
+            evicted = heapq.heapreplace(self._heap, entry)
+            self._ids.discard(evicted[2].id)
+            self._ids.add(track.id)
+
+    def offer_all(self, tracks: Iterable[SingleTrack]) -> None:
+        for track in tracks:
+            self.offer(track)
+
+    def result(self) -> List[SingleTrack]:
+        ordered = sorted(self._heap, key=lambda entry: entry[:2], reverse=True)
+        return [entry[2] for entry in ordered]
+
+
+class TopTracksResult(NamedTuple):
+    tracks: List[SingleTrack]
+    complete: bool
+    failed_sources: int
+    seen_tracks: int
+
+
+async def get_top_tracks(
+    hearthis: HearThis,
+    user: LoggedinUser,
+    n: int = 50,
+    key: Union[RankKey, Callable[[SingleTrack], int]] = RankKey.PLAYBACK_COUNT,
+    categories: List[Category] = None,
+    feed_types: Iterable[FeedType] = (),
+    pages: int = 1,
+    count: int = 20,
+    concurrency: int = 8,
+    timeout: float = None,
+) -> TopTracksResult:
+    # Fans out over all (or the given) categories and feeds and merges the
+    # tracks into a top n ranking. When the timeout expires the ranking of
+    # everything received so far is returned with complete set to False. The
+    # timeout covers the whole operation including loading the categories.
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    if categories is None:
+        try:
+            categories = await asyncio.wait_for(hearthis.get_categories(), timeout)
+        except asyncio.TimeoutError:
+            return TopTracksResult([], False, 0, 0)
+
+    top = TopTracks(n, key)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_pages(fetch_page):
+        for page in range(1, pages + 1):
+            async with semaphore:
+                tracks = await fetch_page(page)
+            top.offer_all(tracks)
+            if len(tracks) < count:
+                return
+
+    def category_source(category: Category):
+        return lambda page: hearthis.get_category_tracks(user, category, page, count)
+
+    def feed_source(feed_type: FeedType):
+        return lambda page: hearthis.get_feeds(
+            user, feed_type=feed_type, page=page, count=count
+        )
+
+    sources = [category_source(category) for category in categories]
+    sources += [feed_source(feed_type) for feed_type in feed_types]
+    tasks = [asyncio.ensure_future(fetch_pages(source)) for source in sources]
+    if len(tasks) == 0:
+        return TopTracksResult([], True, 0, 0)
+
+    remaining = None if deadline is None else max(0.0, deadline - loop.time())
+    done, pending = await asyncio.wait(tasks, timeout=remaining)
+    for task in pending:
+        task.cancel()
+    if len(pending) > 0:
+        await asyncio.wait(pending)
+
+    failed = sum(1 for task in done if task.exception() is not None)
+    return TopTracksResult(top.result(), len(pending) == 0, failed, top.seen_count)
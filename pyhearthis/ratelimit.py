@@ -0,0 +1,34 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    # Allows `rate` units per second with bursts of up to `capacity` units.
+    # Requests larger than the capacity are granted once the bucket is full
+    # and leave it in debt, so the long term rate is still respected.
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        assert rate > 0, "rate has to be positive"
+
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        async with self._lock:
+            required = min(amount, self.capacity)
+            self._refill()
+            while self._tokens < required:
+                await asyncio.sleep((required - self._tokens) / self.rate)
+                self._refill()
+
+            self._tokens -= amount
@@ -0,0 +1,445 @@
+import asyncio
+import base64
+import gzip
+import json
+from typing import Callable, Dict, Hashable, Iterable, List, NamedTuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from multidict import CIMultiDict
+
+from .errors import RequestError
+
+REDACTED = "REDACTED"
+
+# query parameters, posted fields and fields of json responses (login)
+_redacted_fields = ("key", "secret", "password", "email")
+_recorded_headers = (
+    "Content-Type",
+    "Content-Range",
+    "Accept-Ranges",
+    "ETag",
+    "Last-Modified",
+)
+
+
+class UnmatchedRequestError(RequestError):
+    pass
+
+
+class RecordedRequest(NamedTuple):
+    method: str
+    url: str
+    body: str = None
+    range: str = None
+
+
+class Interaction(NamedTuple):
+    request: RecordedRequest
+    status: int
+    headers: Dict[str, str]
+    content: bytes
+    latency: float = 0.0
+
+
+class SentRequest(NamedTuple):
+    method: str
+    url: str
+    options: dict
+
+
+def _redact(items: Iterable, redacted: Iterable[str] = _redacted_fields) -> list:
+    return [
+        (name, REDACTED if name in redacted else str(value)) for (name, value) in items
+    ]
+
+
+def redact_url(
+    url: str, params: dict = None, redacted: Iterable[str] = _redacted_fields
+) -> str:
+    # Removes credentials from the query and sorts its parameters, so equal
+    # requests always result in the same url.
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query.extend(params.items())
+
+    query = urlencode(sorted(_redact(query, redacted)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ""))
+
+
+def redact_content(url: str, content: bytes) -> bytes:
+    # Removes the credentials and the e-mail address of the user from a login
+    # response. Other bodies are kept, tracks have a (musical) "key" field.
+    # The api answers json with text/html as well, so the body is tried.
+    if not urlsplit(url).path.rstrip("/").endswith("/login"):
+        return content
+
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return content
+
+    if not isinstance(data, dict):
+        return content
+
+    redacted = {
+        name: REDACTED if name in _redacted_fields else value
+        for (name, value) in data.items()
+    }
+    if redacted == data:
+        return content
+
+    return json.dumps(redacted).encode("utf-8")
+
+
+def redact_body(options: dict, redacted: Iterable[str] = _redacted_fields) -> str:
+    data = options.get("json", options.get("data"))
+    if data is None:
+        return None
+
+    if isinstance(data, (str, bytes)):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return data.decode("utf-8") if isinstance(data, bytes) else data
+
+    if isinstance(data, dict):
+        data = dict(_redact(data.items(), redacted))
+
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+def record_request(
+    method: str, url: str, options: dict, redacted: Iterable[str] = _redacted_fields
+) -> RecordedRequest:
+    # redacted=() keeps the credentials, e.g. to assert them in tests
+    headers = options.get("headers") or dict()
+    return RecordedRequest(
+        method.upper(),
+        redact_url(url, options.get("params"), redacted),
+        redact_body(options, redacted),
+        headers.get("Range"),
+    )
+
+
+def create_interaction(
+    method: str,
+    url: str,
+    content,
+    status: int = 200,
+    content_type: str = "application/json",
+    latency: float = 0.0,
+    redacted: Iterable[str] = _redacted_fields,
+    **options,
+) -> Interaction:
+    # Builds an interaction by hand, options are the keyword arguments of the
+    # session call (params, data, json, headers).
+    if isinstance(content, (dict, list)):
+        content = json.dumps(content)
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    request = record_request(method, url, options, redacted)
+    return Interaction(
+        request, status, {"Content-Type": content_type}, content, latency
+    )
+
+
+def exact_match(request: RecordedRequest) -> Hashable:
+    return request
+
+
+def ignore_params(*names: str) -> Callable[[RecordedRequest], Hashable]:
+    # Matcher which treats requests differing only in the given query
+    # parameters as equal.
+    def match(request: RecordedRequest) -> Hashable:
+        parts = urlsplit(request.url)
+        query = [
+            (name, value)
+            for (name, value) in parse_qsl(parts.query, keep_blank_values=True)
+            if name not in names
+        ]
+        url = urlunsplit(parts._replace(query=urlencode(query)))
+        return request._replace(url=url)
+
+    return match
+
+
+def ignore_body(request: RecordedRequest) -> Hashable:
+    return request._replace(body=None)
+
+
+paging_matcher = ignore_params("page", "count")
+
+
+class Cassette:
+    # Recorded interactions in request order. Files ending with .gz are
+    # compressed, bodies are stored as text when they are valid utf-8.
+
+    def __init__(self, interactions: Iterable[Interaction] = None) -> None:
+        self.interactions: List[Interaction] = list(interactions or [])
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+    def append(self, interaction: Interaction) -> None:
+        self.interactions.append(interaction)
+
+    @staticmethod
+    def _encode(interaction: Interaction) -> dict:
+        request = {
+            name: value
+            for (name, value) in interaction.request._asdict().items()
+            if value is not None
+        }
+        entry = dict(
+            request=request,
+            status=interaction.status,
+            headers=interaction.headers,
+            latency=round(interaction.latency, 4),
+        )
+        try:
+            entry["text"] = interaction.content.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["base64"] = base64.b64encode(interaction.content).decode("ascii")
+
+        return entry
+
+    @staticmethod
+    def _decode(entry: dict) -> Interaction:
+        if "text" in entry:
+            content = entry["text"].encode("utf-8")
+        else:
+            content = base64.b64decode(entry["base64"])
+
+        return Interaction(
+            RecordedRequest(**entry["request"]),
+            entry["status"],
+            entry["headers"],
+            content,
+            entry.get("latency", 0.0),
+        )
+
+    def save(self, path: str) -> None:
+        data = json.dumps(
+            dict(version=1, interactions=list(map(self._encode, self.interactions))),
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+        if path.endswith(".gz"):
+            data = gzip.compress(data)
+
+        with open(path, "wb") as file:
+            file.write(data)
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with open(path, "rb") as file:
+            data = file.read()
+
+        if path.endswith(".gz"):
+            data = gzip.decompress(data)
+
+        return cls(map(cls._decode, json.loads(data)["interactions"]))
+
+
+class ReplayStream:
+    def __init__(self, content: bytes) -> None:
+        self._content = content
+        self._position = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        end = len(self._content) if size < 0 else self._position + size
+        data = self._content[self._position : end]
+        self._position += len(data)
+        return data
+
+    async def iter_chunked(self, size: int):
+        while True:
+            data = await self.read(size)
+            if not data:
+                return
+            yield data
+
+    def iter_any(self):
+        return self.iter_chunked(64 * 1024)
+
+
+class ReplayResponse:
+    def __init__(self, interaction: Interaction) -> None:
+        self.status = interaction.status
+        self.headers = CIMultiDict(interaction.headers)
+        self.headers["Content-Length"] = str(len(interaction.content))
+        self.content = ReplayStream(interaction.content)
+        self._body = interaction.content
+
+    @property
+    def content_type(self) -> str:
+        content_type = self.headers.get("Content-Type", "application/octet-stream")
+        return content_type.split(";")[0].strip()
+
+    @property
+    def content_length(self) -> int:
+        return len(self._body)
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: str = "utf-8") -> str:
+        return self._body.decode(encoding)
+
+    async def json(self, **kwargs):
+        text = await self.text()
+        if not text.strip():
+            return None
+
+        return json.loads(text)
+
+    def release(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "ReplayResponse":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+class _RequestContext:
+    # Mirrors the request context manager of aiohttp: usable with async with
+    # or awaited directly.
+
+    def __init__(self, coroutine) -> None:
+        self._coroutine = coroutine
+        self._response = None
+
+    def __await__(self):
+        return self._coroutine.__await__()
+
+    async def __aenter__(self) -> ReplayResponse:
+        self._response = await self._coroutine
+        return self._response
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self._response.release()
+
+
+class RecordingSession:
+    # Wraps a client session and records every request with its complete
+    # response into a cassette. Credentials never reach the cassette, neither
+    # from requests nor from json responses such as the login response. The
+    # caller still gets the unredacted response.
+
+    def __init__(self, session, cassette: Cassette = None) -> None:
+        self._session = session
+        self.cassette = Cassette() if cassette is None else cassette
+
+    @property
+    def closed(self) -> bool:
+        return self._session.closed
+
+    def get(self, url: str, **options) -> _RequestContext:
+        return _RequestContext(self._request("GET", url, options))
+
+    def post(self, url: str, **options) -> _RequestContext:
+        return _RequestContext(self._request("POST", url, options))
+
+    async def _request(self, method: str, url: str, options: dict):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        send = getattr(self._session, method.lower())
+        async with send(url, **options) as response:
+            content = await response.read()
+            headers = {
+                name: response.headers[name]
+                for name in _recorded_headers
+                if name in response.headers
+            }
+            status = response.status
+
+        interaction = Interaction(
+            record_request(method, url, options),
+            status,
+            headers,
+            content,
+            loop.time() - started,
+        )
+        self.cassette.append(interaction._replace(content=redact_content(url, content)))
+        return ReplayResponse(interaction)
+
+    def save(self, path: str) -> None:
+        self.cassette.save(path)
+
+    async def close(self) -> None:
+        await self._session.close()
+
+
+class ReplaySession:
+    # Serves the responses of a cassette in place of a client session.
+    # Repeated requests get the recorded responses in order, the last one is
+    # repeated once they are used up. Requests without an exact match fall
+    # back to the matcher, e.g. paging_matcher for other pages. A latency
+    # scale of 1.0 replays the recorded latencies, 0.0 replays at full speed.
+    # Cassettes built with unredacted credentials are replayed with
+    # redacted=(), requests with other credentials do not match then.
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        matcher: Callable[[RecordedRequest], Hashable] = exact_match,
+        latency_scale: float = 0.0,
+        redacted: Iterable[str] = _redacted_fields,
+    ) -> None:
+        self._matcher = matcher
+        self.latency_scale = latency_scale
+        self._redacted = tuple(redacted)
+        self._exact: Dict[Hashable, List[Interaction]] = dict()
+        self._matched: Dict[Hashable, List[Interaction]] = dict()
+        self._served: Dict[Hashable, int] = dict()
+        self.requests: List[SentRequest] = list()
+        self._closed = False
+
+        for interaction in cassette.interactions:
+            request = interaction.request
+            self._exact.setdefault(("exact", request), []).append(interaction)
+            self._matched.setdefault(("match", matcher(request)), []).append(
+                interaction
+            )
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ReplaySession":
+        return cls(Cassette.load(path), **kwargs)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def get(self, url: str, **options) -> _RequestContext:
+        return _RequestContext(self._request("GET", url, options))
+
+    def post(self, url: str, **options) -> _RequestContext:
+        return _RequestContext(self._request("POST", url, options))
+
+    def _find(self, request: RecordedRequest) -> Interaction:
+        key = ("exact", request)
+        candidates = self._exact.get(key)
+        if candidates is None:
+            key = ("match", self._matcher(request))
+            candidates = self._matched.get(key)
+        if candidates is None:
+            raise UnmatchedRequestError(f"{request.method} {request.url}")
+
+        served = self._served.get(key, 0)
+        self._served[key] = served + 1
+        return candidates[min(served, len(candidates) - 1)]
+
+    async def _request(self, method: str, url: str, options: dict):
+        self.requests.append(SentRequest(method, url, options))
+        interaction = self._find(record_request(method, url, options, self._redacted))
+
+        await asyncio.sleep(interaction.latency * self.latency_scale)
+        return ReplayResponse(interaction)
+
+    async def close(self) -> None:
+        self._closed = True
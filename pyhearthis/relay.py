@@ -0,0 +1,329 @@
+import asyncio
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, Hashable, Set, Tuple
+
+from aiohttp import web
+
+from .errors import RequestError
+from .hearthis import HearThis
+from .models import SingleTrack
+
+
+class ChunkCache:
+    # LRU cache for stream chunks bounded by bytes. Chunks evicted from
+    # memory are kept in an optional directory, which is bounded as well.
+    # Chunk files left by an earlier process are counted against the disk
+    # limit (oldest first) and may be served again.
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        directory: str = None,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+    ) -> None:
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # file name to size, the names are hashes of the chunk keys
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load_disk()
+
+    def _load_disk(self) -> None:
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                # an interrupted write
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self._disk[name] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    @staticmethod
+    def _disk_name(key: Hashable) -> str:
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def get(self, key: Hashable) -> bytes:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return data
+
+        name = None if self.directory is None else self._disk_name(key)
+        if name in self._disk:
+            with open(os.path.join(self.directory, name), "rb") as file:
+                data = file.read()
+            self._disk.move_to_end(name)
+            self.hits += 1
+            self._put_memory(key, data)
+            return data
+
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, data: bytes) -> None:
+        self._put_memory(key, data)
+
+    def _put_memory(self, key: Hashable, data: bytes) -> None:
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._put_disk(evicted_key, evicted)
+
+    def _put_disk(self, key: Hashable, data: bytes) -> None:
+        if self.directory is None:
+            return
+
+        name = self._disk_name(key)
+        if name in self._disk:
+            return
+
+        # written under a temporary name, a crash never leaves a short chunk
+        path = os.path.join(self.directory, name)
+        with open(f"{path}.tmp", "wb") as file:
+            file.write(data)
+        os.replace(f"{path}.tmp", path)
+        self._disk[name] = len(data)
+        self._disk_bytes += len(data)
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            name, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            os.remove(os.path.join(self.directory, name))
+
+
+_range_pattern = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> Tuple[int, int]:
+    # Returns the inclusive byte range of a single range header, None if the
+    # range can not be satisfied.
+    match = _range_pattern.match(header.strip())
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if start == "" and end == "":
+        return None
+
+    if start == "":
+        suffix = int(end)
+        if suffix == 0:
+            return None
+        return max(0, size - suffix), size - 1
+
+    first = int(start)
+    last = size - 1 if end == "" else min(int(end), size - 1)
+    if first >= size or first > last:
+        return None
+
+    return first, last
+
+
+class StreamRelay:
+    # Local HTTP relay for track streams. Upstream data is fetched in fixed
+    # size range chunks which are cached and shared between all listeners,
+    # concurrent requests for the same chunk wait for a single fetch.
+
+    def __init__(
+        self,
+        hearthis: HearThis,
+        cache: ChunkCache = None,
+        chunk_size: int = 256 * 1024,
+    ) -> None:
+        self._hearthis = hearthis
+        self._cache = ChunkCache() if cache is None else cache
+        self._chunk_size = chunk_size
+        self._urls: Dict[str, str] = dict()
+        self._sizes: Dict[str, int] = dict()
+        # urls whose upstream does not tell the size ("bytes x-y/*")
+        self._unknown_sizes: Set[str] = set()
+        self._fetches: Dict[Tuple[str, int], asyncio.Future] = dict()
+        self._runner = None
+        self.upstream_requests = 0
+
+        self.app = web.Application()
+        self.app.router.add_get("/tracks/{track_id}", self._handle)
+
+    @property
+    def cache(self) -> ChunkCache:
+        return self._cache
+
+    def register(self, track: SingleTrack, preview: bool = False) -> str:
+        url = track.preview_url if preview else track.stream_url
+        track_id = f"{track.id}-preview" if preview else str(track.id)
+        self._urls[track_id] = url
+        return f"/tracks/{track_id}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _fetch_upstream(self, url: str, index: int) -> bytes:
+        self.upstream_requests += 1
+        offset = index * self._chunk_size
+        async with self._hearthis.open_download(
+            url, offset, self._chunk_size
+        ) as response:
+            if response.status == 200:
+                # no range support, the whole body is cached at once
+                data = await response.read()
+                self._sizes[url] = len(data)
+                for position in range(0, len(data), self._chunk_size):
+                    chunk = data[position : position + self._chunk_size]
+                    self._cache.put((url, position // self._chunk_size), chunk)
+                return data[offset : offset + self._chunk_size]
+
+            if response.status != 206:
+                raise RequestError(response.status)
+
+            self._record_size(url, response.headers.get("Content-Range", ""))
+            data = await response.read()
+            self._cache.put((url, index), data)
+            return data
+
+    def _record_size(self, url: str, content_range: str) -> None:
+        # the size of "bytes x-y/size"
+        total = content_range.rsplit("/", 1)[-1].strip()
+        if "/" in content_range and total.isdigit():
+            self._sizes[url] = int(total)
+        else:
+            self._unknown_sizes.add(url)
+
+    async def _probe_size(self, url: str) -> None:
+        # the first chunk came from the cache, e.g. from the disk after a
+        # restart, a single byte tells the size
+        self.upstream_requests += 1
+        async with self._hearthis.open_download(url, 0, 1) as response:
+            if response.status == 200:
+                # no range support, the length is the size
+                if response.content_length is None:
+                    self._unknown_sizes.add(url)
+                else:
+                    self._sizes[url] = response.content_length
+                return
+
+            if response.status != 206:
+                raise RequestError(response.status)
+
+            self._record_size(url, response.headers.get("Content-Range", ""))
+
+    async def chunk(self, url: str, index: int) -> bytes:
+        data = self._cache.get((url, index))
+        if data is not None:
+            return data
+
+        key = (url, index)
+        fetch = self._fetches.get(key)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._fetch_upstream(url, index))
+            self._fetches[key] = fetch
+            fetch.add_done_callback(lambda _: self._fetches.pop(key, None))
+
+        return await asyncio.shield(fetch)
+
+    async def size(self, url: str) -> int:
+        # None when the upstream does not tell the size ("bytes x-y/*")
+        if url not in self._sizes and url not in self._unknown_sizes:
+            await self.chunk(url, 0)
+        if url not in self._sizes and url not in self._unknown_sizes:
+            await self._probe_size(url)
+
+        return self._sizes.get(url)
+
+    async def _stream_unknown_size(self, request: web.Request, url: str):
+        # Without a size ranges can not be answered, the whole stream is sent
+        # with 200 until the upstream runs out of data.
+        response = web.StreamResponse(headers={"Content-Type": "audio/mpeg"})
+        await response.prepare(request)
+
+        index = 0
+        while True:
+            try:
+                data = await self.chunk(url, index)
+            except RequestError as error:
+                # a range beyond the end of the stream
+                if error.status != 416:
+                    raise
+                break
+
+            await response.write(data)
+            if len(data) < self._chunk_size:
+                break
+            index += 1
+
+        await response.write_eof()
+        return response
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        url = self._urls.get(request.match_info["track_id"])
+        if url is None:
+            raise web.HTTPNotFound()
+
+        try:
+            size = await self.size(url)
+        except RequestError as error:
+            raise web.HTTPBadGateway(
+                text=f"upstream answered {error.status}"
+            ) from error
+        if size is None:
+            return await self._stream_unknown_size(request, url)
+
+        first, last = 0, size - 1
+        status = 200
+        headers = {"Accept-Ranges": "bytes", "Content-Type": "audio/mpeg"}
+
+        if "Range" in request.headers:
+            byte_range = parse_range(request.headers["Range"], size)
+            if byte_range is None:
+                raise web.HTTPRequestRangeNotSatisfiable(
+                    headers={"Content-Range": f"bytes */{size}"}
+                )
+            first, last = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = last - first + 1
+        await response.prepare(request)
+
+        for index in range(first // self._chunk_size, last // self._chunk_size + 1):
+            data = await self.chunk(url, index)
+            chunk_start = index * self._chunk_size
+            begin = max(first - chunk_start, 0)
+            end = min(last - chunk_start + 1, len(data))
+            await response.write(data[begin:end])
+
+        await response.write_eof()
+        return response
@@ -0,0 +1,217 @@
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Tuple
+
+
+class CircuitState(Enum):
+    CLOSED = 1
+    OPEN = 2
+    HALF_OPEN = 3
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        slow_call_threshold: float = None,
+        reset_timeout: float = 30.0,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    def allow_request(self) -> bool:
+        if self._state is CircuitState.CLOSED:
+            return True
+
+        if self._state is CircuitState.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._state = CircuitState.HALF_OPEN
+            self._probe_in_flight = False
+
+        # half open, only a single probe may pass
+        if self._probe_in_flight:
+            return False
+
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self, duration: float) -> None:
+        if self.slow_call_threshold is not None and duration > self.slow_call_threshold:
+            self.record_failure()
+            return
+
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release(self) -> None:
+        # ends a call without an outcome, e.g. a cancelled one, so the next
+        # probe of a half open breaker may pass
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._consecutive_failures += 1
+        self._probe_in_flight = False
+        if (
+            self._state is CircuitState.HALF_OPEN
+            or self._consecutive_failures >= self.failure_threshold
+        ):
+            self._state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+
+
+class CircuitBreakers:
+    default_families = (
+        "feed",
+        "search",
+        "artist",
+        "artist_tracks",
+        "set",
+        "categories",
+    )
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        slow_call_threshold: float = None,
+        reset_timeout: float = 30.0,
+        families: Tuple[str, ...] = default_families,
+    ) -> None:
+        self._breakers = {
+            family: CircuitBreaker(
+                failure_threshold, slow_call_threshold, reset_timeout
+            )
+            for family in families
+        }
+
+    def for_family(self, route_family: str) -> CircuitBreaker:
+        return self._breakers.get(route_family)
+
+    def states(self) -> Dict[str, CircuitState]:
+        return {family: b.state for (family, b) in self._breakers.items()}
+
+
+class CacheLookup(NamedTuple):
+    value: Any
+    fresh: bool
+
+
+class CacheEntry(NamedTuple):
+    payload: Any
+    is_json: bool
+    stored_at: float
+
+
+class ResponseCache:
+    # Keeps responses for `ttl` seconds as fresh and up to `stale_ttl` seconds
+    # as stale. JSON documents are stored serialized, so callers can mutate
+    # the returned data without corrupting the cache.
+
+    def __init__(
+        self,
+        ttl: float = 60.0,
+        stale_ttl: float = 3600.0,
+        max_entries: int = 1024,
+        stale_while_revalidate: bool = False,
+    ) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.stale_while_revalidate = stale_while_revalidate
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> CacheLookup:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        age = time.monotonic() - entry.stored_at
+        if age > self.stale_ttl:
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return CacheLookup(self._decode(entry), age <= self.ttl)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+        is_json = isinstance(value, (list, dict))
+        entry = CacheEntry(self._encode(value, is_json), is_json, time.monotonic())
+        self._entries[key] = entry
+
+        while self._entries and self._over_capacity():
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        # removes the entries whose key matches, returns their number
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    # subclasses change how payloads are stored, e.g. compressed
+    def _over_capacity(self) -> bool:
+        return len(self._entries) > self.max_entries
+
+    def _remove(self, key: Hashable) -> None:
+        del self._entries[key]
+
+    def _encode(self, value: Any, is_json: bool) -> Any:
+        return json.dumps(value) if is_json else value
+
+    def _decode(self, entry: CacheEntry) -> Any:
+        return json.loads(entry.payload) if entry.is_json else entry.payload
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class ResponseInfo:
+    def __init__(self) -> None:
+        self.from_cache = False
+        self.stale = False
+
+
+_response_info: ContextVar[ResponseInfo] = ContextVar(
+    "pyhearthis_response_info", default=None
+)
+
+
+@contextmanager
+def response_info():
+    # Collects whether the calls made inside the block were answered from
+    # the cache and whether any of those answers was stale.
+    info = ResponseInfo()
+    token = _response_info.set(info)
+    try:
+        yield info
+    finally:
+        _response_info.reset(token)
+
+
+def mark_response(from_cache: bool, stale: bool = False) -> None:
+    info = _response_info.get()
+    if info is None:
+        return
+
+    info.from_cache = info.from_cache or from_cache
+    info.stale = info.stale or stale
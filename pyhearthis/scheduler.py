@@ -0,0 +1,193 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import Deque, Dict, NamedTuple
+
+
+class Priority(Enum):
+    INTERACTIVE = 1
+    DEFAULT = 2
+    BACKGROUND = 3
+
+
+_priority: ContextVar[Priority] = ContextVar("pyhearthis_priority", default=None)
+
+
+@contextmanager
+def request_priority(priority: Priority):
+    # Requests sent inside the block, including those of spawned tasks, are
+    # scheduled with the given priority.
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class ClassMetrics(NamedTuple):
+    queued: int
+    in_flight: int
+    dispatched: int
+    mean_wait: float
+    max_wait: float
+
+
+class _ClassState:
+    def __init__(self, weight: float) -> None:
+        self.weight = weight
+        self.waiters: Deque = deque()
+        self.in_flight = 0
+        self.virtual_time = 0.0
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+DEFAULT_WEIGHTS = {
+    Priority.INTERACTIVE: 8.0,
+    Priority.DEFAULT: 3.0,
+    Priority.BACKGROUND: 1.0,
+}
+
+# lookups a user waits for are interactive, paging and downloads background
+DEFAULT_FAMILY_PRIORITIES = {
+    "search": Priority.INTERACTIVE,
+    "artist": Priority.INTERACTIVE,
+    "artist_tracks": Priority.BACKGROUND,
+    "media": Priority.BACKGROUND,
+}
+
+
+class RequestScheduler:
+    # Hands out the connection slots of a client. Waiting requests are served
+    # with weighted fair queuing between the priority classes: a class with
+    # weight 3 gets three slots for every slot of a class with weight 1 while
+    # both are waiting. `reserved` slots are only used by interactive
+    # requests, so those never wait behind a crawl, however long its queue.
+    #
+    # The priority of a request comes from request_priority, otherwise from
+    # its route family (DEFAULT_FAMILY_PRIORITIES).
+
+    def __init__(
+        self,
+        slots: int = 8,
+        reserved: int = 2,
+        weights: Dict[Priority, float] = None,
+        family_priorities: Dict[str, Priority] = None,
+    ) -> None:
+        assert 0 <= reserved < slots, "reserved slots have to leave shared slots"
+
+        self.slots = slots
+        self.reserved = reserved
+        weights = dict(DEFAULT_WEIGHTS, **(weights or dict()))
+        self.family_priorities = dict(
+            DEFAULT_FAMILY_PRIORITIES, **(family_priorities or dict())
+        )
+        self._classes = {
+            priority: _ClassState(weights[priority]) for priority in Priority
+        }
+        self._in_flight = 0
+        self._shared_in_flight = 0
+        self._virtual_time = 0.0
+
+    def priority_for(self, route_family: str = None) -> Priority:
+        priority = _priority.get()
+        if priority is not None:
+            return priority
+
+        return self.family_priorities.get(route_family, Priority.DEFAULT)
+
+    def _can_run(self, priority: Priority) -> bool:
+        if self._in_flight >= self.slots:
+            return False
+
+        if priority is Priority.INTERACTIVE:
+            return True
+
+        return self._shared_in_flight < self.slots - self.reserved
+
+    def _start(self, priority: Priority, waited: float) -> None:
+        state = self._classes[priority]
+        state.virtual_time = max(state.virtual_time, self._virtual_time)
+        self._virtual_time = state.virtual_time
+        state.virtual_time += 1.0 / state.weight
+        state.in_flight += 1
+        state.dispatched += 1
+        state.total_wait += waited
+        state.max_wait = max(state.max_wait, waited)
+        self._in_flight += 1
+        if priority is not Priority.INTERACTIVE:
+            self._shared_in_flight += 1
+
+    def _dispatch(self) -> None:
+        while True:
+            candidates = [
+                (state.virtual_time, priority.value, priority)
+                for (priority, state) in self._classes.items()
+                if state.waiters and self._can_run(priority)
+            ]
+            if not candidates:
+                return
+
+            _, _, priority = min(candidates)
+            future, enqueued_at = self._classes[priority].waiters.popleft()
+            if future.done():
+                continue
+
+            self._start(priority, time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+    def _finish(self, priority: Priority) -> None:
+        self._classes[priority].in_flight -= 1
+        self._in_flight -= 1
+        if priority is not Priority.INTERACTIVE:
+            self._shared_in_flight -= 1
+        self._dispatch()
+
+    async def _acquire(self, priority: Priority) -> None:
+        state = self._classes[priority]
+        # drop waiters which were cancelled before they got a slot
+        while state.waiters and state.waiters[0][0].done():
+            state.waiters.popleft()
+
+        if not state.waiters and self._can_run(priority):
+            self._start(priority, 0.0)
+            return
+
+        if not state.waiters:
+            # an idle class does not collect credit for the time it was idle
+            state.virtual_time = max(state.virtual_time, self._virtual_time)
+
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.append((future, time.monotonic()))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was granted while the waiter got cancelled
+                self._finish(priority)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, route_family: str = None):
+        priority = self.priority_for(route_family)
+        await self._acquire(priority)
+        try:
+            yield priority
+        finally:
+            self._finish(priority)
+
+    def metrics(self) -> Dict[Priority, ClassMetrics]:
+        return {
+            priority: ClassMetrics(
+                sum(1 for (future, _) in state.waiters if not future.done()),
+                state.in_flight,
+                state.dispatched,
+                state.total_wait / state.dispatched if state.dispatched else 0.0,
+                state.max_wait,
+            )
+            for (priority, state) in self._classes.items()
+        }
@@ -0,0 +1,253 @@
+import abc
+import asyncio
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .errors import AuthenticationError
+from .hearthis import HearThis
+from .models import LoggedinUser
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on windows
+    fcntl = None
+
+
+def _create_private_file(path: str) -> None:
+    # the file holds credentials, only the owner may read it
+    descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    os.close(descriptor)
+    os.chmod(path, 0o600)
+
+
+def _same_credentials(user: LoggedinUser, other: LoggedinUser) -> bool:
+    if user is None or other is None:
+        return user is other
+
+    return (user.key, user.secret) == (other.key, other.secret)
+
+
+class SessionStore(abc.ABC):
+    # Base class of the credential stores. Entries are keyed by the login
+    # email. The lock is held across processes while one of them logs in.
+    # It relies on fcntl: where that is missing (windows) the lock file is
+    # created but not locked, so only the logins within one process are
+    # serialized and concurrently starting processes may each log in.
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock_path = f"{path}.lock"
+
+    @abc.abstractmethod
+    def load(self, email: str) -> LoggedinUser:
+        pass
+
+    @abc.abstractmethod
+    def save(self, email: str, user: LoggedinUser) -> None:
+        pass
+
+    @abc.abstractmethod
+    def delete(self, email: str) -> None:
+        pass
+
+    def acquire(self, blocking: bool = True):
+        # returns None when the lock is held elsewhere and blocking is False
+        _create_private_file(self._lock_path)
+        file = open(self._lock_path, "r+")
+        if fcntl is None:
+            return file
+
+        try:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(file.fileno(), flags)
+        except BlockingIOError:
+            file.close()
+            return None
+
+        return file
+
+    def release(self, file) -> None:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        file.close()
+
+    @contextmanager
+    def lock(self):
+        file = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(file)
+
+
+class FileSessionStore(SessionStore):
+    # All sessions in one json file, replaced atomically on every change.
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return dict()
+
+    def _write(self, sessions: dict) -> None:
+        temporary_path = f"{self.path}.tmp"
+        _create_private_file(temporary_path)
+        with open(temporary_path, "w") as file:
+            json.dump(sessions, file)
+        os.replace(temporary_path, self.path)
+
+    def load(self, email: str) -> LoggedinUser:
+        data = self._read().get(email)
+        return None if data is None else LoggedinUser(**data["user"])
+
+    def save(self, email: str, user: LoggedinUser) -> None:
+        sessions = self._read()
+        sessions[email] = dict(user=user._asdict(), stored_at=time.time())
+        self._write(sessions)
+
+    def delete(self, email: str) -> None:
+        sessions = self._read()
+        if sessions.pop(email, None) is not None:
+            self._write(sessions)
+
+
+class SqliteSessionStore(SessionStore):
+    # The connection is shared by the executor threads of the session
+    # managers, every statement runs under a lock.
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        _create_private_file(path)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection_lock = threading.Lock()
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS sessions (
+                email TEXT PRIMARY KEY,
+                user TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )"""
+        )
+        self._connection.commit()
+
+    def load(self, email: str) -> LoggedinUser:
+        with self._connection_lock:
+            row = self._connection.execute(
+                "SELECT user FROM sessions WHERE email = ?", (email,)
+            ).fetchone()
+        return None if row is None else LoggedinUser(**json.loads(row[0]))
+
+    def save(self, email: str, user: LoggedinUser) -> None:
+        with self._connection_lock:
+            self._connection.execute(
+                """INSERT OR REPLACE INTO sessions (email, user, stored_at)
+                   VALUES (?, ?, ?)""",
+                (email, json.dumps(user._asdict()), time.time()),
+            )
+            self._connection.commit()
+
+    def delete(self, email: str) -> None:
+        with self._connection_lock:
+            self._connection.execute("DELETE FROM sessions WHERE email = ?", (email,))
+            self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class SessionManager:
+    # Provides the logged in user of an account. Stored credentials are used
+    # without a check, the first call which is rejected with an
+    # AuthenticationError triggers a new login and is repeated once. Logins
+    # are serialized within the process and, through the store lock, across
+    # processes: whoever waited for the lock picks up the fresh credentials
+    # instead of logging in again.
+    #
+    # Methods of HearThis which expect the user as first argument are
+    # available with the user filled in, e.g. manager.get_feeds(page=2).
+
+    def __init__(
+        self, hearthis: HearThis, store: SessionStore, email: str, password: str
+    ) -> None:
+        self._hearthis = hearthis
+        self._store = store
+        self._email = email
+        self._password = password
+        self._user: LoggedinUser = None
+        self._login_lock = asyncio.Lock()
+        self.lock_poll_interval = 0.05
+        self.logins = 0
+
+    async def _run_blocking(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, function, *args)
+
+    async def user(self) -> LoggedinUser:
+        if self._user is not None:
+            return self._user
+
+        async with self._login_lock:
+            if self._user is None:
+                self._user = await self._run_blocking(self._store.load, self._email)
+            if self._user is None:
+                self._user = await self._login(None)
+
+            return self._user
+
+    async def _acquire(self):
+        # polls instead of blocking executor threads, which the lock holder
+        # may need to finish its login
+        while True:
+            lock = self._store.acquire(blocking=False)
+            if lock is not None:
+                return lock
+
+            await asyncio.sleep(self.lock_poll_interval)
+
+    async def _login(self, rejected: LoggedinUser) -> LoggedinUser:
+        lock = await self._acquire()
+        try:
+            stored = await self._run_blocking(self._store.load, self._email)
+            if stored is not None and not _same_credentials(stored, rejected):
+                return stored
+
+            user = await self._hearthis.login(self._email, self._password)
+            self.logins += 1
+            await self._run_blocking(self._store.save, self._email, user)
+            return user
+        finally:
+            self._store.release(lock)
+
+    async def relogin(self, rejected: LoggedinUser) -> LoggedinUser:
+        async with self._login_lock:
+            # another call may have replaced the rejected user already
+            if self._user is None or _same_credentials(self._user, rejected):
+                self._user = await self._login(rejected)
+
+            return self._user
+
+    async def call(self, method_name: str, *args, **kwargs):
+        method = getattr(self._hearthis, method_name)
+        user = await self.user()
+        try:
+            return await method(user, *args, **kwargs)
+        except AuthenticationError:
+            user = await self.relogin(user)
+            return await method(user, *args, **kwargs)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._hearthis, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        parameters = list(inspect.signature(attribute).parameters)
+        if len(parameters) == 0 or parameters[0] != "user":
+            return attribute
+
+        return functools.partial(self.call, name)
@@ -0,0 +1,431 @@
+import bisect
+import hashlib
+import heapq
+import math
+from typing import (
+    AsyncIterator,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    NamedTuple,
+    Sequence,
+    Union,
+)
+
+from .models import SingleTrack
+
+QUANTILE_FIELDS = ("duration", "bpm", "playback_count", "favoritings_count")
+
+# a duration or bpm of 0 means the value is unknown
+_POSITIVE_FIELDS = ("duration", "bpm")
+
+
+class HeavyHitter(NamedTuple):
+    # the true count lies between count - error and count
+    item: Hashable
+    count: int
+    error: int
+
+
+class StatisticsSummary(NamedTuple):
+    count: int
+    quantiles: Dict[str, Dict[float, float]]
+    distinct_tracks: int
+    distinct_artists: int
+    top_tags: List[HeavyHitter]
+    top_genres: List[HeavyHitter]
+
+
+class TDigest:
+    # Quantile sketch of a stream of numbers (merging t-digest). Values are
+    # buffered and merged into at most about `compression` centroids, which
+    # are small close to the minimum and maximum, so extreme quantiles stay
+    # accurate.
+
+    def __init__(self, compression: float = 100.0) -> None:
+        self.compression = compression
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._means: List[float] = []
+        self._weights: List[float] = []
+        self._buffer: List[tuple] = []
+        self._buffer_size = int(5 * compression)
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        self._buffer.append((value, weight))
+        self.count += weight
+        if len(self._buffer) >= self._buffer_size:
+            self._compress()
+
+    def _limit(self, q: float) -> float:
+        # the quantile up to which a centroid starting at q may grow, from
+        # the scale function k(q) = compression / 2pi * asin(2q - 1)
+        k = self.compression / (2 * math.pi) * math.asin(2 * q - 1) + 1
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _centroids(self) -> List[tuple]:
+        # (mean, weight) pairs, the lists always have the same length
+        return [(self._means[i], self._weights[i]) for i in range(len(self._means))]
+
+    def _compress(self) -> None:
+        if not self._buffer:
+            return
+
+        centroids = sorted(self._centroids() + self._buffer)
+        self._buffer = []
+        # the extremes are only tracked here, add stays cheap
+        self.min = min(self.min, centroids[0][0])
+        self.max = max(self.max, centroids[-1][0])
+        means = []
+        weights = []
+        cumulative = 0.0
+        mean, weight = centroids[0]
+        limit = self._limit(0.0)
+        for next_mean, next_weight in centroids[1:]:
+            if (cumulative + weight + next_weight) / self.count <= limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+                continue
+
+            means.append(mean)
+            weights.append(weight)
+            cumulative += weight
+            limit = self._limit(cumulative / self.count)
+            mean, weight = next_mean, next_weight
+
+        means.append(mean)
+        weights.append(weight)
+        self._means = means
+        self._weights = weights
+
+    def merge(self, other: "TDigest") -> None:
+        self._compress()
+        other._compress()
+        self._buffer.extend(other._centroids())
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def quantile(self, q: float) -> float:
+        assert 0.0 <= q <= 1.0, "q has to be between 0 and 1"
+
+        self._compress()
+        if not self._means:
+            return None
+        if len(self._means) == 1 or q == 0.0:
+            return self.min if q == 0.0 else self._means[0]
+        if q == 1.0:
+            return self.max
+
+        # the weight of a centroid is spread evenly around its mean
+        centers = []
+        cumulative = 0.0
+        for weight in self._weights:
+            centers.append(cumulative + weight / 2)
+            cumulative += weight
+
+        target = q * self.count
+        if target <= centers[0]:
+            return self.min + (self._means[0] - self.min) * target / centers[0]
+        if target >= centers[-1]:
+            rest = self.count - centers[-1]
+            return self._means[-1] + (self.max - self._means[-1]) * (
+                (target - centers[-1]) / rest
+            )
+
+        index = bisect.bisect_right(centers, target) - 1
+        fraction = (target - centers[index]) / (centers[index + 1] - centers[index])
+        return self._means[index] + fraction * (
+            self._means[index + 1] - self._means[index]
+        )
+
+    def __len__(self) -> int:
+        self._compress()
+        return len(self._means)
+
+
+def _hash64(value) -> int:
+    # stable across processes, unlike hash() of strings
+    digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog:
+    # Distinct count sketch with 2^precision one byte registers. The
+    # standard error is about 1.04 / sqrt(2^precision), 0.8% for 14.
+
+    def __init__(self, precision: int = 14) -> None:
+        assert 4 <= precision <= 18, "precision has to be between 4 and 18"
+
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+        self._rest_bits = 64 - precision
+        self._rest_mask = (1 << self._rest_bits) - 1
+
+    def add(self, value) -> None:
+        self.add_hash(_hash64(value))
+
+    def add_hash(self, hashed: int) -> None:
+        index = hashed >> self._rest_bits
+        rank = self._rest_bits - (hashed & self._rest_mask).bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("only sketches with the same precision can be merged")
+
+        self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def count(self) -> int:
+        registers = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / registers)
+        estimate = alpha * registers**2 / sum(2.0**-rank for rank in self._registers)
+
+        # linear counting is more accurate for small cardinalities
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * registers and zeros > 0:
+            estimate = registers * math.log(registers / zeros)
+
+        return round(estimate)
+
+    def __len__(self) -> int:
+        return self.count()
+
+
+class SpaceSaving:
+    # Top-k sketch. At most k items are counted, a new item replaces the
+    # item with the smallest count and inherits that count as its error.
+    #
+    # The smallest count is found with a heap whose entries are only updated
+    # when they reach the top, so counting a known item stays O(1).
+
+    def __init__(self, k: int = 50) -> None:
+        assert k > 0, "k has to be positive"
+
+        self.k = k
+        self.total = 0
+        self._counters: Dict[Hashable, list] = dict()
+        self._heap: List[tuple] = list()
+        self._sequence = 0
+
+    def _push(self, item: Hashable, count: int) -> None:
+        self._sequence += 1
+        heapq.heappush(self._heap, (count, self._sequence, item))
+
+    def _evict(self) -> int:
+        # removes the item with the smallest count and returns its count
+        while True:
+            count, _, item = heapq.heappop(self._heap)
+            current = self._counters.get(item)
+            if current is None:
+                continue
+            if current[0] != count:
+                self._push(item, current[0])
+            else:
+                del self._counters[item]
+                return count
+
+    def add(self, item: Hashable, count: int = 1) -> None:
+        self.total += count
+        current = self._counters.get(item)
+        if current is not None:
+            current[0] += count
+            return
+
+        floor = self._evict() if len(self._counters) >= self.k else 0
+        self._counters[item] = [floor + count, floor]
+        self._push(item, floor + count)
+
+    def _floor(self) -> int:
+        # the largest count an item missing from a full sketch may have
+        if len(self._counters) < self.k:
+            return 0
+        return min(counter[0] for counter in self._counters.values())
+
+    def merge(self, other: "SpaceSaving") -> None:
+        floor = self._floor()
+        other_floor = other._floor()
+        merged = dict()
+        for item in self._counters.keys() | other._counters.keys():
+            count, error = self._counters.get(item, (floor, floor))
+            other_count, other_error = other._counters.get(
+                item, (other_floor, other_floor)
+            )
+            merged[item] = [count + other_count, error + other_error]
+
+        kept = sorted(merged, key=lambda key: merged[key][0], reverse=True)
+        self._counters = {item: merged[item] for item in kept[: self.k]}
+        self._heap = list()
+        for item, (count, _) in self._counters.items():
+            self._push(item, count)
+        self.total += other.total
+
+    def top(self, n: int = None) -> List[HeavyHitter]:
+        hitters = [
+            HeavyHitter(item, count, error)
+            for (item, (count, error)) in self._counters.items()
+        ]
+        hitters.sort(key=lambda hitter: (-hitter.count, str(hitter.item)))
+        return hitters[:n]
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _artist_id(track: SingleTrack):
+    if track.user_id:
+        return track.user_id
+
+    user = track.user
+    return user.get("id") if isinstance(user, dict) else getattr(user, "id", None)
+
+
+class _TrackFeatures(NamedTuple):
+    # what the sketches need of a track, computed once for all groups
+    values: list
+    track_hash: int
+    artist_id: str
+    artist_hash: int
+    tags: list
+    genre: str
+
+    @classmethod
+    def of(cls, track: SingleTrack) -> "_TrackFeatures":
+        values = []
+        for field in QUANTILE_FIELDS:
+            value = _as_float(getattr(track, field))
+            if value is None or (value <= 0 and field in _POSITIVE_FIELDS):
+                continue
+            values.append((field, value))
+
+        artist_id = _artist_id(track)
+        return cls(
+            values,
+            _hash64(track.id),
+            artist_id,
+            None if artist_id is None else _hash64(artist_id),
+            track.tags_arr or [],
+            track.genre,
+        )
+
+
+class TrackSketches:
+    # The sketches of one group of tracks. Memory does not grow with the
+    # number of tracks.
+
+    def __init__(
+        self, compression: float = 100.0, precision: int = 14, top_k: int = 50
+    ) -> None:
+        self.count = 0
+        self.quantiles = {field: TDigest(compression) for field in QUANTILE_FIELDS}
+        self.tracks = HyperLogLog(precision)
+        self.artists = HyperLogLog(precision)
+        self.tags = SpaceSaving(top_k)
+        self.genres = SpaceSaving(top_k)
+
+    def add(self, track: SingleTrack) -> None:
+        self._add_features(_TrackFeatures.of(track))
+
+    def _add_features(self, features: "_TrackFeatures") -> None:
+        self.count += 1
+        for field, value in features.values:
+            self.quantiles[field].add(value)
+        self.tracks.add_hash(features.track_hash)
+        if features.artist_hash is not None:
+            self.artists.add_hash(features.artist_hash)
+        for tag in features.tags:
+            self.tags.add(tag)
+        if features.genre:
+            self.genres.add(features.genre)
+
+    def merge(self, other: "TrackSketches") -> None:
+        self.count += other.count
+        for field, digest in self.quantiles.items():
+            digest.merge(other.quantiles[field])
+        self.tracks.merge(other.tracks)
+        self.artists.merge(other.artists)
+        self.tags.merge(other.tags)
+        self.genres.merge(other.genres)
+
+    def summary(
+        self, quantiles: Sequence[float] = (0.5, 0.9, 0.99), top: int = 10
+    ) -> StatisticsSummary:
+        return StatisticsSummary(
+            self.count,
+            {
+                field: {q: digest.quantile(q) for q in quantiles}
+                for (field, digest) in self.quantiles.items()
+            },
+            self.tracks.count(),
+            self.artists.count(),
+            self.tags.top(top),
+            self.genres.top(top),
+        )
+
+
+class CatalogStatistics:
+    # Sketches of all tracks plus sketches per genre and per artist. There
+    # may be many groups, so they use smaller sketches. Statistics of
+    # parallel workers (e.g. one per category) are combined with merge, the
+    # sketches can be pickled to move them between processes.
+
+    def __init__(
+        self,
+        compression: float = 100.0,
+        precision: int = 14,
+        top_k: int = 50,
+        group_compression: float = 25.0,
+        group_precision: int = 8,
+        group_top_k: int = 10,
+    ) -> None:
+        self.overall = TrackSketches(compression, precision, top_k)
+        self.by_genre: Dict[str, TrackSketches] = dict()
+        self.by_artist: Dict[str, TrackSketches] = dict()
+        self._group_options = (group_compression, group_precision, group_top_k)
+
+    def _group(self, groups: Dict[str, TrackSketches], key) -> TrackSketches:
+        sketches = groups.get(key)
+        if sketches is None:
+            sketches = TrackSketches(*self._group_options)
+            groups[key] = sketches
+        return sketches
+
+    def add(self, track: SingleTrack) -> None:
+        features = _TrackFeatures.of(track)
+        self.overall._add_features(features)
+        if features.genre:
+            self._group(self.by_genre, features.genre)._add_features(features)
+        if features.artist_id is not None:
+            artist = self._group(self.by_artist, str(features.artist_id))
+            artist._add_features(features)
+
+    async def consume(
+        self, tracks: Union[AsyncIterator[SingleTrack], Iterable[SingleTrack]]
+    ) -> "CatalogStatistics":
+        if hasattr(tracks, "__aiter__"):
+            async for track in tracks:
+                self.add(track)
+        else:
+            for track in tracks:
+                self.add(track)
+
+        return self
+
+    def merge(self, other: "CatalogStatistics") -> None:
+        self.overall.merge(other.overall)
+        for groups, other_groups in [
+            (self.by_genre, other.by_genre),
+            (self.by_artist, other.by_artist),
+        ]:
+            for key, sketches in other_groups.items():
+                self._group(groups, key).merge(sketches)
@@ -0,0 +1,131 @@
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import threading
+from typing import Any, Callable, Iterable, List
+
+import aiohttp
+
+from .hearthis import HearThis
+
+
+class HearThisSync:
+    # Blocking facade for synchronous callers. A single event loop and client
+    # session run on a background thread for the lifetime of the facade, so
+    # connections are reused across calls. Every coroutine method of HearThis
+    # is available as a blocking method and may be called from any thread.
+
+    def __init__(
+        self,
+        session_factory: Callable[[], aiohttp.ClientSession] = None,
+        timeout: float = None,
+        **client_kwargs,
+    ) -> None:
+        self._timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop, name="pyhearthis-loop", daemon=True
+        )
+        self._thread.start()
+        self._closed = False
+        self._close_lock = threading.Lock()
+
+        try:
+            self._session = self._run(self._create_session(session_factory))
+        except BaseException:
+            # without a session the facade is unusable, the loop must not leak
+            self._closed = True
+            self._stop_loop()
+            raise
+        self._client = HearThis(self._session, **client_kwargs)
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    @staticmethod
+    async def _create_session(session_factory) -> aiohttp.ClientSession:
+        if session_factory is None:
+            return aiohttp.ClientSession()
+
+        return session_factory()
+
+    def _run(self, coroutine, timeout: float = None):
+        if threading.current_thread() is self._thread:
+            coroutine.close()
+            raise RuntimeError("blocking calls are not allowed on the client loop")
+
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        try:
+            return future.result(self._timeout if timeout is None else timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    @property
+    def client(self) -> HearThis:
+        return self._client
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        method = getattr(self._client, name)
+        if not inspect.iscoroutinefunction(method):
+            return method
+
+        @functools.wraps(method)
+        def blocking(*args, **kwargs):
+            return self._run(method(*args, **kwargs))
+
+        return blocking
+
+    def map(
+        self,
+        method_name: str,
+        arguments: Iterable[Any],
+        concurrency: int = 10,
+        return_exceptions: bool = False,
+        timeout: float = None,
+    ) -> List[Any]:
+        # Runs the given method once per argument concurrently on the client
+        # loop. Tuples are expanded into positional arguments.
+        method = getattr(self._client, method_name)
+        calls = [args if isinstance(args, tuple) else (args,) for args in arguments]
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def run_one(args):
+                async with semaphore:
+                    return await method(*args)
+
+            return await asyncio.gather(
+                *[run_one(args) for args in calls],
+                return_exceptions=return_exceptions,
+            )
+
+        return self._run(run_all(), timeout)
+
+    def close(self) -> None:
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        try:
+            self._run(self._session.close())
+        finally:
+            self._stop_loop()
+
+    def _stop_loop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self) -> "HearThisSync":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -0,0 +1,287 @@
+import asyncio
+import heapq
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Sequence, Set
+
+from .hearthis import HearThis
+from .models import LoggedinUser, SingleTrack
+from .ranking import RankKey, rank_value
+from .ratelimit import TokenBucket
+
+
+class NewTrack(NamedTuple):
+    permalink: str
+    track: SingleTrack
+
+
+class ArtistStats(NamedTuple):
+    permalink: str
+    interval: float
+    polls: int
+    failures: int
+    new_tracks: int
+    high_water: int
+
+
+def adaptive_interval(
+    upload_times: Sequence[int],
+    fraction: float,
+    min_interval: float,
+    max_interval: float,
+    default: float,
+) -> float:
+    # Polls an artist `fraction` of its mean time between uploads, so an
+    # artist uploading daily is polled a few times a day and one uploading
+    # twice a year about once a day (with the default bounds).
+    if len(upload_times) < 2:
+        return default
+
+    ordered = sorted(upload_times)
+    mean_gap = (ordered[-1] - ordered[0]) / (len(ordered) - 1)
+    return min(max(mean_gap * fraction, min_interval), max_interval)
+
+
+class Subscription:
+    # Queue of new tracks for one consumer. A full queue drops the oldest
+    # entry, a slow consumer never blocks the poller or other subscribers.
+
+    def __init__(self, watchlist: "Watchlist", queue_size: int) -> None:
+        self._watchlist = watchlist
+        self._queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.dropped = 0
+
+    def _publish(self, new_track: NewTrack) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(new_track)
+
+    async def get(self) -> NewTrack:
+        return await self._queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> NewTrack:
+        return await self.get()
+
+    def close(self) -> None:
+        self._watchlist._subscriptions.discard(self)
+
+
+class _ArtistState:
+    def __init__(self, permalink: str, interval: float, history: int) -> None:
+        self.permalink = permalink
+        self.interval = interval
+        self.upload_times: Deque[int] = deque(maxlen=history)
+        self.high_water = None
+        self.high_water_ids: Set = set()
+        self.polls = 0
+        self.failures = 0
+        self.new_tracks = 0
+
+
+class Watchlist:
+    # Polls the newest tracks of many artists. Every artist has its own poll
+    # interval derived from its upload history (unix_created_at), polls are
+    # spread by jitter and limited by a global rate of polls per second, where
+    # every further page of a poll counts as a poll of its own.
+    # Tracks newer than the high-water mark of an artist are published to all
+    # subscribers. The first poll of an artist only sets its mark.
+
+    def __init__(
+        self,
+        hearthis: HearThis,
+        user: LoggedinUser,
+        polls_per_second: float = 2.0,
+        concurrency: int = 8,
+        min_interval: float = 15 * 60,
+        max_interval: float = 24 * 60 * 60,
+        initial_interval: float = 60 * 60,
+        interval_fraction: float = 0.25,
+        jitter: float = 0.2,
+        history: int = 20,
+        page_size: int = 20,
+        max_pages: int = 3,
+        subscriber_queue_size: int = 1000,
+    ) -> None:
+        assert 0 <= jitter < 1, "jitter has to be below 1"
+
+        self._hearthis = hearthis
+        self._user = user
+        self._budget = TokenBucket(polls_per_second, max(1.0, polls_per_second))
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.interval_fraction = interval_fraction
+        self.jitter = jitter
+        self.history = history
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.subscriber_queue_size = subscriber_queue_size
+        self._artists: Dict[str, _ArtistState] = dict()
+        self._schedule: List[tuple] = list()
+        self._sequence = 0
+        self._subscriptions: Set[Subscription] = set()
+        self._changed = asyncio.Event()
+        self._polls: Set[asyncio.Future] = set()
+        self._stopping = False
+
+    def __len__(self) -> int:
+        return len(self._artists)
+
+    def _schedule_poll(self, state: _ArtistState, delay: float) -> None:
+        spread = random.uniform(1 - self.jitter, 1 + self.jitter)
+        self._sequence += 1
+        # the entry holds the state, an artist removed and added again is
+        # not polled by the entry of its old state
+        heapq.heappush(
+            self._schedule, (time.monotonic() + delay * spread, self._sequence, state)
+        )
+        self._changed.set()
+
+    def add(self, permalink: str) -> None:
+        if permalink in self._artists:
+            return
+
+        state = _ArtistState(permalink, self.initial_interval, self.history)
+        self._artists[permalink] = state
+        # the first polls are spread over the first minimum interval
+        self._schedule_poll(state, random.uniform(0, self.min_interval))
+
+    def remove(self, permalink: str) -> None:
+        self._artists.pop(permalink, None)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self, self.subscriber_queue_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def stats(self, permalink: str) -> ArtistStats:
+        state = self._artists[permalink]
+        return ArtistStats(
+            permalink,
+            state.interval,
+            state.polls,
+            state.failures,
+            state.new_tracks,
+            state.high_water,
+        )
+
+    def _new_tracks(self, state: _ArtistState, tracks: List[SingleTrack]) -> list:
+        if state.high_water is None:
+            return []
+
+        new_tracks = []
+        for track in tracks:
+            created = rank_value(track, RankKey.RECENCY)
+            # several uploads may share the second of the mark
+            if created > state.high_water or (
+                created == state.high_water and track.id not in state.high_water_ids
+            ):
+                new_tracks.append(track)
+
+        return new_tracks
+
+    def _advance(self, state: _ArtistState, tracks: List[SingleTrack]) -> None:
+        # the history keeps the newest upload times in ascending order
+        for created, track_id in sorted(
+            (rank_value(track, RankKey.RECENCY), track.id) for track in tracks
+        ):
+            if not state.upload_times or created > state.upload_times[-1]:
+                state.upload_times.append(created)
+
+            if state.high_water is None or created > state.high_water:
+                state.high_water = created
+                state.high_water_ids = {track_id}
+            elif created == state.high_water:
+                state.high_water_ids.add(track_id)
+
+    async def _fetch(self, state: _ArtistState) -> List[SingleTrack]:
+        # further pages are only needed when a whole page is new
+        tracks = []
+        for page in range(1, self.max_pages + 1):
+            await self._budget.acquire()
+            items = await self._hearthis.get_artist_tracks(
+                self._user, state.permalink, page=page, count=self.page_size
+            )
+            tracks.extend(items)
+            if len(items) < self.page_size or state.high_water is None:
+                break
+            if len(self._new_tracks(state, items)) < len(items):
+                break
+
+        return tracks
+
+    async def _poll(self, state: _ArtistState) -> None:
+        try:
+            tracks = await self._fetch(state)
+        except Exception:
+            state.failures += 1
+            state.interval = min(state.interval * 2, self.max_interval)
+        else:
+            new_tracks = self._new_tracks(state, tracks)
+            self._advance(state, tracks)
+            state.interval = adaptive_interval(
+                state.upload_times,
+                self.interval_fraction,
+                self.min_interval,
+                self.max_interval,
+                self.initial_interval,
+            )
+            state.new_tracks += len(new_tracks)
+            new_tracks.sort(key=lambda track: rank_value(track, RankKey.RECENCY))
+            for track in new_tracks:
+                for subscription in list(self._subscriptions):
+                    subscription._publish(NewTrack(state.permalink, track))
+        finally:
+            state.polls += 1
+
+        if self._artists.get(state.permalink) is state:
+            self._schedule_poll(state, state.interval)
+
+    async def _next_due(self) -> _ArtistState:
+        # returns None once the watchlist is stopped
+        while not self._stopping:
+            self._changed.clear()
+            if not self._schedule:
+                await self._changed.wait()
+                continue
+
+            due, _, state = self._schedule[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._schedule)
+            if self._artists.get(state.permalink) is state:
+                return state
+
+    async def run(self) -> None:
+        self._stopping = False
+        try:
+            while not self._stopping:
+                state = await self._next_due()
+                if state is None:
+                    break
+                # a poll holds a slot until it is done, also when it was
+                # cancelled before it started
+                await self._semaphore.acquire()
+                poll = asyncio.ensure_future(self._poll(state))
+                self._polls.add(poll)
+                poll.add_done_callback(self._polls.discard)
+                poll.add_done_callback(lambda _: self._semaphore.release())
+        finally:
+            for poll in list(self._polls):
+                poll.cancel()
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._changed.set()
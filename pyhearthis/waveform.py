@@ -0,0 +1,145 @@
+import asyncio
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Sequence
+
+from .hearthis import HearThis
+from .models import SingleTrack
+
+
+class WaveformWindow(NamedTuple):
+    minimums: List[int]
+    maximums: List[int]
+
+
+def _reduce(values: array, reducer) -> array:
+    # pairwise reduction, runs in C through map over two strided slices
+    reduced = array(values.typecode, map(reducer, values[0::2], values[1::2]))
+    if len(values) % 2 == 1:
+        reduced.append(values[-1])
+    return reduced
+
+
+class WaveformPyramid:
+    # Min/max summaries of a waveform at power of two resolutions. Level 0
+    # holds the samples themselves, every further level halves the count.
+
+    def __init__(self, samples: Sequence[int]) -> None:
+        typecode = "B" if all(0 <= s <= 255 for s in samples) else "l"
+        minimums = array(typecode, samples)
+        maximums = array(typecode, samples)
+        self._levels = [(minimums, maximums)]
+
+        while len(minimums) > 1:
+            minimums = _reduce(minimums, min)
+            maximums = _reduce(maximums, max)
+            self._levels.append((minimums, maximums))
+
+    @property
+    def sample_count(self) -> int:
+        return len(self._levels[0][0])
+
+    @property
+    def level_count(self) -> int:
+        return len(self._levels)
+
+    def _level_for(self, span: float, pixels: int) -> int:
+        # the coarsest level which still has at least one bucket per pixel
+        level = 0
+        while level + 1 < len(self._levels) and span / 2 ** (level + 1) >= pixels:
+            level += 1
+        return level
+
+    def window(self, start: float, end: float, pixels: int) -> WaveformWindow:
+        # start and end are relative positions within the track (0.0 - 1.0)
+        assert 0.0 <= start < end <= 1.0, "invalid window"
+        assert pixels > 0, "at least one pixel is required"
+
+        count = self.sample_count
+        if count == 0:
+            return WaveformWindow([], [])
+
+        first = start * count
+        span = (end - start) * count
+        level = self._level_for(span, pixels)
+        minimums, maximums = self._levels[level]
+        scale = 2**level
+
+        result_minimums = []
+        result_maximums = []
+        for pixel in range(pixels):
+            begin = int((first + span * pixel / pixels) / scale)
+            stop = int(-(-(first + span * (pixel + 1) / pixels) // scale))
+            begin = min(begin, len(minimums) - 1)
+            stop = min(max(stop, begin + 1), len(minimums))
+            result_minimums.append(min(minimums[begin:stop]))
+            result_maximums.append(max(maximums[begin:stop]))
+
+        return WaveformWindow(result_minimums, result_maximums)
+
+
+class WaveformCache:
+    # Pyramids keyed by track id. An entry is rebuilt when the
+    # update_timestamp of the requested track differs from the cached one.
+
+    def __init__(self, hearthis: HearThis, max_tracks: int = 1000) -> None:
+        self._hearthis = hearthis
+        self.max_tracks = max_tracks
+        self._entries: "OrderedDict[object, tuple]" = OrderedDict()
+        self._builds: Dict[object, asyncio.Future] = dict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _cached(self, track: SingleTrack) -> WaveformPyramid:
+        entry = self._entries.get(track.id)
+        if entry is None or entry[0] != track.update_timestamp:
+            return None
+
+        self._entries.move_to_end(track.id)
+        return entry[1]
+
+    def _store(self, track: SingleTrack, pyramid: WaveformPyramid) -> None:
+        self._entries[track.id] = (track.update_timestamp, pyramid)
+        self._entries.move_to_end(track.id)
+        while len(self._entries) > self.max_tracks:
+            self._entries.popitem(last=False)
+
+    async def _build(self, track: SingleTrack) -> WaveformPyramid:
+        samples = await self._hearthis.get_waveform_samples(track)
+        pyramid = WaveformPyramid(samples)
+        self._store(track, pyramid)
+        return pyramid
+
+    async def get(self, track: SingleTrack) -> WaveformPyramid:
+        pyramid = self._cached(track)
+        if pyramid is not None:
+            return pyramid
+
+        key = (track.id, track.update_timestamp)
+        build = self._builds.get(key)
+        if build is None:
+            build = asyncio.ensure_future(self._build(track))
+            self._builds[key] = build
+            build.add_done_callback(lambda _: self._builds.pop(key, None))
+
+        return await asyncio.shield(build)
+
+    async def window(
+        self, track: SingleTrack, start: float, end: float, pixels: int
+    ) -> WaveformWindow:
+        pyramid = await self.get(track)
+        return pyramid.window(start, end, pixels)
+
+    async def build_many(
+        self, tracks: Iterable[SingleTrack], concurrency: int = 8
+    ) -> List[WaveformPyramid]:
+        # every pyramid is built as soon as its samples arrive, while the
+        # fetches of the other tracks are still in flight
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def build(track: SingleTrack):
+            async with semaphore:
+                return await self.get(track)
+
+        return await asyncio.gather(*[build(track) for track in tracks])
@@ -0,0 +1,568 @@
+import abc
+import asyncio
+import inspect
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple
+
+from .errors import RequestError
+from .hearthis import HearThis
+from .models import LoggedinUser, SingleTrack
+
+
+class TaskKind(Enum):
+    ARTIST_TRACKS_PAGE = "artist_tracks_page"
+    RELOAD_TRACK = "reload_track"
+    DOWNLOAD = "download"
+
+
+class TaskStatus(Enum):
+    QUEUED = "queued"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Task(NamedTuple):
+    id: int
+    kind: TaskKind
+    payload: dict
+    dedup_key: str
+    priority: int
+    status: TaskStatus
+    attempts: int
+    lease_owner: str
+    lease_expires_at: float
+    error: str
+
+
+class QueueStats(NamedTuple):
+    queued: int
+    leased: int
+    done: int
+    failed: int
+
+
+def default_dedup_key(kind: TaskKind, payload: dict) -> str:
+    return f"{kind.value}:{json.dumps(payload, sort_keys=True)}"
+
+
+class WorkQueue(abc.ABC):
+    # Base class of the queue backends. A leased task is invisible to other
+    # workers until its lease expires, so the task of a dead worker is leased
+    # again after the visibility timeout. Only the current lease owner can
+    # complete, fail or extend a task. Tasks with the same dedup key are
+    # added once, also after they are done. The methods block, workers call
+    # them from executor threads.
+
+    def __init__(self, max_attempts: int = 5) -> None:
+        self.max_attempts = max_attempts
+
+    @abc.abstractmethod
+    def put(
+        self,
+        kind: TaskKind,
+        payload: dict,
+        dedup_key: str = None,
+        priority: int = 0,
+    ) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def lease(self, owner: str, visibility_timeout: float, count: int = 1) -> list:
+        pass
+
+    @abc.abstractmethod
+    def extend(self, task: Task, owner: str, visibility_timeout: float) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def complete(self, task: Task, owner: str) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def fail(
+        self, task: Task, owner: str, error: str, retry_delay: float = 0.0
+    ) -> TaskStatus:
+        pass
+
+    @abc.abstractmethod
+    def release(self, task: Task, owner: str) -> bool:
+        # hands the task back without counting the attempt
+        pass
+
+    @abc.abstractmethod
+    def stats(self) -> QueueStats:
+        pass
+
+    def close(self) -> None:
+        # optional, for implementations holding a connection or a file
+        return None
+
+    def put_artist_tracks(
+        self, permalink: str, page: int = 1, count: int = 20, priority: int = 0
+    ) -> bool:
+        payload = dict(permalink=permalink, page=page, count=count)
+        return self.put(TaskKind.ARTIST_TRACKS_PAGE, payload, priority=priority)
+
+    def put_reload_track(self, track: SingleTrack, priority: int = 0) -> bool:
+        payload = dict(
+            id=str(track.id),
+            permalink=track.permalink,
+            user_permalink=track.user.permalink,
+        )
+        return self.put(
+            TaskKind.RELOAD_TRACK,
+            payload,
+            default_dedup_key(TaskKind.RELOAD_TRACK, dict(id=str(track.id))),
+            priority,
+        )
+
+    def put_download(
+        self, track: SingleTrack, path: str, url: str = None, priority: int = 0
+    ) -> bool:
+        payload = dict(id=str(track.id), url=url or track.download_url, path=path)
+        return self.put(
+            TaskKind.DOWNLOAD,
+            payload,
+            default_dedup_key(TaskKind.DOWNLOAD, dict(id=str(track.id))),
+            priority,
+        )
+
+
+_COLUMNS = """id, kind, payload, dedup_key, priority, status, attempts,
+              lease_owner, lease_expires_at, error"""
+
+
+class SqliteWorkQueue(WorkQueue):
+    # Queue in a SQLite file, shared by the worker processes of a machine.
+    # Every lease runs in its own write transaction, so a task is never
+    # handed to two workers at once. Workers on several machines need a
+    # backend on a database server implementing WorkQueue. The connection is
+    # shared by the executor threads of the workers, every call runs under a
+    # lock.
+
+    def __init__(self, path: str, max_attempts: int = 5, timeout: float = 30.0):
+        super().__init__(max_attempts)
+        self._connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self._connection_lock = threading.RLock()
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                dedup_key TEXT NOT NULL UNIQUE,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                error TEXT,
+                available_at REAL NOT NULL
+            )"""
+        )
+        self._connection.execute(
+            """CREATE INDEX IF NOT EXISTS tasks_ready
+               ON tasks (status, priority DESC, id)"""
+        )
+
+    @staticmethod
+    def _to_task(row) -> Task:
+        return Task(
+            row[0],
+            TaskKind(row[1]),
+            json.loads(row[2]),
+            row[3],
+            row[4],
+            TaskStatus(row[5]),
+            *row[6:],
+        )
+
+    def _execute(self, *arguments):
+        with self._connection_lock:
+            return self._connection.execute(*arguments)
+
+    def _write(self, function: Callable[[], Any]):
+        # runs the statements of function in one write transaction
+        with self._connection_lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = function()
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return result
+
+    def put(
+        self,
+        kind: TaskKind,
+        payload: dict,
+        dedup_key: str = None,
+        priority: int = 0,
+    ) -> bool:
+        cursor = self._execute(
+            """INSERT OR IGNORE INTO tasks
+               (kind, payload, dedup_key, priority, status, available_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (
+                kind.value,
+                json.dumps(payload),
+                dedup_key or default_dedup_key(kind, payload),
+                priority,
+                TaskStatus.QUEUED.value,
+                time.time(),
+            ),
+        )
+        return cursor.rowcount == 1
+
+    def lease(self, owner: str, visibility_timeout: float, count: int = 1) -> list:
+        def lease_tasks() -> list:
+            now = time.time()
+            # tasks of workers which did not renew their lease are given up
+            # once they used all attempts
+            self._connection.execute(
+                """UPDATE tasks SET status = ?, error = 'lease expired'
+                   WHERE status = ? AND lease_expires_at <= ? AND attempts >= ?""",
+                (
+                    TaskStatus.FAILED.value,
+                    TaskStatus.LEASED.value,
+                    now,
+                    self.max_attempts,
+                ),
+            )
+            rows = self._connection.execute(
+                f"""SELECT {_COLUMNS} FROM tasks
+                    WHERE (status = ? AND available_at <= ?)
+                       OR (status = ? AND lease_expires_at <= ?)
+                    ORDER BY priority DESC, id LIMIT ?""",
+                (
+                    TaskStatus.QUEUED.value,
+                    now,
+                    TaskStatus.LEASED.value,
+                    now,
+                    count,
+                ),
+            ).fetchall()
+
+            tasks = []
+            expires_at = now + visibility_timeout
+            for row in rows:
+                self._connection.execute(
+                    """UPDATE tasks SET status = ?, attempts = attempts + 1,
+                       lease_owner = ?, lease_expires_at = ? WHERE id = ?""",
+                    (TaskStatus.LEASED.value, owner, expires_at, row[0]),
+                )
+                tasks.append(
+                    self._to_task(row)._replace(
+                        status=TaskStatus.LEASED,
+                        attempts=row[6] + 1,
+                        lease_owner=owner,
+                        lease_expires_at=expires_at,
+                    )
+                )
+            return tasks
+
+        return self._write(lease_tasks)
+
+    def _update_leased(self, task: Task, owner: str, assignments: str, values):
+        cursor = self._execute(
+            f"""UPDATE tasks SET {assignments}
+                WHERE id = ? AND status = ? AND lease_owner = ?""",
+            (*values, task.id, TaskStatus.LEASED.value, owner),
+        )
+        return cursor.rowcount == 1
+
+    def extend(self, task: Task, owner: str, visibility_timeout: float) -> bool:
+        return self._update_leased(
+            task, owner, "lease_expires_at = ?", (time.time() + visibility_timeout,)
+        )
+
+    def complete(self, task: Task, owner: str) -> bool:
+        return self._update_leased(
+            task, owner, "status = ?, error = NULL", (TaskStatus.DONE.value,)
+        )
+
+    def fail(
+        self, task: Task, owner: str, error: str, retry_delay: float = 0.0
+    ) -> TaskStatus:
+        status = TaskStatus.QUEUED
+        if task.attempts >= self.max_attempts:
+            status = TaskStatus.FAILED
+
+        updated = self._update_leased(
+            task,
+            owner,
+            "status = ?, error = ?, available_at = ?",
+            (status.value, error, time.time() + retry_delay),
+        )
+        # a worker which lost its lease does not change the task any more
+        return status if updated else None
+
+    def release(self, task: Task, owner: str) -> bool:
+        return self._update_leased(
+            task,
+            owner,
+            "status = ?, attempts = attempts - 1, available_at = ?",
+            (TaskStatus.QUEUED.value, time.time()),
+        )
+
+    def get(self, task_id: int) -> Task:
+        with self._connection_lock:
+            row = self._connection.execute(
+                f"SELECT {_COLUMNS} FROM tasks WHERE id = ?", (task_id,)
+            ).fetchone()
+        return None if row is None else self._to_task(row)
+
+    def all(self) -> List[Task]:
+        with self._connection_lock:
+            rows = self._connection.execute(
+                f"SELECT {_COLUMNS} FROM tasks ORDER BY id"
+            ).fetchall()
+        return [self._to_task(row) for row in rows]
+
+    def stats(self) -> QueueStats:
+        with self._connection_lock:
+            rows = self._connection.execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+            ).fetchall()
+        counts = {TaskStatus(status): count for (status, count) in rows}
+        return QueueStats(*[counts.get(status, 0) for status in TaskStatus])
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class ResultSink(abc.ABC):
+    # Receives the result of every completed task before the task is marked
+    # as done. A failing sink fails the task, so it is retried.
+
+    @abc.abstractmethod
+    async def write(self, task: Task, result) -> None:
+        pass
+
+    def close(self) -> None:
+        # optional, for implementations holding a connection or a file
+        return None
+
+
+class CallbackSink(ResultSink):
+    def __init__(self, callback: Callable[[Task, Any], Any]) -> None:
+        self._callback = callback
+
+    async def write(self, task: Task, result) -> None:
+        outcome = self._callback(task, result)
+        if inspect.isawaitable(outcome):
+            await outcome
+
+
+def _as_json(value):
+    if hasattr(value, "_asdict"):
+        return {key: _as_json(item) for (key, item) in value._asdict().items()}
+    if isinstance(value, (list, tuple)):
+        return [_as_json(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _as_json(item) for (key, item) in value.items()}
+    return value
+
+
+class JsonLinesSink(ResultSink):
+    # Appends one json line per task. Every worker process should write its
+    # own file, lines of concurrent writers may interleave otherwise.
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "a")
+
+    async def write(self, task: Task, result) -> None:
+        line = dict(
+            task_id=task.id,
+            kind=task.kind.value,
+            payload=task.payload,
+            result=_as_json(result),
+        )
+        self._file.write(json.dumps(line) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _UserReference(NamedTuple):
+    permalink: str
+
+
+class _TrackReference(NamedTuple):
+    # the parts of a track reload_single_track needs
+    permalink: str
+    user: _UserReference
+
+
+class WorkerStats(NamedTuple):
+    worker_id: str
+    completed: int
+    failed: int
+    lost_leases: int
+
+
+class CrawlWorker:
+    # Pulls crawl tasks from a queue and runs them with the client. A lease
+    # is renewed while its task runs, so only tasks of dead workers expire.
+    # Artist pages which come back full queue the next page of the artist.
+    # Any number of workers in several processes can share a queue.
+
+    def __init__(
+        self,
+        hearthis: HearThis,
+        user: LoggedinUser,
+        queue: WorkQueue,
+        sinks: Iterable[ResultSink] = (),
+        concurrency: int = 4,
+        visibility_timeout: float = 60.0,
+        poll_interval: float = 1.0,
+        retry_delay: float = 5.0,
+        follow_pages: bool = True,
+        worker_id: str = None,
+    ) -> None:
+        self._hearthis = hearthis
+        self._user = user
+        self._queue = queue
+        self._sinks = list(sinks)
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.follow_pages = follow_pages
+        self.worker_id = worker_id or (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        )
+        self._handlers: Dict[TaskKind, Callable] = {
+            TaskKind.ARTIST_TRACKS_PAGE: self._artist_tracks_page,
+            TaskKind.RELOAD_TRACK: self._reload_track,
+            TaskKind.DOWNLOAD: self._download,
+        }
+        self._stopping = False
+        self.completed = 0
+        self.failed = 0
+        self.lost_leases = 0
+        self.renewal_errors = 0
+
+    async def _artist_tracks_page(self, payload: dict) -> List[SingleTrack]:
+        tracks = await self._hearthis.get_artist_tracks(
+            self._user,
+            payload["permalink"],
+            page=payload["page"],
+            count=payload["count"],
+        )
+        if self.follow_pages and len(tracks) == payload["count"]:
+            await self._run_blocking(
+                self._queue.put_artist_tracks,
+                payload["permalink"],
+                payload["page"] + 1,
+                payload["count"],
+            )
+        return tracks
+
+    async def _reload_track(self, payload: dict) -> SingleTrack:
+        reference = _TrackReference(
+            payload["permalink"], _UserReference(payload["user_permalink"])
+        )
+        return await self._hearthis.reload_single_track(self._user, reference)
+
+    async def _download(self, payload: dict):
+        from .download import write_response_to_file
+
+        async with self._hearthis.open_download(payload["url"]) as response:
+            if response.status != 200:
+                raise RequestError(response.status)
+            return await write_response_to_file(response, payload["path"])
+
+    async def _run_blocking(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, function, *args)
+
+    async def _renew(self, task: Task) -> None:
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                extended = await self._run_blocking(
+                    self._queue.extend, task, self.worker_id, self.visibility_timeout
+                )
+            except Exception:
+                # e.g. a locked database, the lease is still valid for two
+                # more turns
+                self.renewal_errors += 1
+                continue
+            if not extended:
+                return
+
+    async def _process(self, task: Task) -> None:
+        renewal = asyncio.ensure_future(self._renew(task))
+        try:
+            result = await self._handlers[task.kind](task.payload)
+            for sink in self._sinks:
+                await sink.write(task, result)
+        except asyncio.CancelledError:
+            await self._run_blocking(self._queue.release, task, self.worker_id)
+            raise
+        except Exception as error:
+            self.failed += 1
+            status = await self._run_blocking(
+                self._queue.fail, task, self.worker_id, repr(error), self.retry_delay
+            )
+            if status is None:
+                self.lost_leases += 1
+            return
+        finally:
+            renewal.cancel()
+
+        if await self._run_blocking(self._queue.complete, task, self.worker_id):
+            self.completed += 1
+        else:
+            # the lease expired and the task went to another worker
+            self.lost_leases += 1
+
+    async def _is_drained(self) -> bool:
+        # tasks waiting for a retry or leased by other loops and workers may
+        # still come back
+        stats = await self._run_blocking(self._queue.stats)
+        return stats.queued == 0 and stats.leased == 0
+
+    async def _work(self, until_empty: bool) -> None:
+        while not self._stopping:
+            tasks = await self._run_blocking(
+                self._queue.lease, self.worker_id, self.visibility_timeout
+            )
+            if not tasks:
+                if until_empty and await self._is_drained():
+                    return
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            await self._process(tasks[0])
+
+    async def run(self, until_empty: bool = True) -> WorkerStats:
+        # with until_empty the worker ends once no task is queued or leased,
+        # e.g. for a batch, otherwise it polls until stop is called
+        self._stopping = False
+        await asyncio.gather(
+            *[self._work(until_empty) for _ in range(self.concurrency)]
+        )
+        return self.stats()
+
+    def stop(self) -> None:
+        # the loops finish their current task and exit
+        self._stopping = True
+
+    def stats(self) -> WorkerStats:
+        return WorkerStats(
+            self.worker_id, self.completed, self.failed, self.lost_leases
+        )
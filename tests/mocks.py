@@ -1,77 +1,56 @@
-import asyncio
 import os
 import json
-from urllib.parse import urlencode
 from pyhearthis.models import Category, LoggedinUser, Playlist, SingleTrack
+from pyhearthis.recording import (
+    Cassette,
+    Interaction,
+    ReplaySession,
+    create_interaction,
+    ignore_body,
+)
 
 
-class RequestContextManagerMock:
-    return_values = dict()
-    post_values = dict()
-
-    def __init__(self, query, data=None) -> None:
-        self.query = query
-        RequestContextManagerMock.post_values[query] = data
-
-    async def __aenter__(self):
-        return self
-
-    async def __aexit__(self, exc_type, exc, tb):
-        if self.query in RequestContextManagerMock.return_values:
-            RequestContextManagerMock.return_values.pop(self.query, None)
-
-    async def text(self) -> str:
-        await asyncio.sleep(0)
-        if self.query in RequestContextManagerMock.return_values:
-            data = RequestContextManagerMock.return_values[self.query]
-            if isinstance(data, dict):
-                return json.dumps(data)
-            if isinstance(data, list):
-                return json.dumps(data)
-
-            return data
-
-        return ""
-
-    async def json(self) -> str:
-        await asyncio.sleep(0)
-        if self.query in RequestContextManagerMock.return_values:
-            return RequestContextManagerMock.return_values[self.query]
-
-        return dict()
+def load_response(json_file: str):
+    file = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "response_data", json_file)
+    )
+    with open(file, "r") as json_data:
+        data = json_data.read()
 
-    @property
-    def status(self) -> int:
-        return 200
+    return json.loads(data)
+
+
+def response(url: str, content, method: str = "GET", **params) -> Interaction:
+    # query parameters are given as keyword arguments, a posted body as data.
+    # The api answers with text/html for json as well. Credentials are kept,
+    # requests with other credentials do not match.
+    data = params.pop("data", None)
+    return create_interaction(
+        method,
+        url,
+        content,
+        content_type="text/html",
+        redacted=(),
+        params=params,
+        data=data,
+    )
 
-    @property
-    def content_type(self) -> str:
-        return "text/html"
 
-    @staticmethod
-    def with_return_value(url: str, response, **kwargs):
-        params = ""
-        if len(kwargs) > 0:
-            params = urlencode(kwargs)
-            url = f"{url}?{params}"
+def json_response(url: str, json_file: str, method: str = "GET", **params):
+    return response(url, load_response(json_file), method, **params)
 
-        RequestContextManagerMock.return_values[url] = response
-        return RequestContextManagerMock
 
-    @staticmethod
-    def with_json_response(url: str, json_file: str, **kwargs):
-        file = os.path.abspath(
-            os.path.join(os.path.dirname(__file__), "response_data", json_file)
-        )
-        with open(file, "r") as json_data:
-            data = json_data.read()
+def replay_session(
+    *interactions: Interaction, matcher=ignore_body, **kwargs
+) -> ReplaySession:
+    # posted bodies are asserted through the requests of the session
+    return ReplaySession(Cassette(interactions), matcher, redacted=(), **kwargs)
 
-        response = json.loads(data)
-        return RequestContextManagerMock.with_return_value(url, response, **kwargs)
 
-    @staticmethod
-    def pop_post_data_for_url(url: str) -> dict:
-        return RequestContextManagerMock.post_values.pop(url, None)
+def artist_response(permalink: str, user_id: int, following: bool) -> Interaction:
+    content = load_response("get_single_artist_response.json")
+    content.update(id=user_id, permalink=permalink, following=following)
+    return response(f"https://api-v2.hearthis.at/{permalink}", content)
 
 
 def replace_key(dictionary: dict, old_key: str, new_key: str) -> None:
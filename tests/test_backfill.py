@@ -0,0 +1,107 @@
+import os
+import tempfile
+from collections import namedtuple
+from datetime import date, timedelta
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from pyhearthis.backfill import FeedBackfill, FeedWindow, partition
+
+Track = namedtuple("Track", "id unix_created_at release_timestamp")
+START = date(2023, 1, 1)
+
+
+class FeedClient:
+    # serves tracks per day, newest first like the api, every window
+    # includes the last track of the day before its start
+    def __init__(self, tracks_per_day: dict) -> None:
+        self.tracks = {}
+        for day, amount in tracks_per_day.items():
+            base = (day - START).days * 100000
+            self.tracks[day] = [Track(base + i, base + i, 0) for i in range(amount)]
+        self.windows = []
+
+    async def get_feeds(self, user, page, count, feed_start, feed_end, **kwargs):
+        self.windows.append((feed_start, feed_end, page))
+        tracks = list(self.tracks.get(feed_start - timedelta(days=1), [])[-1:])
+        day = feed_start
+        while day <= feed_end:
+            tracks.extend(self.tracks.get(day, []))
+            day += timedelta(days=1)
+        tracks.reverse()
+        return tracks[(page - 1) * count : page * count]
+
+
+class PartitionTests(TestCase):
+    def test_that_range_is_covered_without_gaps(self):
+        windows = partition(START, date(2023, 1, 10), timedelta(days=4))
+
+        self.assertEqual(
+            windows,
+            [
+                FeedWindow(START, date(2023, 1, 4)),
+                FeedWindow(date(2023, 1, 5), date(2023, 1, 8)),
+                FeedWindow(date(2023, 1, 9), date(2023, 1, 10)),
+            ],
+        )
+        self.assertEqual(
+            windows[0].split()[1], FeedWindow(date(2023, 1, 3), date(2023, 1, 4))
+        )
+
+
+class FeedBackfillTests(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.directory.name, "backfill.json")
+        days = [START + timedelta(days=day) for day in range(14)]
+        amounts = {day: 3 for day in days}
+        amounts[date(2023, 1, 3)] = 130
+        self.client = FeedClient(amounts)
+        self.expected = sorted(
+            t for tracks in self.client.tracks.values() for t in tracks
+        )
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def create_backfill(self) -> FeedBackfill:
+        return FeedBackfill(
+            self.client,
+            None,
+            START,
+            date(2023, 1, 14),
+            window=timedelta(days=7),
+            count=20,
+            concurrency=4,
+            dense_pages=3,
+            checkpoint_path=self.checkpoint,
+        )
+
+    async def test_that_dense_windows_are_split_and_merged_in_time_order(self):
+        # Arrange
+        sut = self.create_backfill()
+
+        # Act
+        result = await sut.run()
+
+        # Assert
+        self.assertEqual(result, self.expected)
+        self.assertGreater(sut.splits, 0)
+
+    async def test_that_completed_windows_are_skipped_after_restart(self):
+        # Arrange
+        # a window is checkpointed once the next one is requested
+        results = []
+        async for window_result in self.create_backfill().windows():
+            results.append(window_result)
+            if len(results) == 2:
+                break
+        first = results[0]
+        self.client.windows.clear()
+
+        # Act
+        result = await self.create_backfill().run()
+
+        # Assert
+        requested_starts = {start for (start, _, _) in self.client.windows}
+        self.assertNotIn(first.window.start, requested_starts)
+        self.assertEqual(first.tracks + result, self.expected)
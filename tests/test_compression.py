@@ -0,0 +1,97 @@
+import json
+from unittest import IsolatedAsyncioTestCase, TestCase, skipIf
+
+from pyhearthis import compression
+from pyhearthis.compression import (
+    CompressedPayload,
+    CompressedResponseCache,
+    ZlibCodec,
+    pack_record,
+    unpack_record,
+)
+from pyhearthis.hearthis import HearThis
+from tests import mocks
+
+
+def track_page(first_id: int):
+    track = mocks.load_response("single_track.json")
+    return [dict(track, id=first_id + index) for index in range(20)]
+
+
+class CompressedResponseCacheTests(TestCase):
+    def test_that_entries_are_stored_compressed_and_restored_on_hit(self):
+        # Arrange
+        sut = CompressedResponseCache(codec=ZlibCodec())
+        page = track_page(0)
+
+        # Act
+        sut.put("json", page)
+        sut.put("text", "DELETED")
+        sut.put("bytes", b"\x00\x01")
+        stored = sut._entries["json"].payload
+
+        # Assert
+        self.assertIsInstance(stored, CompressedPayload)
+        self.assertEqual(sut.get("json").value, page)
+        self.assertEqual(sut.get("text").value, "DELETED")
+        self.assertEqual(sut.get("bytes").value, b"\x00\x01")
+        stats = sut.stats()
+        self.assertEqual(stats.hits, 3)
+        self.assertGreater(stats.ratio, 5)
+        self.assertGreater(stats.mean_hit_seconds, 0)
+
+    def test_that_byte_budget_evicts_least_recently_used_entries(self):
+        # Arrange
+        sut = CompressedResponseCache(codec=ZlibCodec())
+        sut.put("first", track_page(0))
+        sut.max_bytes = 2 * sut.stored_bytes + 100
+
+        # Act
+        sut.put("second", track_page(100))
+        sut.get("first")
+        sut.put("third", track_page(200))
+
+        # Assert
+        self.assertIsNotNone(sut.get("first"))
+        self.assertIsNone(sut.get("second"))
+        self.assertLessEqual(sut.stored_bytes, sut.max_bytes)
+        self.assertEqual(sut.stats().entries, 2)
+
+    def test_that_records_round_trip(self):
+        track = mocks.create_single_track()
+
+        packed = pack_record(track, ZlibCodec())
+
+        self.assertLess(len(packed), len(json.dumps(track._asdict())))
+        self.assertEqual(unpack_record(packed, ZlibCodec()), track._asdict())
+
+    @skipIf(compression.zstandard is None, "zstandard is not installed")
+    def test_that_trained_dictionary_compresses_single_tracks(self):
+        samples = compression.track_samples(track_page(0) * 10)
+        dictionary = compression.train_dictionary(samples, size=4096)
+        codec = compression.ZstdCodec(dictionary=dictionary)
+
+        packed = pack_record(track_page(1000)[0], codec)
+
+        self.assertLess(len(packed), len(pack_record(track_page(1000)[0], ZlibCodec())))
+
+
+class CompressedClientCacheTests(IsolatedAsyncioTestCase):
+    async def test_that_client_serves_hits_from_compressed_cache(self):
+        # Arrange
+        session = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/categories/", "get_categories.json"
+            )
+        )
+        cache = CompressedResponseCache(codec=ZlibCodec())
+        sut = HearThis(session, response_cache=cache)
+        await sut.get_categories()
+
+        # Act
+        result = await sut.get_categories()
+
+        # Assert
+        self.assertEqual(result[0].id, "acoustic")
+        self.assertEqual(len(session.requests), 1)
+        self.assertEqual(cache.stats().hits, 1)
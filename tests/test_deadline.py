@@ -0,0 +1,111 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from pyhearthis.errors import DeadlineExceededError
+from pyhearthis.hearthis import HearThis
+
+
+class DelayedResponse:
+    def __init__(self, delay: float, data) -> None:
+        self.delay = delay
+        self.data = data
+        self.status = 200
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def json(self):
+        return self.data
+
+
+class DelayedSession:
+    def __init__(self, *delays: float) -> None:
+        self.delays = list(delays)
+        self.requests = []
+
+    def get(self, query, **kwargs):
+        self.requests.append((query, kwargs))
+        delay = self.delays.pop(0)
+        return DelayedResponse(delay, [{"id": "acoustic", "name": f"{delay}"}])
+
+
+class DeadlineTests(IsolatedAsyncioTestCase):
+    async def test_that_deadline_cancels_slow_calls(self):
+        # Arrange
+        session = DelayedSession(10)
+        sut = HearThis(session)
+
+        # Act / Assert
+        with self.assertRaises(DeadlineExceededError):
+            await sut.with_deadline(0.05, sut._get_as_json("categories/"))
+
+    async def test_that_remaining_budget_is_passed_as_timeout(self):
+        # Arrange
+        session = DelayedSession(0)
+        sut = HearThis(session)
+
+        # Act
+        await sut.with_deadline(5, sut._get_as_json("categories/"))
+
+        # Assert
+        timeout = session.requests[0][1]["timeout"]
+        self.assertLessEqual(timeout.total, 5)
+        self.assertGreater(timeout.total, 4)
+
+    async def test_that_hedged_request_returns_the_faster_response(self):
+        # Arrange
+        session = DelayedSession(10, 0)
+        sut = HearThis(session, hedging=True)
+        for _ in range(20):
+            sut._latencies.record("categories", 0.01)
+
+        # Act
+        result = await sut._get_as_json("categories/")
+
+        # Assert
+        self.assertEqual(result[0]["name"], "0")
+        self.assertEqual(len(session.requests), 2)
+
+    async def test_that_deadline_keyword_limits_a_single_call(self):
+        # Arrange
+        session = DelayedSession(10)
+        sut = HearThis(session)
+
+        # Act / Assert
+        with self.assertRaises(DeadlineExceededError):
+            await sut.get_categories(deadline=0.05)
+
+    async def test_that_latency_of_cancelled_hedges_is_recorded(self):
+        # Arrange
+        session = DelayedSession(10, 0)
+        sut = HearThis(session, hedging=True)
+        for _ in range(20):
+            sut._latencies.record("categories", 0.01)
+
+        # Act
+        await sut._get_as_json("categories/")
+        # the loser handles its cancellation on the next loop iteration
+        await asyncio.sleep(0)
+
+        # Assert
+        samples = sut._latencies._samples["categories"]
+        self.assertEqual(len(samples), 22)
+        self.assertGreaterEqual(max(samples), 0.01)
+
+    def test_that_route_family_groups_api_routes(self):
+        self.assertEqual(
+            HearThis._route_family("https://api-v2.hearthis.at/search/?t=x"),
+            "search",
+        )
+        self.assertEqual(
+            HearThis._route_family("https://api-v2.hearthis.at/permalink"), "artist"
+        )
+        self.assertEqual(
+            HearThis._route_family("https://api-v2.hearthis.at/permalink/"),
+            "artist_tracks",
+        )
+        self.assertEqual(HearThis._route_family("https://waveform.data"), "media")
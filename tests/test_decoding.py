@@ -0,0 +1,36 @@
+import json
+import os
+import pickle
+from unittest import TestCase
+
+from pyhearthis.decoding import decode_tracks, decode_waveform
+
+
+def read_response(json_file: str) -> bytes:
+    file = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "response_data", json_file)
+    )
+    with open(file, "rb") as json_data:
+        return json_data.read()
+
+
+class DecodingTests(TestCase):
+    def test_that_decode_tracks_returns_picklable_tracks(self):
+        raw = read_response("get_feeds_response.json")
+
+        tracks = decode_tracks(raw)
+        restored = pickle.loads(pickle.dumps(tracks))
+
+        self.assertEqual(restored, tracks)
+        self.assertEqual(restored[0].id, 48250)
+        self.assertIsNotNone(restored[0].user.username)
+
+    def test_that_decode_tracks_returns_empty_list_when_limit_reached(self):
+        raw = read_response("limit_reached_response.json")
+
+        self.assertEqual(decode_tracks(raw), [])
+        self.assertEqual(decode_tracks(b""), [])
+
+    def test_that_decode_waveform_returns_samples(self):
+        self.assertEqual(decode_waveform(json.dumps([1, 2, 3])), [1, 2, 3])
+        self.assertEqual(decode_waveform(""), [])
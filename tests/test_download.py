@@ -0,0 +1,91 @@
+import hashlib
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+
+from pyhearthis.download import IncompleteDownloadError, write_response_to_file
+from pyhearthis.hearthis import HearThis
+from tests import mocks
+
+
+class StreamMock:
+    def __init__(self, chunks) -> None:
+        self.chunks = chunks
+
+    async def iter_any(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class DownloadResponseMock:
+    def __init__(self, chunks, content_length=None, headers=None) -> None:
+        self.status = 200
+        self.content = StreamMock(chunks)
+        self.content_length = content_length
+        self.headers = headers or dict()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class DownloadSessionMock:
+    def __init__(self, response) -> None:
+        self.response = response
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return self.response
+
+
+class DownloadTests(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "track.mp3")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    async def test_that_download_is_written_and_hashed(self):
+        # Arrange
+        chunks = [b"first chunk ", b"second chunk"]
+        data = b"".join(chunks)
+        session = DownloadSessionMock(DownloadResponseMock(chunks, len(data)))
+        user = mocks.create_logged_in_user()
+        track = mocks.create_single_track()
+        sut = HearThis(session)
+
+        # Act
+        result = await sut.download_track_to_file(user, track, self.path)
+
+        # Assert
+        self.assertEqual(session.urls, [track.download_url])
+        self.assertEqual(result.size, len(data))
+        self.assertEqual(result.digest, hashlib.sha256(data).hexdigest())
+        with open(self.path, "rb") as file:
+            self.assertEqual(file.read(), data)
+
+    async def test_that_download_without_length_is_streamed(self):
+        # Arrange
+        chunks = [b"abc", b"def"]
+        response = DownloadResponseMock(chunks, headers={"Content-Encoding": "gzip"})
+
+        # Act
+        result = await write_response_to_file(response, self.path, "md5")
+
+        # Assert
+        self.assertEqual(result.size, 6)
+        self.assertEqual(result.digest, hashlib.md5(b"abcdef").hexdigest())
+
+    async def test_that_truncated_download_raises(self):
+        # Arrange
+        response = DownloadResponseMock([b"abc"], 10)
+
+        # Act / Assert
+        with self.assertRaises(IncompleteDownloadError):
+            await write_response_to_file(response, self.path)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), [])
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase
+
+from pyhearthis.download_manager import DownloadManager, JobStatus, safe_filename
+from pyhearthis.hearthis import HearThis
+from pyhearthis.ratelimit import TokenBucket
+from tests import mocks
+
+
+class RangeStreamMock:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    async def iter_chunked(self, size: int):
+        for start in range(0, len(self.data), size):
+            await asyncio.sleep(0)
+            yield self.data[start : start + size]
+
+
+class RangeResponseMock:
+    def __init__(self, data: bytes, offset: int) -> None:
+        self.status = 206 if offset > 0 else 200
+        self.content = RangeStreamMock(data[offset:])
+        self.content_length = len(data) - offset
+        self.headers = dict()
+        if offset >= len(data):
+            # range not satisfiable
+            self.status = 416
+            self.content_length = 0
+            self.headers["Content-Range"] = f"bytes */{len(data)}"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class RangeSessionMock:
+    def __init__(self, files: dict) -> None:
+        self.files = files
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append((url, headers))
+        offset = 0
+        if headers and "Range" in headers:
+            offset = int(headers["Range"][len("bytes=") : -1])
+        return RangeResponseMock(self.files[url], offset)
+
+
+def create_track(track_id: int):
+    return mocks.create_single_track()._replace(
+        id=track_id,
+        download_url=f"https://download/{track_id}",
+        download_filename=f"{track_id}.mp3",
+    )
+
+
+class DownloadManagerTests(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue_path = os.path.join(self.directory.name, "queue.sqlite")
+        self.target = os.path.join(self.directory.name, "downloads")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    async def test_that_jobs_are_deduplicated_and_run_by_priority(self):
+        # Arrange
+        session = RangeSessionMock(
+            {"https://download/1": b"a", "https://download/2": b"b"}
+        )
+        sut = DownloadManager(HearThis(session), self.queue_path, self.target, 1)
+
+        # Act
+        added = [
+            sut.enqueue(create_track(1), priority=0),
+            sut.enqueue(create_track(2), priority=5),
+            sut.enqueue(create_track(1), priority=9),
+        ]
+        metrics = await sut.run()
+
+        # Assert
+        self.assertEqual(added, [True, True, False])
+        self.assertEqual(
+            [url for (url, _) in session.requests][0], "https://download/2"
+        )
+        self.assertEqual(metrics.done, 2)
+        self.assertEqual(metrics.bytes_downloaded, 2)
+        sut.close()
+
+    async def test_that_partial_file_is_resumed_after_restart(self):
+        # Arrange
+        data = b"0123456789"
+        session = RangeSessionMock({"https://download/1": data})
+        first = DownloadManager(HearThis(session), self.queue_path, self.target)
+        first.enqueue(create_track(1))
+        first.close()
+        os.makedirs(self.target)
+        with open(os.path.join(self.target, "1.mp3.part"), "wb") as file:
+            file.write(data[:4])
+
+        # Act
+        sut = DownloadManager(HearThis(session), self.queue_path, self.target)
+        await sut.run()
+
+        # Assert
+        self.assertEqual(session.requests[0][1], {"Range": "bytes=4-"})
+        with open(os.path.join(self.target, "1.mp3"), "rb") as file:
+            self.assertEqual(file.read(), data)
+        self.assertEqual(sut.queue.get(1).status, JobStatus.DONE)
+        self.assertEqual(sut.queue.get(1).bytes_done, 10)
+        sut.close()
+
+    async def test_that_failing_job_is_retried_until_max_attempts(self):
+        # Arrange
+        session = RangeSessionMock(dict())
+        sut = DownloadManager(
+            HearThis(session),
+            self.queue_path,
+            self.target,
+            max_attempts=3,
+            retry_backoff=0.05,
+        )
+        sut.enqueue(create_track(1))
+
+        # Act
+        started = time.monotonic()
+        metrics = await sut.run()
+
+        # Assert
+        self.assertEqual(len(session.requests), 3)
+        # backoffs of 0.05 and 0.1 seconds between the attempts
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        self.assertEqual(metrics.failed, 1)
+        self.assertIn("KeyError", sut.queue.get(1).error)
+        sut.close()
+
+    async def test_that_a_complete_partial_file_is_finished(self):
+        # Arrange
+        data = b"0123456789"
+        session = RangeSessionMock({"https://download/1": data})
+        sut = DownloadManager(HearThis(session), self.queue_path, self.target)
+        sut.enqueue(create_track(1))
+        os.makedirs(self.target)
+        with open(os.path.join(self.target, "1.mp3.part"), "wb") as file:
+            file.write(data)
+
+        # Act
+        await sut.run()
+
+        # Assert
+        with open(os.path.join(self.target, "1.mp3"), "rb") as file:
+            self.assertEqual(file.read(), data)
+        self.assertEqual(sut.queue.get(1).status, JobStatus.DONE)
+        sut.close()
+
+    def test_that_api_filenames_stay_in_the_download_directory(self):
+        # Arrange
+        session = RangeSessionMock(dict())
+        sut = DownloadManager(HearThis(session), self.queue_path, self.target)
+        track = create_track(1)._replace(download_filename="../../etc/passwd")
+
+        # Act
+        sut.enqueue(track)
+
+        # Assert
+        self.assertEqual(sut.queue.get(1).path, os.path.join(self.target, "passwd"))
+        self.assertEqual(safe_filename("..", "1.mp3"), "1.mp3")
+        self.assertEqual(safe_filename("a\\..\\b:c?.mp3", "1.mp3"), "b_c_.mp3")
+        sut.close()
+
+
+class TokenBucketTests(IsolatedAsyncioTestCase):
+    async def test_that_bucket_limits_the_rate(self):
+        sut = TokenBucket(rate=100, capacity=10)
+
+        started = time.monotonic()
+        for _ in range(3):
+            await sut.acquire(10)
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
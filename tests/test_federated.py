@@ -0,0 +1,96 @@
+import asyncio
+import base64
+import json
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock
+
+from pyhearthis.federated import FederatedSearch, InvalidCursorError
+from pyhearthis.hearthis import SearchType
+from pyhearthis.models import User, create_model
+from tests import mocks
+
+
+def create_hearthis():
+    track = mocks.create_single_track()
+    playlist = mocks.create_playlist()
+    hearthis = AsyncMock()
+    hearthis.search.side_effect = lambda user, query, search_type, page, count: [
+        track._replace(id=page * 10 + index) for index in range(count)
+    ]
+    hearthis.search_users.return_value = [create_model(User, playlist.user)]
+    hearthis.search_playlists.return_value = [playlist]
+    return hearthis
+
+
+class FederatedSearchTests(IsolatedAsyncioTestCase):
+    async def test_that_results_are_merged_by_rank(self):
+        # Arrange
+        user = mocks.create_logged_in_user()
+        sut = FederatedSearch(create_hearthis(), user, pages=1, count=2)
+
+        # Act
+        result = await sut.search("House")
+
+        # Assert
+        kinds = [hit.kind for hit in result.hits]
+        self.assertEqual(
+            kinds,
+            [
+                SearchType.TRACKS,
+                SearchType.USER,
+                SearchType.PLAYLISTS,
+                SearchType.TRACKS,
+            ],
+        )
+        self.assertIsNotNone(result.cursor)
+
+    async def test_that_cursor_continues_with_the_next_pages(self):
+        # Arrange
+        user = mocks.create_logged_in_user()
+        hearthis = create_hearthis()
+        sut = FederatedSearch(hearthis, user, pages=2, count=2)
+        first = await sut.search("House")
+
+        # Act
+        second = await sut.search("House", first.cursor)
+
+        # Assert
+        pages = [call.kwargs["page"] for call in hearthis.search.call_args_list]
+        self.assertEqual(pages, [1, 2, 3, 4])
+        self.assertEqual([hit.kind for hit in second.hits], [SearchType.TRACKS] * 4)
+        with self.assertRaises(InvalidCursorError):
+            await sut.search("Techno", first.cursor)
+
+    async def test_that_malformed_cursors_raise_value_errors(self):
+        # Arrange
+        user = mocks.create_logged_in_user()
+        sut = FederatedSearch(create_hearthis(), user)
+        states = [[1], {"q": "House", "p": []}, {"q": "House", "p": {"USER": "x"}}]
+        cursors = ["not base64!", 42] + [
+            base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+            for state in states
+        ]
+
+        # Act / Assert
+        for cursor in cursors:
+            with self.assertRaises(ValueError):
+                await sut.search("House", cursor)
+
+    async def test_that_stream_yields_fast_results_first(self):
+        # Arrange
+        user = mocks.create_logged_in_user()
+        hearthis = create_hearthis()
+
+        async def slow_search(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            return [mocks.create_single_track()]
+
+        hearthis.search.side_effect = slow_search
+        sut = FederatedSearch(hearthis, user, pages=1)
+
+        # Act
+        hits = [hit async for hit in sut.stream("House")]
+
+        # Assert
+        self.assertEqual(hits[-1].kind, SearchType.TRACKS)
+        self.assertEqual(len(hits), 3)
@@ -1,8 +1,9 @@
 from unittest import IsolatedAsyncioTestCase
 from pyhearthis.hearthis import HearThis
-from unittest.mock import AsyncMock
+from pyhearthis.models import FollowOutcome, User
+from pyhearthis.resilience import ResponseCache
+from concurrent.futures import ThreadPoolExecutor
 
-# from mocks import mocks.RequestContextManagerMock, create_logged_in_user, create_single_track, create_category, create_playlist
 from tests import mocks
 
 # from response_data import WAVEFORM_RESPONSE_DATA
@@ -12,12 +13,13 @@ from tests import response_data
 class HearThisTests(IsolatedAsyncioTestCase):
     async def test_that_login_returns_expected_data(self):
         # Arrange
-        mock = AsyncMock()
-        mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/login",
-            "login_response.json",
-            email="mymail@test.de",
-            password="mypassword",
+        mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/login",
+                "login_response.json",
+                email="mymail@test.de",
+                password="mypassword",
+            )
         )
         sut = HearThis(mock)
 
@@ -31,14 +33,15 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_get_feeds_returns_expected_data(self):
         # Arrange
-        mock = AsyncMock()
-        mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/feed/",
-            "get_feeds_response.json",
-            key="mykey",
-            secret="mysecret",
-            page="1",
-            count="5",
+        mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/feed/",
+                "get_feeds_response.json",
+                key="mykey",
+                secret="mysecret",
+                page="1",
+                count="5",
+            )
         )
         user = mocks.create_logged_in_user()
         sut = HearThis(mock)
@@ -55,9 +58,10 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_get_categories_returns_expected_data(self):
         # Arrange
-        mock = AsyncMock()
-        mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/categories/", "get_categories.json"
+        mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/categories/", "get_categories.json"
+            )
         )
         sut = HearThis(mock)
 
@@ -72,9 +76,10 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_get_waveform_data_returns_expected_data(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.get = mocks.RequestContextManagerMock.with_return_value(
-            "https://waveform.data", response_data.WAVEFORM_RESPONSE_DATA
+        client_session_mock = mocks.replay_session(
+            mocks.response(
+                "https://waveform.data", response_data.WAVEFORM_RESPONSE_DATA
+            )
         )
         track = mocks.create_single_track()
         sut = HearThis(client_session_mock)
@@ -88,14 +93,15 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_get_category_tracks_returns_expected_data(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/categories/drumandbass",
-            "get_genre_list_response.json",
-            key="mykey",
-            secret="mysecret",
-            page="1",
-            count="5",
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/categories/drumandbass",
+                "get_genre_list_response.json",
+                key="mykey",
+                secret="mysecret",
+                page="1",
+                count="5",
+            )
         )
         user = mocks.create_logged_in_user()
         category = mocks.create_category()
@@ -113,8 +119,11 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_api_receives_expected_data_when_create_playlist(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.post = mocks.RequestContextManagerMock
+        client_session_mock = mocks.replay_session(
+            mocks.response(
+                "https://api-v2.hearthis.at/set_ajax_add.php", "", method="POST"
+            )
+        )
         user = mocks.create_logged_in_user()
         sut = HearThis(client_session_mock)
 
@@ -122,9 +131,7 @@ class HearThisTests(IsolatedAsyncioTestCase):
         await sut.create_playlist(user, "MyNewPlaylist")
 
         # Assert
-        posted_data = mocks.RequestContextManagerMock.pop_post_data_for_url(
-            "https://api-v2.hearthis.at/set_ajax_add.php"
-        )
+        posted_data = client_session_mock.requests[-1].options["data"]
         expected_data = {
             "action": "createnew",
             "key": "mykey",
@@ -138,15 +145,16 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_get_playlists_returns_expected_data(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/mymail-oc",
-            "get_playlists_response.json",
-            key="mykey",
-            secret="mysecret",
-            page="1",
-            count="5",
-            type="playlists",
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/mymail-oc",
+                "get_playlists_response.json",
+                key="mykey",
+                secret="mysecret",
+                page="1",
+                count="5",
+                type="playlists",
+            )
         )
         user = mocks.create_logged_in_user()
         sut = HearThis(client_session_mock)
@@ -163,9 +171,12 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_api_receives_expected_data_when_add_track_to_playlist(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.post = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/set_ajax_add.php", "single_playlist.json"
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/set_ajax_add.php",
+                "single_playlist.json",
+                method="POST",
+            )
         )
         user = mocks.create_logged_in_user()
         track = mocks.create_single_track()
@@ -176,9 +187,7 @@ class HearThisTests(IsolatedAsyncioTestCase):
         await sut.add_track_to_playlist(user, track, playlist)
 
         # Assert
-        posted_data = mocks.RequestContextManagerMock.pop_post_data_for_url(
-            "https://api-v2.hearthis.at/set_ajax_add.php"
-        )
+        posted_data = client_session_mock.requests[-1].options["data"]
         expected_data = {
             "action": "add",
             "key": "mykey",
@@ -191,9 +200,12 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_api_receives_expected_data_when_add_track_to_new_playlist(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.post = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/set_ajax_add.php", "single_playlist.json"
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/set_ajax_add.php",
+                "single_playlist.json",
+                method="POST",
+            )
         )
         user = mocks.create_logged_in_user()
         track = mocks.create_single_track()
@@ -203,9 +215,7 @@ class HearThisTests(IsolatedAsyncioTestCase):
         await sut.add_track_to_new_playlist(user, track, "my_new_playlist")
 
         # Assert
-        posted_data = mocks.RequestContextManagerMock.pop_post_data_for_url(
-            "https://api-v2.hearthis.at/set_ajax_add.php"
-        )
+        posted_data = client_session_mock.requests[-1].options["data"]
         expected_data = {
             "action": "add",
             "key": "mykey",
@@ -218,13 +228,14 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_get_playlist_tracks_returns_expected_data(self):
         # Arrange
-        client_session_mock = AsyncMock()
         playlist = mocks.create_playlist()
-        client_session_mock.get = mocks.RequestContextManagerMock.with_json_response(
-            f"https://api-v2.hearthis.at/set/{playlist.permalink}/",
-            "get_playlist_tracks_response.json",
-            key="mykey",
-            secret="mysecret",
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                f"https://api-v2.hearthis.at/set/{playlist.permalink}/",
+                "get_playlist_tracks_response.json",
+                key="mykey",
+                secret="mysecret",
+            )
         )
         user = mocks.create_logged_in_user()
         sut = HearThis(client_session_mock)
@@ -243,9 +254,12 @@ class HearThisTests(IsolatedAsyncioTestCase):
         self,
     ):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.post = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/set_ajax_add.php", "single_playlist.json"
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/set_ajax_add.php",
+                "single_playlist.json",
+                method="POST",
+            )
         )
         user = mocks.create_logged_in_user()
         playlist = mocks.create_playlist()
@@ -256,9 +270,7 @@ class HearThisTests(IsolatedAsyncioTestCase):
         result = await sut.delete_track_from_playlist(user, track, playlist)
 
         # Assert
-        posted_data = mocks.RequestContextManagerMock.pop_post_data_for_url(
-            "https://api-v2.hearthis.at/set_ajax_add.php"
-        )
+        posted_data = client_session_mock.requests[-1].options["data"]
         expected_data = {
             "action": "deleteentry",
             "id": track.id,
@@ -272,9 +284,10 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_api_receives_expected_data_when_delete_playlist(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.post = mocks.RequestContextManagerMock.with_return_value(
-            "https://api-v2.hearthis.at/set_ajax_edit.php", "DELETED"
+        client_session_mock = mocks.replay_session(
+            mocks.response(
+                "https://api-v2.hearthis.at/set_ajax_edit.php", "DELETED", method="POST"
+            )
         )
         user = mocks.create_logged_in_user()
         playlist = mocks.create_playlist()
@@ -284,9 +297,7 @@ class HearThisTests(IsolatedAsyncioTestCase):
         await sut.delete_playlist(user, playlist)
 
         # Assert
-        posted_data = mocks.RequestContextManagerMock.pop_post_data_for_url(
-            "https://api-v2.hearthis.at/set_ajax_edit.php"
-        )
+        posted_data = client_session_mock.requests[-1].options["data"]
         expected_data = {
             "action": "delete",
             "key": "mykey",
@@ -298,15 +309,16 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_search_returns_expected_data(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/search/",
-            "search_response.json",
-            key="mykey",
-            secret="mysecret",
-            t="MySearchQuery",
-            page="1",
-            count="5",
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/search/",
+                "search_response.json",
+                key="mykey",
+                secret="mysecret",
+                t="MySearchQuery",
+                page="1",
+                count="5",
+            )
         )
         user = mocks.create_logged_in_user()
         sut = HearThis(client_session_mock)
@@ -322,15 +334,16 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_result_is_empty_when_limit_reached_response_occurs(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/search/",
-            "limit_reached_response.json",
-            key="mykey",
-            secret="mysecret",
-            t="House",
-            page="1",
-            count="5",
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/search/",
+                "limit_reached_response.json",
+                key="mykey",
+                secret="mysecret",
+                t="House",
+                page="1",
+                count="5",
+            )
         )
         user = mocks.create_logged_in_user()
         sut = HearThis(client_session_mock)
@@ -344,15 +357,16 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_expcetion_is_raised_when_count_excceeds_max_count(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/search/",
-            "search_response.json",
-            key="mykey",
-            secret="mysecret",
-            t="MySearchQuery",
-            page="1",
-            count="5",
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/search/",
+                "search_response.json",
+                key="mykey",
+                secret="mysecret",
+                t="MySearchQuery",
+                page="1",
+                count="5",
+            )
         )
         user = mocks.create_logged_in_user()
         category = mocks.create_category()
@@ -396,15 +410,16 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_search_result_user_is_accessible_by_properties(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/search/",
-            "search_response.json",
-            key="mykey",
-            secret="mysecret",
-            t="MySearchQuery",
-            page="1",
-            count="5",
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/search/",
+                "search_response.json",
+                key="mykey",
+                secret="mysecret",
+                t="MySearchQuery",
+                page="1",
+                count="5",
+            )
         )
         user = mocks.create_logged_in_user()
         sut = HearThis(client_session_mock)
@@ -418,15 +433,16 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_playlist_user_is_accessible_by_properties(self):
         # Arrange
-        client_session_mock = AsyncMock()
-        client_session_mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/mymail-oc",
-            "get_playlists_response.json",
-            key="mykey",
-            secret="mysecret",
-            page="1",
-            count="5",
-            type="playlists",
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/mymail-oc",
+                "get_playlists_response.json",
+                key="mykey",
+                secret="mysecret",
+                page="1",
+                count="5",
+                type="playlists",
+            )
         )
         user = mocks.create_logged_in_user()
         sut = HearThis(client_session_mock)
@@ -440,15 +456,16 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_get_artist_tracks_returns_expected_data(self):
         # Arrange
-        mock = AsyncMock()
-        mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/myuserpermalink/",
-            "get_artist_tracks_response.json",
-            key="mykey",
-            secret="mysecret",
-            type="tracks",
-            page="1",
-            count="5",
+        mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/myuserpermalink/",
+                "get_artist_tracks_response.json",
+                key="mykey",
+                secret="mysecret",
+                type="tracks",
+                page="1",
+                count="5",
+            )
         )
         user = mocks.create_logged_in_user()
         sut = HearThis(mock)
@@ -465,10 +482,11 @@ class HearThisTests(IsolatedAsyncioTestCase):
 
     async def test_that_get_single_artist_returns_expected_data(self):
         # Arrange
-        mock = AsyncMock()
-        mock.get = mocks.RequestContextManagerMock.with_json_response(
-            "https://api-v2.hearthis.at/myuserpermalink",
-            "get_single_artist_response.json",
+        mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/myuserpermalink",
+                "get_single_artist_response.json",
+            )
         )
         user = mocks.create_logged_in_user()
         sut = HearThis(mock)
@@ -479,3 +497,264 @@ class HearThisTests(IsolatedAsyncioTestCase):
         # Assert
         self.assertIsNotNone(result)
         self.assertEqual(result.id, 100000)
+
+    async def test_that_follow_users_only_posts_for_artists_not_followed(self):
+        # Arrange
+        mock = mocks.replay_session(
+            mocks.artist_response("first", 1, False),
+            mocks.artist_response("second", 2, True),
+            mocks.response(
+                "https://api-v2.hearthis.at/user_ajax_function.php",
+                {"follow": True},
+                method="POST",
+            ),
+        )
+        user = mocks.create_logged_in_user()
+        artists = [
+            User(id, permalink, permalink, "", "", "")
+            for (id, permalink) in [(1, "first"), (2, "second"), (3, "third")]
+        ]
+        track = mocks.create_single_track()
+        track = track._replace(user=artists[0])
+        following = {"3"}
+        sut = HearThis(mock)
+
+        # Act
+        result = await sut.follow_users(user, [track] + artists, following=following)
+
+        # Assert
+        self.assertEqual(
+            [(r.permalink, r.outcome) for r in result],
+            [
+                ("first", FollowOutcome.FOLLOWED),
+                ("second", FollowOutcome.ALREADY_FOLLOWING),
+                ("third", FollowOutcome.ALREADY_FOLLOWING),
+            ],
+        )
+        posts = [request for request in mock.requests if request.method == "POST"]
+        self.assertEqual(len(mock.requests), 3)
+        self.assertEqual(posts[0].options["data"]["userid"], 1)
+        self.assertEqual(following, {"1", "2", "3"})
+
+    async def test_that_follow_users_toggles_back_an_outdated_state(self):
+        # Arrange
+        follow_reply = "https://api-v2.hearthis.at/user_ajax_function.php"
+        mock = mocks.replay_session(
+            mocks.artist_response("first", 1, False),
+            mocks.response(follow_reply, {"follow": False}, method="POST"),
+            mocks.response(follow_reply, {"follow": True}, method="POST"),
+        )
+        user = mocks.create_logged_in_user()
+        sut = HearThis(mock)
+
+        # Act
+        result = await sut.follow_users(user, [User(1, "first", "first", "", "", "")])
+
+        # Assert
+        self.assertEqual(result[0].outcome, FollowOutcome.FOLLOWED)
+        posts = [request for request in mock.requests if request.method == "POST"]
+        self.assertEqual(len(posts), 2)
+
+    async def test_that_unfollow_users_only_posts_for_followed_artists(self):
+        # Arrange
+        mock = mocks.replay_session(
+            mocks.artist_response("first", 1, True),
+            mocks.artist_response("second", 2, False),
+            mocks.response(
+                "https://api-v2.hearthis.at/user_ajax_function.php",
+                {"follow": False},
+                method="POST",
+            ),
+        )
+        user = mocks.create_logged_in_user()
+        artists = [
+            User(id, permalink, permalink, "", "", "")
+            for (id, permalink) in [(1, "first"), (2, "second")]
+        ]
+        following = {"1", "2"}
+        sut = HearThis(mock)
+
+        # Act
+        result = await sut.unfollow_users(user, artists, following=following)
+
+        # Assert
+        self.assertEqual(
+            [r.outcome for r in result],
+            [FollowOutcome.UNFOLLOWED, FollowOutcome.NOT_FOLLOWING],
+        )
+        posts = [request for request in mock.requests if request.method == "POST"]
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(posts[0].options["data"]["userid"], 1)
+        self.assertEqual(following, set())
+
+    async def test_that_executor_mode_returns_expected_data(self):
+        # Arrange
+        mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/myuserpermalink/",
+                "get_artist_tracks_response.json",
+                key="mykey",
+                secret="mysecret",
+                type="tracks",
+                page="1",
+                count="5",
+            )
+        )
+        user = mocks.create_logged_in_user()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            sut = HearThis(mock, executor)
+
+            # Act
+            result = await sut.get_artist_tracks(user, "myuserpermalink")
+
+        # Assert
+        feed = result[0]
+        self.assertEqual(feed.title, "Shawne @ Back To The Roots 2 (05.07.2014)")
+        self.assertIsNotNone(feed.user.username)
+        self.assertEqual(feed.id, 48250)
+
+    async def test_that_get_waveform_samples_returns_expected_data(self):
+        # Arrange
+        client_session_mock = mocks.replay_session(
+            mocks.response(
+                "https://waveform.data", response_data.WAVEFORM_RESPONSE_DATA
+            )
+        )
+        track = mocks.create_single_track()
+        sut = HearThis(client_session_mock)
+
+        # Act
+        result = await sut.get_waveform_samples(track)
+
+        # Assert
+        self.assertEqual(result[:3], [187, 191, 215])
+        self.assertEqual(result[-1], 128)
+
+    async def test_that_search_users_sends_user_search_type(self):
+        # Arrange
+        mock = mocks.replay_session(
+            mocks.response(
+                "https://api-v2.hearthis.at/search/",
+                [{"id": "7", "permalink": "shawne", "username": "Shawne"}],
+                key="mykey",
+                secret="mysecret",
+                t="Shawne",
+                type="user",
+                page="1",
+                count="5",
+            )
+        )
+        user = mocks.create_logged_in_user()
+        sut = HearThis(mock)
+
+        # Act
+        result = await sut.search_users(user, "Shawne")
+
+        # Assert
+        self.assertEqual(result[0].id, 7)
+        self.assertEqual(result[0].permalink, "shawne")
+        self.assertIsNone(result[0].avatar_url)
+
+    async def test_that_sync_playlist_applies_only_the_difference(self):
+        # Arrange
+        client_session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/mymail-oc",
+                "get_playlists_response.json",
+                key="mykey",
+                secret="mysecret",
+                page="1",
+                count="20",
+                type="playlists",
+            ),
+            mocks.json_response(
+                "https://api-v2.hearthis.at/set/438-7/",
+                "get_playlist_tracks_response.json",
+                key="mykey",
+                secret="mysecret",
+            ),
+            mocks.response(
+                "https://api-v2.hearthis.at/set_ajax_add.php", "", method="POST"
+            ),
+        )
+        user = mocks.create_logged_in_user()
+        sut = HearThis(client_session_mock)
+
+        # Act
+        result = await sut.sync_playlist(user, "Back In Time", [12345, 99, 99])
+
+        # Assert
+        self.assertEqual(result.playlist.id, 438)
+        self.assertEqual(result.added, [99])
+        self.assertEqual(result.removed, [])
+        self.assertFalse(result.created)
+        posted = [
+            request.options["data"]
+            for request in client_session_mock.requests
+            if request.method == "POST"
+        ]
+        self.assertEqual(
+            posted,
+            [
+                {
+                    "action": "add",
+                    "key": "mykey",
+                    "secret": "mysecret",
+                    "track_id": 99,
+                    "set": 438,
+                }
+            ],
+        )
+
+    async def test_that_sync_playlist_does_not_read_state_from_the_cache(self):
+        # Arrange
+        def playlists_response(content):
+            return mocks.response(
+                "https://api-v2.hearthis.at/mymail-oc",
+                content,
+                key="mykey",
+                secret="mysecret",
+                page="1",
+                count="20",
+                type="playlists",
+            )
+
+        client_session_mock = mocks.replay_session(
+            playlists_response([]),
+            playlists_response([]),
+            playlists_response(mocks.load_response("get_playlists_response.json")),
+            mocks.response(
+                "https://api-v2.hearthis.at/set_ajax_add.php", "", method="POST"
+            ),
+        )
+        user = mocks.create_logged_in_user()
+        cache = ResponseCache(ttl=60)
+        sut = HearThis(client_session_mock, response_cache=cache)
+        await sut.get_playlists(user, 1, 20)
+
+        # Act
+        result = await sut.sync_playlist(user, "Back In Time", [99])
+
+        # Assert
+        self.assertTrue(result.created)
+        self.assertEqual(result.playlist.id, 438)
+        self.assertEqual(result.added, [99])
+        self.assertEqual(len(cache), 0)
+
+    async def test_that_follow_users_does_not_read_state_from_the_cache(self):
+        # Arrange
+        mock = mocks.replay_session(
+            mocks.artist_response("first", 1, False),
+            mocks.artist_response("first", 1, True),
+        )
+        user = mocks.create_logged_in_user()
+        sut = HearThis(mock, response_cache=ResponseCache(ttl=60))
+        await sut.get_single_artist(user, "first")
+        artist = User(1, "first", "first", "", "", "")
+
+        # Act
+        result = await sut.follow_users(user, [artist])
+
+        # Assert
+        self.assertEqual(result[0].outcome, FollowOutcome.ALREADY_FOLLOWING)
+        self.assertEqual(len(mock.requests), 2)
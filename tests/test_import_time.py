@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+from unittest import TestCase, skipUnless
+
+BENCHMARK = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "benchmarks",
+    "import_time.py",
+)
+
+
+def run_benchmark(*arguments: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, BENCHMARK, "--runs", "3", *arguments],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
+class ImportTimeTests(TestCase):
+    def test_that_client_import_does_not_load_aiohttp(self):
+        result = run_benchmark("--module", "pyhearthis.hearthis", "--forbid", "aiohttp")
+
+        self.assertEqual(result.returncode, 0, result.stdout)
+
+    def test_that_package_import_loads_no_subsystem(self):
+        result = run_benchmark(
+            "--module",
+            "pyhearthis",
+            "--forbid",
+            "pyhearthis.hearthis",
+            "--forbid",
+            "asyncio",
+        )
+
+        self.assertEqual(result.returncode, 0, result.stdout)
+
+    def test_that_lazy_attributes_resolve(self):
+        import pyhearthis
+        from pyhearthis.hearthis import HearThis
+
+        self.assertIs(pyhearthis.HearThis, HearThis)
+        self.assertIn("CatalogStatistics", dir(pyhearthis))
+        missing = "Missing"
+        with self.assertRaises(AttributeError):
+            getattr(pyhearthis, missing)
+
+
+@skipUnless(
+    os.environ.get("PYHEARTHIS_IMPORT_BUDGETS"), "set PYHEARTHIS_IMPORT_BUDGETS=1"
+)
+class ImportBudgetTests(TestCase):
+    # Wall clock budgets depend on the machine, so they only run on request.
+    # They leave room for slow machines, an eager aiohttp import alone takes
+    # longer than the budget of the client.
+
+    def test_that_client_import_stays_within_budget(self):
+        result = run_benchmark("--module", "pyhearthis.hearthis", "--max-ms", "150")
+
+        self.assertEqual(result.returncode, 0, result.stdout)
+
+    def test_that_package_import_stays_within_budget(self):
+        result = run_benchmark("--module", "pyhearthis", "--max-ms", "20")
+
+        self.assertEqual(result.returncode, 0, result.stdout)
@@ -0,0 +1,78 @@
+import json
+import os
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from pyhearthis.hearthis import HearThis
+from pyhearthis.interning import InternRegistry
+from pyhearthis.recording import paging_matcher
+from pyhearthis.models import cast_list
+from tests import mocks
+
+
+def load_tracks_json() -> list:
+    file = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__), "response_data", "get_feeds_response.json"
+        )
+    )
+    with open(file, "r") as json_data:
+        return cast_list(json.loads(json_data.read()))
+
+
+class InternRegistryTests(TestCase):
+    def test_that_tracks_of_the_same_user_share_one_user_instance(self):
+        sut = InternRegistry()
+
+        first = sut.track(load_tracks_json()[0])
+        second = sut.track(load_tracks_json()[0])
+
+        self.assertIs(first.user, second.user)
+        self.assertIs(first.genre, second.genre)
+        self.assertEqual(len(sut), 1)
+
+    def test_that_changed_user_data_replaces_the_canonical_user(self):
+        sut = InternRegistry()
+        first = sut.track(load_tracks_json()[0])
+        changed = load_tracks_json()[0]
+        changed["user"]["avatar_url"] = "https://new.avatar"
+
+        second = sut.track(changed)
+
+        self.assertIsNot(first.user, second.user)
+        self.assertEqual(second.user.avatar_url, "https://new.avatar")
+
+    def test_that_registry_is_bounded(self):
+        sut = InternRegistry(max_users=1)
+        first = load_tracks_json()[0]
+        second = load_tracks_json()[0]
+        second["user"]["id"] = "8"
+
+        sut.track(first)
+        sut.track(second)
+
+        self.assertEqual(len(sut), 1)
+
+
+class InterningClientTests(IsolatedAsyncioTestCase):
+    async def test_that_client_returns_canonical_users(self):
+        # Arrange
+        mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/feed/",
+                "get_feeds_response.json",
+                key="mykey",
+                secret="mysecret",
+                page="1",
+                count="5",
+            ),
+            matcher=paging_matcher,
+        )
+        user = mocks.create_logged_in_user()
+        sut = HearThis(mock, interning=InternRegistry())
+
+        # Act
+        first = await sut.get_feeds(user, page=1)
+        second = await sut.get_feeds(user, page=2)
+
+        # Assert
+        self.assertIs(first[0].user, second[0].user)
@@ -0,0 +1,178 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from pyhearthis.decoding import json_to_track
+from pyhearthis.pipeline import (
+    ErrorPolicy,
+    Pipeline,
+    Stage,
+    artist_stage,
+    paged_source,
+)
+from tests import mocks
+
+
+class PipelineTests(IsolatedAsyncioTestCase):
+    async def test_that_ordered_stage_keeps_the_input_order(self):
+        # Arrange
+        async def slow_for_small_numbers(number):
+            await asyncio.sleep(0.01 * (5 - number % 5))
+            return [number, number]
+
+        sut = Pipeline(
+            range(20),
+            [Stage("double", slow_for_small_numbers, 4, ordered=True, flatten=True)],
+        )
+
+        # Act
+        result = [item async for item in sut.results()]
+
+        # Assert
+        self.assertEqual(result, [n for n in range(20) for _ in range(2)])
+        self.assertEqual(sut.stats()[0].processed, 20)
+        self.assertEqual(sut.stats()[0].emitted, 40)
+
+    async def test_that_slow_sink_slows_down_the_source(self):
+        # Arrange
+        produced = []
+        consumed = []
+
+        def produce():
+            for number in range(100):
+                produced.append(number)
+                yield number
+
+        async def sink(number):
+            await asyncio.sleep(0.001)
+            consumed.append(number)
+            # items in queues and in flight stay bounded
+            self.assertLessEqual(len(produced) - len(consumed), 12)
+
+        sut = Pipeline(
+            produce(),
+            [Stage("forward", lambda n: n, 1), Stage("sink", sink, 1)],
+            queue_size=2,
+        )
+
+        # Act
+        stats = await sut.run()
+
+        # Assert
+        self.assertEqual(len(consumed), 100)
+        self.assertGreater(stats[0].blocked_seconds, 0)
+
+    async def test_that_poisoned_items_are_dropped_after_retries(self):
+        # Arrange
+        attempts = []
+
+        def fail_on_three(number):
+            attempts.append(number)
+            if number == 3:
+                raise ValueError(number)
+            return number
+
+        sut = Pipeline(range(5), [Stage("check", fail_on_three, 2, retries=1)])
+
+        # Act
+        result = sorted([item async for item in sut.results()])
+
+        # Assert
+        self.assertEqual(result, [0, 1, 2, 4])
+        self.assertEqual(attempts.count(3), 2)
+        self.assertEqual(sut.poisoned[0].item, 3)
+        self.assertEqual(sut.stats()[0].failed, 1)
+
+    async def test_that_fail_policy_stops_the_pipeline(self):
+        def fail(number):
+            raise ValueError(number)
+
+        sut = Pipeline(range(1000), [Stage("fail", fail, on_error=ErrorPolicy.FAIL)])
+
+        with self.assertRaises(ValueError):
+            await sut.run()
+
+    async def test_that_paged_source_stops_at_a_short_page(self):
+        # Arrange
+        pages = []
+
+        async def fetch_page(prefix, page, count):
+            pages.append(page)
+            return [f"{prefix}{page}"] * (count if page < 3 else 1)
+
+        # Act
+        result = [item async for item in paged_source(fetch_page, "p", count=2)]
+
+        # Assert
+        self.assertEqual(pages, [1, 2, 3])
+        self.assertEqual(result, ["p1", "p1", "p2", "p2", "p3"])
+
+    async def test_that_artist_stage_requests_every_artist_once(self):
+        # Arrange
+        track = json_to_track(mocks.load_response("single_track.json"))
+        requested = []
+
+        class Client:
+            async def get_single_artist(self, user, permalink):
+                requested.append(permalink)
+                await asyncio.sleep(0.01)
+                return permalink
+
+        sut = Pipeline([track] * 5, [artist_stage(Client(), None, workers=5)])
+
+        # Act
+        result = [item async for item in sut.results()]
+
+        # Assert
+        self.assertEqual(len(result), 5)
+        self.assertEqual(requested, [track.user.permalink])
+        self.assertTrue(all(item.artist == track.user.permalink for item in result))
+
+    async def test_that_artist_stage_keeps_a_bounded_number_of_artists(self):
+        # Arrange
+        track = json_to_track(mocks.load_response("single_track.json"))
+        tracks = [
+            track._replace(user=track.user._replace(permalink=f"artist{n % 6}"))
+            for n in range(12)
+        ]
+        requested = []
+
+        class Client:
+            async def get_single_artist(self, user, permalink):
+                requested.append(permalink)
+                return permalink
+
+        sut = Pipeline(tracks, [artist_stage(Client(), None, workers=1, queue_size=4)])
+
+        # Act
+        result = [item async for item in sut.results()]
+
+        # Assert
+        self.assertEqual(len(result), 12)
+        self.assertEqual(len(requested), 12)
+
+    async def test_that_artist_requests_are_cancelled_when_the_pipeline_fails(self):
+        # Arrange
+        track = json_to_track(mocks.load_response("single_track.json"))
+        cancelled = []
+
+        class Client:
+            async def get_single_artist(self, user, permalink):
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.append(permalink)
+                    raise
+
+        async def source():
+            yield track
+            await asyncio.sleep(0.01)
+            raise ValueError("source failed")
+
+        sut = Pipeline(source(), [artist_stage(Client(), None)])
+
+        # Act
+        with self.assertRaises(ValueError):
+            await sut.run()
+
+        # Assert
+        self.assertEqual(cancelled, [track.user.permalink])
@@ -0,0 +1,163 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock
+
+from pyhearthis.errors import AuthenticationError, RequestError
+from pyhearthis.hearthis import HearThis
+from pyhearthis.pool import HearThisPool, PoolStrategy, UnknownCredentialError
+from tests import mocks
+
+
+def create_users():
+    first = mocks.create_logged_in_user()
+    second = first._replace(id=2, key="otherkey", secret="othersecret")
+    return first, second
+
+
+class HearThisPoolTests(IsolatedAsyncioTestCase):
+    async def test_that_round_robin_spreads_reads_over_all_credentials(self):
+        # Arrange
+        first, second = create_users()
+        hearthis = AsyncMock()
+        hearthis.search.return_value = []
+        sut = HearThisPool(hearthis, [first, second], PoolStrategy.ROUND_ROBIN)
+
+        # Act
+        for _ in range(4):
+            await sut.search("MySearchQuery")
+
+        # Assert
+        used_keys = [call.args[0].key for call in hearthis.search.call_args_list]
+        self.assertEqual(used_keys, ["mykey", "otherkey", "mykey", "otherkey"])
+
+    async def test_that_failing_credential_backs_off(self):
+        # Arrange
+        first, second = create_users()
+        hearthis = AsyncMock()
+        hearthis.search.side_effect = [ConnectionError(), [], []]
+        sut = HearThisPool(hearthis, [first, second], base_backoff=60)
+
+        # Act
+        with self.assertRaises(ConnectionError):
+            await sut.search("MySearchQuery")
+        await sut.search("MySearchQuery")
+        await sut.search("MySearchQuery")
+
+        # Assert
+        used_keys = [call.args[0].key for call in hearthis.search.call_args_list]
+        self.assertEqual(used_keys, ["mykey", "otherkey", "otherkey"])
+        stats = sut.stats()
+        self.assertEqual(stats[0].consecutive_failures, 1)
+        self.assertGreater(stats[0].backoff_remaining, 0)
+
+    async def test_that_rate_limited_json_reads_back_off_a_credential(self):
+        # Arrange
+        first, second = create_users()
+
+        def search_response(key: str, secret: str):
+            return mocks.json_response(
+                "https://api-v2.hearthis.at/search/",
+                "search_response.json",
+                key=key,
+                secret=secret,
+                t="MySearchQuery",
+                page="1",
+                count="5",
+            )
+
+        session = mocks.replay_session(
+            search_response("mykey", "mysecret")._replace(status=429),
+            search_response("otherkey", "othersecret"),
+        )
+        sut = HearThisPool(HearThis(session), [first, second], base_backoff=60)
+
+        # Act
+        with self.assertRaises(RequestError) as context:
+            await sut.search("MySearchQuery")
+        results = [await sut.search("MySearchQuery") for _ in range(2)]
+
+        # Assert
+        self.assertEqual(context.exception.status, 429)
+        self.assertTrue(all(len(result) > 0 for result in results))
+        self.assertEqual(len(session.requests), 3)
+        self.assertIn("otherkey", session.requests[-1].url)
+        self.assertGreater(sut.stats()[0].backoff_remaining, 0)
+
+    async def test_that_caller_errors_do_not_back_off_a_credential(self):
+        # Arrange
+        first, second = create_users()
+        hearthis = AsyncMock()
+        hearthis.search.side_effect = [
+            AssertionError(),
+            AuthenticationError(401),
+            RequestError(404),
+            RequestError(503),
+        ]
+        sut = HearThisPool(hearthis, [first], base_backoff=60)
+
+        # Act
+        for error in [AssertionError, AuthenticationError, RequestError]:
+            with self.assertRaises(error):
+                await sut.search("MySearchQuery")
+        healthy = sut.stats()[0]
+        with self.assertRaises(RequestError):
+            await sut.search("MySearchQuery")
+
+        # Assert
+        self.assertEqual(healthy.failures, 0)
+        self.assertEqual(healthy.backoff_remaining, 0)
+        self.assertEqual(sut.stats()[0].failures, 1)
+
+    async def test_that_busy_credentials_are_handed_over_on_release(self):
+        # Arrange
+        first, _ = create_users()
+        release = asyncio.Event()
+
+        async def search(user, *args):
+            await release.wait()
+            return []
+
+        hearthis = AsyncMock()
+        hearthis.search.side_effect = search
+        sut = HearThisPool(hearthis, [first], max_in_flight=1)
+
+        # Act
+        searches = [asyncio.ensure_future(sut.search("Query")) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        in_flight = sut.stats()[0].in_flight
+        release.set()
+        await asyncio.wait_for(asyncio.gather(*searches), 1)
+
+        # Assert
+        self.assertEqual(in_flight, 1)
+        self.assertEqual(hearthis.search.await_count, 3)
+
+    async def test_that_write_operations_are_pinned_to_the_owner(self):
+        # Arrange
+        first, second = create_users()
+        playlist = mocks.create_playlist()
+        hearthis = AsyncMock()
+        sut = HearThisPool(hearthis, [first, second])
+
+        # Act
+        await sut.delete_playlist(second, playlist)
+
+        # Assert
+        hearthis.delete_playlist.assert_awaited_once_with(second, playlist)
+        stranger = first._replace(id=3)
+        with self.assertRaises(UnknownCredentialError):
+            await sut.delete_playlist(stranger, playlist)
+
+    async def test_that_follows_are_pinned_to_the_owner(self):
+        # Arrange
+        first, second = create_users()
+        track = mocks.create_single_track()
+        hearthis = AsyncMock()
+        hearthis.follow_users.return_value = []
+        sut = HearThisPool(hearthis, [first, second])
+
+        # Act
+        await sut.follow_users(second, [track])
+
+        # Assert
+        hearthis.follow_users.assert_awaited_once_with(second, [track], 8, None)
@@ -0,0 +1,76 @@
+import tracemalloc
+from unittest import IsolatedAsyncioTestCase
+
+from pyhearthis.hearthis import HearThis
+from pyhearthis.profiling import AllocationProfiler
+from tests import mocks
+
+
+class AllocationProfilerTests(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.profiler = AllocationProfiler(sample_rate=1.0)
+
+    def tearDown(self) -> None:
+        self.profiler.stop()
+
+    async def test_that_allocations_are_attributed_to_method_and_route(self):
+        # Arrange
+        session = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/feed/",
+                "get_feeds_response.json",
+                key="mykey",
+                secret="mysecret",
+                page="1",
+                count="5",
+            )
+        )
+        user = mocks.create_logged_in_user()
+        sut = HearThis(session, profiler=self.profiler)
+
+        # Act
+        tracks = await sut.get_feeds(user)
+
+        # Assert
+        report = self.profiler.report()
+        self.assertEqual(len(tracks), 1)
+        self.assertEqual(report[0].method, "get_feeds")
+        self.assertEqual(report[0].route, "feed")
+        self.assertEqual(report[0].samples, 1)
+        self.assertGreater(report[0].peak, 0)
+        self.assertGreater(report[0].mean_retained, 0)
+        self.assertTrue(report[0].sites)
+        self.assertIn("get_feeds", self.profiler.format_report())
+        self.assertFalse(tracemalloc.is_tracing())
+
+    async def test_that_nested_calls_are_not_sampled_twice(self):
+        # Arrange
+        session = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/mymail-oc",
+                "get_playlists_response.json",
+                key="mykey",
+                secret="mysecret",
+                page="1",
+                count="20",
+                type="playlists",
+            ),
+            mocks.json_response(
+                "https://api-v2.hearthis.at/set/438-7/",
+                "get_playlist_tracks_response.json",
+                key="mykey",
+                secret="mysecret",
+            ),
+        )
+        user = mocks.create_logged_in_user()
+        sut = HearThis(session, profiler=self.profiler)
+
+        # Act
+        await sut.sync_playlist(user, "Back In Time", [12345])
+
+        # Assert
+        report = {item.method: item for item in self.profiler.report()}
+        self.assertEqual(report["sync_playlist"].samples, 1)
+        self.assertEqual(report["sync_playlist"].route, "artist,set")
+        self.assertEqual(report["get_playlists"].calls, 1)
+        self.assertEqual(report["get_playlists"].samples, 0)
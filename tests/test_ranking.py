@@ -0,0 +1,97 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock
+
+from pyhearthis.hearthis import FeedType
+from pyhearthis.ranking import RankKey, TopTracks, get_top_tracks
+from tests import mocks
+
+
+def create_track(track_id: int, playback_count: int):
+    return mocks.create_single_track()._replace(
+        id=track_id, playback_count=playback_count
+    )
+
+
+class TopTracksTests(TestCase):
+    def test_that_only_the_best_unique_tracks_are_kept(self):
+        sut = TopTracks(2, RankKey.PLAYBACK_COUNT)
+
+        sut.offer_all([create_track(1, 10), create_track(2, 30), create_track(3, 20)])
+        sut.offer(create_track(2, 30))
+
+        self.assertEqual([track.id for track in sut.result()], [2, 3])
+        self.assertEqual(sut.seen_count, 3)
+
+    def test_that_memory_stays_bounded_over_long_scans(self):
+        sut = TopTracks(2, RankKey.PLAYBACK_COUNT)
+
+        for track_id in range(1000):
+            sut.offer(create_track(track_id, track_id % 100))
+        sut.offer(create_track(99, 99))
+
+        self.assertEqual([track.id for track in sut.result()], [99, 199])
+        self.assertEqual(len(sut._ids), 2)
+        self.assertAlmostEqual(sut.seen_count, 1000, delta=20)
+
+
+class GetTopTracksTests(IsolatedAsyncioTestCase):
+    async def test_that_categories_and_feeds_are_merged(self):
+        # Arrange
+        hearthis = AsyncMock()
+        hearthis.get_categories.return_value = [mocks.create_category()] * 2
+        hearthis.get_category_tracks.side_effect = [
+            [create_track(1, 5), create_track(2, 50)],
+            [create_track(2, 50), create_track(3, 7)],
+        ]
+        hearthis.get_feeds.return_value = [create_track(4, 100)]
+        user = mocks.create_logged_in_user()
+
+        # Act
+        result = await get_top_tracks(
+            hearthis, user, n=3, feed_types=[FeedType.POPULAR]
+        )
+
+        # Assert
+        self.assertEqual([track.id for track in result.tracks], [4, 2, 3])
+        self.assertTrue(result.complete)
+        self.assertEqual(result.seen_tracks, 4)
+
+    async def test_that_partial_results_are_returned_on_timeout(self):
+        # Arrange
+        async def get_category_tracks(user, category, page, count):
+            if category.id == "slow":
+                await asyncio.sleep(10)
+            return [create_track(1, 5)]
+
+        hearthis = AsyncMock()
+        hearthis.get_category_tracks.side_effect = get_category_tracks
+        fast = mocks.create_category()
+        slow = fast._replace(id="slow")
+        user = mocks.create_logged_in_user()
+
+        # Act
+        result = await get_top_tracks(
+            hearthis, user, categories=[fast, slow], timeout=0.05
+        )
+
+        # Assert
+        self.assertFalse(result.complete)
+        self.assertEqual([track.id for track in result.tracks], [1])
+
+    async def test_that_the_timeout_covers_loading_the_categories(self):
+        # Arrange
+        async def get_categories():
+            await asyncio.sleep(10)
+
+        hearthis = AsyncMock()
+        hearthis.get_categories.side_effect = get_categories
+        user = mocks.create_logged_in_user()
+
+        # Act
+        result = await get_top_tracks(hearthis, user, timeout=0.05)
+
+        # Assert
+        self.assertFalse(result.complete)
+        self.assertEqual(result.tracks, [])
+        hearthis.get_category_tracks.assert_not_awaited()
@@ -0,0 +1,144 @@
+import os
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase
+
+from pyhearthis.hearthis import HearThis
+from pyhearthis.recording import (
+    Cassette,
+    RecordingSession,
+    ReplaySession,
+    UnmatchedRequestError,
+    paging_matcher,
+)
+from tests import mocks
+
+
+def feed_response(page: str):
+    return mocks.json_response(
+        "https://api-v2.hearthis.at/feed/",
+        "get_feeds_response.json",
+        key="mykey",
+        secret="mysecret",
+        page=page,
+        count="5",
+    )
+
+
+class RecordingTests(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "feeds.json.gz")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    async def record_feeds(self) -> None:
+        upstream = mocks.replay_session(feed_response("1"))
+        session = RecordingSession(upstream)
+        await HearThis(session).get_feeds(mocks.create_logged_in_user())
+        session.save(self.path)
+
+    async def test_that_cassette_does_not_contain_credentials(self):
+        # Act
+        await self.record_feeds()
+
+        # Assert
+        cassette = Cassette.load(self.path)
+        self.assertEqual(len(cassette), 1)
+        url = cassette.interactions[0].request.url
+        self.assertNotIn("mykey", url)
+        self.assertNotIn("mysecret", url)
+        self.assertIn("key=REDACTED", url)
+
+    async def test_that_recorded_login_response_is_redacted(self):
+        # Arrange
+        upstream = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/login",
+                "login_response.json",
+                email="mymail@test.de",
+                password="mypassword",
+            )
+        )
+        session = RecordingSession(upstream)
+
+        # Act
+        user = await HearThis(session).login("mymail@test.de", "mypassword")
+        session.save(self.path)
+
+        # Assert
+        self.assertEqual((user.key, user.secret), ("mykey", "mysecret"))
+        interaction = Cassette.load(self.path).interactions[0]
+        stored = interaction.content.decode() + interaction.request.url
+        secrets = ["mykey", "mysecret", "mypassword", "mymail@test.de", "mymail%40"]
+        for secret in secrets:
+            self.assertNotIn(secret, stored)
+        self.assertIn('"key": "REDACTED"', stored)
+
+    async def test_that_recorded_tracks_keep_their_key(self):
+        # Act
+        await self.record_feeds()
+
+        # Assert
+        sut = HearThis(ReplaySession.from_file(self.path))
+        tracks = await sut.get_feeds(mocks.create_logged_in_user())
+        recorded = HearThis(mocks.replay_session(feed_response("1")))
+        expected = await recorded.get_feeds(mocks.create_logged_in_user())
+        self.assertNotEqual(expected[0].key, "REDACTED")
+        self.assertEqual(tracks[0].key, expected[0].key)
+
+    async def test_that_test_replays_reject_other_credentials(self):
+        # Arrange
+        user = mocks.create_logged_in_user()._replace(key="wrong")
+        sut = HearThis(mocks.replay_session(feed_response("1")))
+
+        # Act / Assert
+        with self.assertRaises(UnmatchedRequestError):
+            await sut.get_feeds(user)
+
+    async def test_that_replay_returns_recorded_data(self):
+        # Arrange
+        await self.record_feeds()
+        user = mocks.create_logged_in_user()._replace(key="other", secret="other")
+        sut = HearThis(ReplaySession.from_file(self.path))
+
+        # Act
+        result = await sut.get_feeds(user)
+
+        # Assert
+        self.assertEqual(result[0].id, 48250)
+
+    async def test_that_paging_matcher_serves_other_pages(self):
+        # Arrange
+        await self.record_feeds()
+        user = mocks.create_logged_in_user()
+        exact = HearThis(ReplaySession.from_file(self.path))
+        fuzzy = HearThis(ReplaySession.from_file(self.path, matcher=paging_matcher))
+
+        # Act
+        result = await fuzzy.get_feeds(user, page=3)
+
+        # Assert
+        self.assertEqual(result[0].id, 48250)
+        with self.assertRaises(UnmatchedRequestError):
+            await exact.get_feeds(user, page=3)
+
+    async def test_that_recorded_latency_is_replayed(self):
+        # Arrange
+        interaction = feed_response("1")._replace(latency=0.05)
+        user = mocks.create_logged_in_user()
+        fast = HearThis(mocks.replay_session(interaction))
+        recorded = HearThis(mocks.replay_session(interaction, latency_scale=1.0))
+
+        # Act
+        started = time.monotonic()
+        await fast.get_feeds(user)
+        fast_duration = time.monotonic() - started
+        started = time.monotonic()
+        await recorded.get_feeds(user)
+        recorded_duration = time.monotonic() - started
+
+        # Assert
+        self.assertLess(fast_duration, 0.05)
+        self.assertGreaterEqual(recorded_duration, 0.05)
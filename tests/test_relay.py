@@ -0,0 +1,163 @@
+import asyncio
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from pyhearthis.hearthis import HearThis
+from pyhearthis.relay import ChunkCache, StreamRelay, parse_range
+from tests import mocks
+
+
+class UpstreamResponseMock:
+    def __init__(
+        self, data: bytes, first: int, last: int, unknown_size: bool = False
+    ) -> None:
+        self.status = 206
+        self.body = data[first : last + 1]
+        size = "*" if unknown_size else len(data)
+        self.headers = {"Content-Range": f"bytes {first}-{last}/{size}"}
+        if first >= len(data):
+            self.status = 416
+            self.body = b""
+            self.headers = {"Content-Range": f"bytes */{size}"}
+
+    async def __aenter__(self):
+        await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def read(self) -> bytes:
+        return self.body
+
+
+class UpstreamSessionMock:
+    def __init__(self, data: bytes, unknown_size: bool = False) -> None:
+        self.data = data
+        self.unknown_size = unknown_size
+        self.ranges = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.ranges.append(headers["Range"])
+        first, last = headers["Range"][len("bytes=") :].split("-")
+        last = min(int(last), len(self.data) - 1)
+        return UpstreamResponseMock(self.data, int(first), last, self.unknown_size)
+
+
+class ParseRangeTests(TestCase):
+    def test_that_ranges_are_parsed(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=95-200", 100), (95, 99))
+        self.assertIsNone(parse_range("bytes=100-", 100))
+        self.assertIsNone(parse_range("items=0-1", 100))
+
+
+class ChunkCacheTests(TestCase):
+    def test_that_evicted_chunks_are_served_from_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sut = ChunkCache(max_memory_bytes=4, directory=directory)
+
+            sut.put("a", b"1234")
+            sut.put("b", b"5678")
+
+            self.assertEqual(sut.get("a"), b"1234")
+            self.assertIsNone(sut.get("c"))
+            self.assertEqual((sut.hits, sut.misses), (1, 1))
+
+    def test_that_chunk_files_of_an_earlier_process_are_bounded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first = ChunkCache(max_memory_bytes=4, directory=directory)
+            for key in ["a", "b", "c"]:
+                first.put(key, b"1234")
+
+            sut = ChunkCache(max_memory_bytes=4, directory=directory, max_disk_bytes=4)
+            sut.put("d", b"5678")
+            sut.put("e", b"9012")
+
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertEqual(sut.get("d"), b"5678")
+            self.assertIsNone(sut.get("a"))
+
+
+class StreamRelayTests(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.data = bytes(range(256)) * 4
+        self.upstream = UpstreamSessionMock(self.data)
+        self.relay = StreamRelay(HearThis(self.upstream), chunk_size=100)
+        self.path = self.relay.register(mocks.create_single_track())
+        self.client = TestClient(TestServer(self.relay.app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+
+    async def test_that_range_requests_are_served_from_chunks(self):
+        # Act
+        response = await self.client.get(self.path, headers={"Range": "bytes=150-349"})
+        body = await response.read()
+
+        # Assert
+        self.assertEqual(response.status, 206)
+        self.assertEqual(response.headers["Content-Range"], "bytes 150-349/1024")
+        self.assertEqual(body, self.data[150:350])
+        self.assertEqual(
+            self.upstream.ranges,
+            ["bytes=0-99", "bytes=100-199", "bytes=200-299", "bytes=300-399"],
+        )
+
+    async def test_that_concurrent_listeners_share_upstream_fetches(self):
+        # Act
+        responses = await asyncio.gather(
+            *[self.client.get(self.path) for _ in range(3)]
+        )
+        bodies = [await response.read() for response in responses]
+
+        # Assert
+        self.assertTrue(all(body == self.data for body in bodies))
+        self.assertEqual(self.relay.upstream_requests, 11)
+
+    async def test_that_cached_streams_still_answer_ranges(self):
+        # Arrange
+        # a relay started later, the first chunk is in the shared cache
+        await self.client.get(self.path, headers={"Range": "bytes=0-9"})
+        upstream = UpstreamSessionMock(self.data)
+        relay = StreamRelay(HearThis(upstream), self.relay.cache, chunk_size=100)
+        path = relay.register(mocks.create_single_track())
+        client = TestClient(TestServer(relay.app))
+        await client.start_server()
+
+        # Act
+        response = await client.get(path, headers={"Range": "bytes=10-19"})
+        body = await response.read()
+        await client.close()
+
+        # Assert
+        self.assertEqual(response.status, 206)
+        self.assertEqual(response.headers["Content-Range"], "bytes 10-19/1024")
+        self.assertEqual(body, self.data[10:20])
+        self.assertEqual(upstream.ranges, ["bytes=0-0"])
+
+
+class UnknownSizeRelayTests(IsolatedAsyncioTestCase):
+    async def test_that_streams_of_unknown_size_are_sent_without_length(self):
+        # Arrange
+        data = bytes(range(250))
+        relay = StreamRelay(HearThis(UpstreamSessionMock(data, True)), chunk_size=100)
+        path = relay.register(mocks.create_single_track())
+        client = TestClient(TestServer(relay.app))
+        await client.start_server()
+
+        # Act
+        response = await client.get(path, headers={"Range": "bytes=10-20"})
+        body = await response.read()
+        await client.close()
+
+        # Assert
+        self.assertEqual(response.status, 200)
+        self.assertNotIn("Content-Length", response.headers)
+        self.assertEqual(body, data)
@@ -0,0 +1,220 @@
+import asyncio
+import json
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from pyhearthis.errors import CircuitOpenError, RequestError
+from pyhearthis.hearthis import HearThis
+from pyhearthis.resilience import (
+    CircuitBreaker,
+    CircuitBreakers,
+    CircuitState,
+    ResponseCache,
+    response_info,
+)
+
+
+# an outcome which never answers
+HANG = object()
+
+
+class ScriptedResponse:
+    def __init__(self, outcome) -> None:
+        # an int outcome is answered with that status, a (status, body)
+        # tuple with that status and body
+        self.status = outcome if isinstance(outcome, int) else 200
+        if isinstance(outcome, tuple):
+            self.status, outcome = outcome
+        self.outcome = outcome
+
+    async def __aenter__(self):
+        if self.outcome is HANG:
+            await asyncio.sleep(60)
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def json(self):
+        return self.outcome
+
+    async def text(self):
+        return json.dumps(self.outcome)
+
+
+class ScriptedSession:
+    def __init__(self, *outcomes) -> None:
+        self.outcomes = list(outcomes)
+        self.request_count = 0
+
+    def get(self, query, **kwargs):
+        self.request_count += 1
+        return ScriptedResponse(self.outcomes.pop(0))
+
+
+def category(name: str) -> list:
+    return [{"id": name, "name": name, "url": "", "api_url": ""}]
+
+
+class CircuitBreakerTests(TestCase):
+    def test_that_breaker_opens_after_consecutive_failures(self):
+        sut = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+        sut.record_failure()
+        self.assertTrue(sut.allow_request())
+        sut.record_failure()
+
+        self.assertEqual(sut.state, CircuitState.OPEN)
+        self.assertFalse(sut.allow_request())
+
+    def test_that_half_open_breaker_lets_a_single_probe_pass(self):
+        sut = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        sut.record_failure()
+
+        self.assertTrue(sut.allow_request())
+        self.assertEqual(sut.state, CircuitState.HALF_OPEN)
+        self.assertFalse(sut.allow_request())
+
+        sut.record_success(0.0)
+        self.assertEqual(sut.state, CircuitState.CLOSED)
+
+    def test_that_slow_calls_count_as_failures(self):
+        sut = CircuitBreaker(failure_threshold=1, slow_call_threshold=0.5)
+
+        sut.record_success(1.0)
+
+        self.assertEqual(sut.state, CircuitState.OPEN)
+
+
+class ResilientClientTests(IsolatedAsyncioTestCase):
+    async def test_that_open_circuit_serves_stale_response(self):
+        # Arrange
+        session = ScriptedSession(category("acoustic"), ConnectionError())
+        cache = ResponseCache(ttl=0)
+        breakers = CircuitBreakers(failure_threshold=1, reset_timeout=60)
+        sut = HearThis(session, circuit_breakers=breakers, response_cache=cache)
+        await sut.get_categories()
+
+        # Act
+        with response_info() as info:
+            failed = await sut.get_categories()
+            served_while_open = await sut.get_categories()
+
+        # Assert
+        self.assertEqual(failed[0].id, "acoustic")
+        self.assertEqual(served_while_open[0].id, "acoustic")
+        self.assertTrue(info.stale)
+        self.assertEqual(session.request_count, 2)
+        self.assertEqual(breakers.states()["categories"], CircuitState.OPEN)
+
+    async def test_that_open_circuit_without_cache_fails_fast(self):
+        # Arrange
+        session = ScriptedSession(ConnectionError())
+        breakers = CircuitBreakers(failure_threshold=1, reset_timeout=60)
+        sut = HearThis(session, circuit_breakers=breakers)
+        with self.assertRaises(ConnectionError):
+            await sut.get_categories()
+
+        # Act / Assert
+        with self.assertRaises(CircuitOpenError):
+            await sut.get_categories()
+        self.assertEqual(session.request_count, 1)
+
+    async def test_that_expired_entry_is_served_while_revalidating(self):
+        # Arrange
+        session = ScriptedSession(category("acoustic"), category("ambient"))
+        cache = ResponseCache(ttl=0, stale_while_revalidate=True)
+        sut = HearThis(session, response_cache=cache)
+        await sut.get_categories()
+
+        # Act
+        with response_info() as info:
+            stale = await sut.get_categories()
+        await asyncio.sleep(0.01)
+        cache.ttl = 60
+        refreshed = await sut.get_categories()
+
+        # Assert
+        self.assertTrue(info.stale)
+        self.assertEqual(stale[0].id, "acoustic")
+        self.assertEqual(refreshed[0].id, "ambient")
+        self.assertEqual(session.request_count, 2)
+
+    async def test_that_server_errors_count_as_failures_and_keep_stale_data(self):
+        # Arrange
+        session = ScriptedSession(category("acoustic"), 503, 404)
+        cache = ResponseCache(ttl=0)
+        breakers = CircuitBreakers(failure_threshold=2, reset_timeout=60)
+        sut = HearThis(session, circuit_breakers=breakers, response_cache=cache)
+        await sut._get_as_text("set/myset/")
+
+        # Act
+        with response_info() as info:
+            failed = await sut._get_as_text("set/myset/")
+        missing = await sut._get_as_text("set/myset/")
+
+        # Assert
+        self.assertTrue(info.stale)
+        self.assertEqual(json.loads(failed)[0]["id"], "acoustic")
+        self.assertEqual(missing, "")
+        self.assertEqual(breakers.for_family("set")._consecutive_failures, 0)
+        cached = cache.get(("_read_text", "https://api-v2.hearthis.at/set/myset/"))
+        self.assertEqual(json.loads(cached.value)[0]["id"], "acoustic")
+
+    async def test_that_json_server_errors_count_as_failures(self):
+        # Arrange
+        unavailable = (503, {"success": False})
+        missing = (404, {"success": False})
+        session = ScriptedSession(category("acoustic"), unavailable, missing)
+        cache = ResponseCache(ttl=0)
+        breakers = CircuitBreakers(failure_threshold=2, reset_timeout=60)
+        sut = HearThis(session, circuit_breakers=breakers, response_cache=cache)
+        await sut.get_categories()
+
+        # Act
+        with response_info() as info:
+            failed = await sut.get_categories()
+        failures = breakers.for_family("categories")._consecutive_failures
+        answered = await sut.get_categories()
+
+        # Assert
+        self.assertTrue(info.stale)
+        self.assertEqual(failed[0].id, "acoustic")
+        self.assertEqual(failures, 1)
+        self.assertEqual(answered, [])
+        cached = cache.get(("_read_json", "https://api-v2.hearthis.at/categories/"))
+        self.assertEqual(cached.value[0]["id"], "acoustic")
+
+    async def test_that_server_errors_without_cache_are_raised(self):
+        # Arrange
+        session = ScriptedSession(503)
+        breakers = CircuitBreakers(failure_threshold=1, reset_timeout=60)
+        sut = HearThis(session, circuit_breakers=breakers)
+
+        # Act
+        with self.assertRaises(RequestError) as context:
+            await sut._get_raw("set/myset/")
+
+        # Assert
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(breakers.states()["set"], CircuitState.OPEN)
+
+    async def test_that_a_cancelled_probe_releases_the_breaker(self):
+        # Arrange
+        session = ScriptedSession(HANG, category("acoustic"))
+        breakers = CircuitBreakers(failure_threshold=1, reset_timeout=0)
+        breakers.for_family("categories").record_failure()
+        sut = HearThis(session, circuit_breakers=breakers)
+        probe = asyncio.ensure_future(sut.get_categories())
+        await asyncio.sleep(0.01)
+
+        # Act
+        probe.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await probe
+        result = await sut.get_categories()
+
+        # Assert
+        self.assertEqual(result[0].id, "acoustic")
+        self.assertEqual(breakers.states()["categories"], CircuitState.CLOSED)
@@ -0,0 +1,143 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from pyhearthis.hearthis import HearThis
+from pyhearthis.scheduler import Priority, RequestScheduler, request_priority
+from tests import mocks
+
+
+class RequestSchedulerTests(IsolatedAsyncioTestCase):
+    async def test_that_interactive_requests_skip_the_crawl_queue(self):
+        # Arrange
+        sut = RequestScheduler(slots=4, reserved=1)
+        finished = []
+
+        async def request(name: str, duration: float):
+            async with sut.slot():
+                await asyncio.sleep(duration)
+            finished.append(name)
+
+        crawl = [asyncio.ensure_future(request(f"crawl{i}", 0.01)) for i in range(1000)]
+        await asyncio.sleep(0)
+
+        # Act
+        with request_priority(Priority.INTERACTIVE):
+            await asyncio.wait_for(request("interactive", 0), 0.5)
+
+        # Assert
+        metrics = sut.metrics()
+        self.assertLess(len(finished), 10)
+        self.assertEqual(metrics[Priority.INTERACTIVE].dispatched, 1)
+        self.assertGreater(metrics[Priority.DEFAULT].queued, 900)
+        for task in crawl:
+            task.cancel()
+        await asyncio.gather(*crawl, return_exceptions=True)
+
+    async def test_that_waiting_classes_share_slots_by_weight(self):
+        # Arrange
+        sut = RequestScheduler(slots=1, reserved=0)
+        order = []
+
+        async def request(priority: Priority):
+            with request_priority(priority):
+                async with sut.slot():
+                    order.append(priority)
+                    await asyncio.sleep(0)
+
+        async with sut.slot():
+            tasks = [
+                asyncio.ensure_future(request(priority))
+                for priority in [Priority.DEFAULT, Priority.BACKGROUND]
+                for _ in range(40)
+            ]
+            await asyncio.sleep(0)
+
+        # Act
+        await asyncio.gather(*tasks)
+
+        # Assert
+        first = order[:40]
+        self.assertEqual(first.count(Priority.DEFAULT), 30)
+        self.assertEqual(first.count(Priority.BACKGROUND), 10)
+
+    async def test_that_cancelled_waiters_do_not_keep_slots(self):
+        # Arrange
+        sut = RequestScheduler(slots=1, reserved=0)
+
+        async def request():
+            async with sut.slot():
+                await asyncio.sleep(0.01)
+
+        holder = asyncio.ensure_future(request())
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(request())
+        await asyncio.sleep(0)
+
+        # Act
+        waiter.cancel()
+        await holder
+        await asyncio.wait_for(request(), 0.5)
+
+        # Assert
+        metrics = sut.metrics()[Priority.DEFAULT]
+        self.assertEqual(metrics.in_flight, 0)
+        self.assertEqual(metrics.queued, 0)
+
+    async def test_that_client_requests_are_scheduled(self):
+        # Arrange
+        session = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/categories/", "get_categories.json"
+            )
+        )
+        scheduler = RequestScheduler()
+        sut = HearThis(session, scheduler=scheduler)
+
+        # Act
+        with request_priority(Priority.INTERACTIVE):
+            await sut.get_categories()
+
+        # Assert
+        self.assertEqual(scheduler.metrics()[Priority.INTERACTIVE].dispatched, 1)
+
+    async def test_that_searches_are_not_queued_behind_artist_paging(self):
+        # Arrange
+        artist_tracks = mocks.json_response(
+            "https://api-v2.hearthis.at/myuserpermalink/",
+            "get_artist_tracks_response.json",
+            key="mykey",
+            secret="mysecret",
+            type="tracks",
+            page="1",
+            count="5",
+        )._replace(latency=0.05)
+        search = mocks.json_response(
+            "https://api-v2.hearthis.at/search/",
+            "search_response.json",
+            key="mykey",
+            secret="mysecret",
+            t="MySearchQuery",
+            page="1",
+            count="5",
+        )
+        session = mocks.replay_session(artist_tracks, search, latency_scale=1.0)
+        scheduler = RequestScheduler(slots=4, reserved=1)
+        sut = HearThis(session, scheduler=scheduler)
+        user = mocks.create_logged_in_user()
+        crawl = [
+            asyncio.ensure_future(sut.get_artist_tracks(user, "myuserpermalink"))
+            for _ in range(200)
+        ]
+        await asyncio.sleep(0)
+
+        # Act
+        result = await asyncio.wait_for(sut.search(user, "MySearchQuery"), 0.5)
+
+        # Assert
+        metrics = scheduler.metrics()
+        self.assertGreater(len(result), 0)
+        self.assertEqual(metrics[Priority.INTERACTIVE].dispatched, 1)
+        self.assertGreater(metrics[Priority.BACKGROUND].queued, 150)
+        for task in crawl:
+            task.cancel()
+        await asyncio.gather(*crawl, return_exceptions=True)
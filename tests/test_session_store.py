@@ -0,0 +1,142 @@
+import asyncio
+import os
+import stat
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from pyhearthis.errors import AuthenticationError
+from pyhearthis.hearthis import HearThis
+from pyhearthis.session_store import (
+    FileSessionStore,
+    SessionManager,
+    SessionStore,
+    SqliteSessionStore,
+)
+from tests import mocks
+
+
+class LoginCountingClient:
+    # issues a new key on every login and rejects every other key
+    def __init__(self) -> None:
+        self.logins = 0
+        self.valid_key = None
+
+    async def login(self, email: str, password: str):
+        await asyncio.sleep(0.01)
+        self.logins += 1
+        self.valid_key = f"key{self.logins}"
+        return mocks.create_logged_in_user()._replace(key=self.valid_key)
+
+    async def get_feeds(self, user, page: int = 1):
+        if user.key != self.valid_key:
+            raise AuthenticationError(401)
+        return [page]
+
+
+class SessionStoreTests(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_that_stores_keep_credentials_private(self):
+        user = mocks.create_logged_in_user()
+        file_store = FileSessionStore(os.path.join(self.directory.name, "s.json"))
+        sqlite_store = SqliteSessionStore(os.path.join(self.directory.name, "s.db"))
+
+        for store in [file_store, sqlite_store]:
+            store.save("mymail@test.de", user)
+
+            self.assertEqual(store.load("mymail@test.de"), user)
+            self.assertIsNone(store.load("other@test.de"))
+            mode = stat.S_IMODE(os.stat(store.path).st_mode)
+            self.assertEqual(mode, 0o600)
+
+            store.delete("mymail@test.de")
+            self.assertIsNone(store.load("mymail@test.de"))
+
+        sqlite_store.close()
+
+    def test_that_session_store_is_abstract(self):
+        with self.assertRaises(TypeError):
+            SessionStore(os.path.join(self.directory.name, "s.json"))
+
+
+class SessionManagerTests(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "sessions.json")
+        self.client = LoginCountingClient()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def create_manager(self) -> SessionManager:
+        manager = SessionManager(
+            self.client, FileSessionStore(self.path), "mymail@test.de", "secret"
+        )
+        manager.lock_poll_interval = 0.001
+        return manager
+
+    async def test_that_many_workers_log_in_once(self):
+        # Arrange
+        workers = [self.create_manager() for _ in range(50)]
+
+        # Act
+        users = await asyncio.gather(*[worker.user() for worker in workers])
+
+        # Assert
+        self.assertEqual(self.client.logins, 1)
+        self.assertEqual({user.key for user in users}, {"key1"})
+
+    async def test_that_rejected_credentials_are_replaced_once(self):
+        # Arrange
+        FileSessionStore(self.path).save(
+            "mymail@test.de", mocks.create_logged_in_user()._replace(key="expired")
+        )
+        workers = [self.create_manager() for _ in range(10)]
+
+        # Act
+        results = await asyncio.gather(
+            *[worker.get_feeds(page=2) for worker in workers]
+        )
+
+        # Assert
+        self.assertEqual(results, [[2]] * 10)
+        self.assertEqual(self.client.logins, 1)
+        self.assertEqual(FileSessionStore(self.path).load("mymail@test.de").key, "key1")
+
+
+class AuthenticationErrorTests(IsolatedAsyncioTestCase):
+    async def test_that_rejected_credentials_raise_authentication_error(self):
+        # Arrange
+        interaction = mocks.json_response(
+            "https://api-v2.hearthis.at/feed/",
+            "get_feeds_response.json",
+            key="mykey",
+            secret="mysecret",
+            page="1",
+            count="5",
+        )._replace(status=401)
+        sut = HearThis(mocks.replay_session(interaction))
+
+        # Act / Assert
+        with self.assertRaises(AuthenticationError):
+            await sut.get_feeds(mocks.create_logged_in_user())
+
+    async def test_that_rejected_playlist_read_raises_authentication_error(self):
+        # Arrange
+        interaction = mocks.json_response(
+            "https://api-v2.hearthis.at/set/438-7/",
+            "get_playlist_tracks_response.json",
+            key="mykey",
+            secret="mysecret",
+        )._replace(status=403)
+        sut = HearThis(mocks.replay_session(interaction))
+
+        # Act / Assert
+        with self.assertRaises(AuthenticationError):
+            await sut.get_playlist_tracks(
+                mocks.create_logged_in_user(), mocks.create_playlist()
+            )
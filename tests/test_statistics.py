@@ -0,0 +1,125 @@
+import pickle
+import random
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from pyhearthis.statistics import (
+    CatalogStatistics,
+    HyperLogLog,
+    SpaceSaving,
+    TDigest,
+)
+from tests import mocks
+
+
+class TDigestTests(TestCase):
+    def test_that_quantiles_of_merged_digests_are_close(self):
+        # Arrange
+        values = list(range(100000))
+        random.Random(1).shuffle(values)
+        first = TDigest()
+        second = TDigest()
+        for value in values[:50000]:
+            first.add(value)
+        for value in values[50000:]:
+            second.add(value)
+
+        # Act
+        first.merge(second)
+
+        # Assert
+        self.assertEqual(first.count, 100000)
+        self.assertLess(len(first), 200)
+        for q in [0.01, 0.5, 0.9, 0.999]:
+            self.assertAlmostEqual(first.quantile(q), q * 100000, delta=200)
+        self.assertEqual(first.quantile(1.0), 99999)
+
+
+class HyperLogLogTests(TestCase):
+    def test_that_merged_counts_of_overlapping_sets_are_close(self):
+        # Arrange
+        first = HyperLogLog(12)
+        second = HyperLogLog(12)
+        for value in range(30000):
+            first.add(value)
+        for value in range(20000, 50000):
+            second.add(value)
+
+        # Act
+        first.merge(second)
+
+        # Assert
+        self.assertAlmostEqual(first.count(), 50000, delta=50000 * 0.05)
+        with self.assertRaises(ValueError):
+            first.merge(HyperLogLog(10))
+
+    def test_that_small_sets_are_counted_exactly(self):
+        sut = HyperLogLog()
+        for value in ["a", "b", "c", "a"]:
+            sut.add(value)
+
+        self.assertEqual(sut.count(), 3)
+
+
+class SpaceSavingTests(TestCase):
+    def test_that_heavy_hitters_survive_a_long_tail(self):
+        # Arrange
+        items = ["house"] * 500 + ["techno"] * 300 + [f"tag{i}" for i in range(2000)]
+        random.Random(2).shuffle(items)
+        first = SpaceSaving(20)
+        second = SpaceSaving(20)
+        for item in items[:1000]:
+            first.add(item)
+        for item in items[1000:]:
+            second.add(item)
+
+        # Act
+        first.merge(second)
+
+        # Assert
+        top = first.top(2)
+        self.assertEqual([hitter.item for hitter in top], ["house", "techno"])
+        expected_counts = {"house": 500, "techno": 300}
+        for hitter in top:
+            expected = expected_counts[hitter.item]
+            self.assertGreaterEqual(hitter.count, expected)
+            self.assertLessEqual(hitter.count - hitter.error, expected)
+        self.assertEqual(first.total, len(items))
+
+
+class CatalogStatisticsTests(IsolatedAsyncioTestCase):
+    def create_tracks(self, first_id: int, amount: int):
+        track = mocks.create_single_track()
+        for index in range(first_id, first_id + amount):
+            yield track._replace(
+                id=str(index),
+                user_id=str(index % 10),
+                duration=str(60 + index % 240),
+                bpm="0" if index % 2 else "125",
+                genre="House" if index % 3 else "Techno",
+                tags_arr=["deep", f"tag{index % 7}"],
+            )
+
+    async def test_that_statistics_of_parallel_workers_are_merged(self):
+        # Arrange
+        async def source(first_id: int):
+            for track in self.create_tracks(first_id, 600):
+                yield track
+
+        first = await CatalogStatistics().consume(source(0))
+        second = await CatalogStatistics().consume(source(600))
+
+        # Act
+        first.merge(pickle.loads(pickle.dumps(second)))
+        summary = first.overall.summary()
+
+        # Assert
+        self.assertEqual(summary.count, 1200)
+        self.assertAlmostEqual(summary.distinct_tracks, 1200, delta=24)
+        self.assertEqual(summary.distinct_artists, 10)
+        self.assertEqual(summary.top_tags[0].item, "deep")
+        self.assertEqual(summary.top_tags[0].count, 1200)
+        self.assertEqual(summary.top_genres[0].item, "House")
+        self.assertAlmostEqual(summary.quantiles["duration"][0.5], 180, delta=5)
+        self.assertEqual(summary.quantiles["bpm"][0.5], 125)
+        self.assertEqual(first.by_genre["Techno"].count, 400)
+        self.assertEqual(first.by_artist["3"].count, 120)
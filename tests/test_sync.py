@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from pyhearthis.sync import HearThisSync
+from tests import mocks
+
+
+def search_response(query: str):
+    return mocks.json_response(
+        "https://api-v2.hearthis.at/search/",
+        "search_response.json",
+        key="mykey",
+        secret="mysecret",
+        t=query,
+        page="1",
+        count="5",
+    )
+
+
+class HearThisSyncTests(TestCase):
+    def setUp(self) -> None:
+        queries = [f"Query{index}" for index in range(8)] + ["First", "Second"]
+        self.session_mock = mocks.replay_session(
+            mocks.json_response(
+                "https://api-v2.hearthis.at/categories/", "get_categories.json"
+            ),
+            mocks.response(
+                "https://api-v2.hearthis.at/search/",
+                [],
+                key="mykey",
+                secret="mysecret",
+                t="Missing",
+                page="1",
+                count="5",
+            ),
+            *map(search_response, queries),
+        )
+        self.sut = HearThisSync(lambda: self.session_mock)
+
+    def tearDown(self) -> None:
+        self.sut.close()
+
+    def test_that_blocking_call_returns_expected_data(self):
+        # Act
+        result = self.sut.get_categories()
+
+        # Assert
+        self.assertEqual(result[0].id, "acoustic")
+
+    def test_that_calls_from_many_threads_share_one_session(self):
+        # Arrange
+        queries = [f"Query{index}" for index in range(8)]
+        user = mocks.create_logged_in_user()
+
+        # Act
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                executor.map(lambda query: self.sut.search(user, query), queries)
+            )
+
+        # Assert
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result[0].id == 48250 for result in results))
+
+    def test_that_map_returns_results_in_order(self):
+        # Arrange
+        user = mocks.create_logged_in_user()
+
+        # Act
+        results = self.sut.map(
+            "search", [(user, "First"), (user, "Second"), (user, "Missing")]
+        )
+
+        # Assert
+        self.assertEqual(results[0][0].id, 48250)
+        self.assertEqual(results[1][0].id, 48250)
+        self.assertEqual(results[2], [])
+
+
+class HearThisSyncCreationTests(TestCase):
+    def test_that_failed_session_creation_stops_the_loop_thread(self):
+        # Arrange
+        def failing_factory():
+            raise ConnectionError()
+
+        # Act
+        with self.assertRaises(ConnectionError):
+            HearThisSync(failing_factory)
+
+        # Assert
+        names = [thread.name for thread in threading.enumerate()]
+        self.assertNotIn("pyhearthis-loop", names)
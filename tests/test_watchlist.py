@@ -0,0 +1,148 @@
+import asyncio
+from collections import namedtuple
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from pyhearthis.watchlist import NewTrack, Watchlist, adaptive_interval
+
+Track = namedtuple("Track", "id unix_created_at release_timestamp")
+
+
+class ArtistClient:
+    # serves the uploads of every artist, newest first like the api
+    def __init__(self) -> None:
+        self.uploads = {}
+        self.requests = []
+
+    def upload(self, permalink: str, track_id: int, created_at: int) -> None:
+        self.uploads.setdefault(permalink, []).insert(0, Track(track_id, created_at, 0))
+
+    async def get_artist_tracks(self, user, permalink, page, count):
+        self.requests.append((permalink, page))
+        return self.uploads.get(permalink, [])[(page - 1) * count : page * count]
+
+
+class AdaptiveIntervalTests(TestCase):
+    def test_that_frequent_uploaders_are_polled_more_often(self):
+        daily = [day * 86400 for day in range(10)]
+        monthly = [month * 30 * 86400 for month in range(10)]
+
+        daily_interval = adaptive_interval(daily, 0.25, 60, 7 * 86400, 3600)
+        monthly_interval = adaptive_interval(monthly, 0.25, 60, 7 * 86400, 3600)
+
+        self.assertEqual(daily_interval, 21600)
+        self.assertEqual(monthly_interval, 7 * 86400)
+        self.assertEqual(adaptive_interval([100], 0.25, 60, 86400, 3600), 3600)
+
+
+class WatchlistTests(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.client = ArtistClient()
+        for artist in ["first", "second"]:
+            for track_id in range(3):
+                self.client.upload(artist, f"{artist}-{track_id}", track_id * 100)
+
+    def create_watchlist(self, **kwargs) -> Watchlist:
+        options = dict(
+            polls_per_second=1000,
+            min_interval=0.01,
+            max_interval=0.02,
+            initial_interval=0.01,
+            page_size=2,
+        )
+        options.update(kwargs)
+        return Watchlist(self.client, None, **options)
+
+    async def test_that_new_tracks_are_published_to_every_subscriber_once(self):
+        # Arrange
+        sut = self.create_watchlist()
+        sut.add("first")
+        sut.add("second")
+        subscribers = [sut.subscribe(), sut.subscribe()]
+        poller = asyncio.ensure_future(sut.run())
+        while sut.stats("first").polls == 0 or sut.stats("second").polls == 0:
+            await asyncio.sleep(0.01)
+
+        # Act
+        # three uploads at once need a second page of the artist
+        self.client.upload("first", "first-3", 300)
+        self.client.upload("first", "first-4", 300)
+        self.client.upload("first", "first-5", 400)
+        received = [
+            [await asyncio.wait_for(subscriber.get(), 1) for _ in range(3)]
+            for subscriber in subscribers
+        ]
+        await asyncio.sleep(0.1)
+        sut.stop()
+        await poller
+
+        # Assert
+        expected_ids = {"first-3", "first-4", "first-5"}
+        for tracks in received:
+            self.assertEqual({new.track.id for new in tracks}, expected_ids)
+            newest = self.client.uploads["first"][0]
+            self.assertEqual(tracks[-1], NewTrack("first", newest))
+        for subscriber in subscribers:
+            self.assertTrue(subscriber._queue.empty())
+        self.assertEqual(sut.stats("first").new_tracks, 3)
+        self.assertEqual(sut.stats("second").new_tracks, 0)
+
+    async def test_that_polls_stay_within_the_rate_budget(self):
+        # Arrange
+        sut = self.create_watchlist(polls_per_second=20)
+        for artist in range(10):
+            sut.add(f"artist-{artist}")
+
+        # Act
+        poller = asyncio.ensure_future(sut.run())
+        await asyncio.sleep(0.5)
+        sut.stop()
+        await poller
+
+        # Assert
+        # a burst of the bucket capacity plus the refill of half a second
+        self.assertLessEqual(len(self.client.requests), 20 + 10 + 1)
+        self.assertGreater(len(self.client.requests), 10)
+
+    async def test_that_every_page_request_is_charged_to_the_budget(self):
+        # Arrange
+        class CountingBudget:
+            acquired = 0
+
+            async def acquire(self, amount: float = 1) -> None:
+                self.acquired += amount
+
+        sut = self.create_watchlist()
+        sut._budget = CountingBudget()
+        sut.add("first")
+        subscription = sut.subscribe()
+        poller = asyncio.ensure_future(sut.run())
+        while sut.stats("first").polls == 0:
+            await asyncio.sleep(0.01)
+
+        # Act
+        for track_id in range(3, 8):
+            self.client.upload("first", f"first-{track_id}", track_id * 100)
+        for _ in range(5):
+            await asyncio.wait_for(subscription.get(), 1)
+        sut.stop()
+        await poller
+
+        # Assert
+        self.assertIn(("first", 3), self.client.requests)
+        self.assertEqual(sut._budget.acquired, len(self.client.requests))
+
+    async def test_that_an_artist_added_again_is_polled_once(self):
+        # Arrange
+        sut = self.create_watchlist(min_interval=0.05, max_interval=10)
+        sut.add("first")
+
+        # Act
+        sut.remove("first")
+        sut.add("first")
+        poller = asyncio.ensure_future(sut.run())
+        await asyncio.sleep(0.3)
+        sut.stop()
+        await poller
+
+        # Assert
+        self.assertEqual(self.client.requests, [("first", 1)])
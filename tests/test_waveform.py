@@ -0,0 +1,52 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock
+
+from pyhearthis.waveform import WaveformCache, WaveformPyramid
+from tests import mocks
+
+
+class WaveformPyramidTests(TestCase):
+    def test_that_levels_halve_the_resolution(self):
+        sut = WaveformPyramid([1, 5, 3, 2, 8])
+
+        self.assertEqual(sut.sample_count, 5)
+        self.assertEqual(sut.level_count, 4)
+
+    def test_that_window_returns_min_and_max_per_pixel(self):
+        sut = WaveformPyramid([1, 5, 3, 2, 8, 0, 4, 4])
+
+        result = sut.window(0.0, 1.0, 2)
+
+        self.assertEqual(result.minimums, [1, 0])
+        self.assertEqual(result.maximums, [5, 8])
+
+    def test_that_zoomed_window_covers_the_requested_samples(self):
+        samples = [(index * 37) % 251 for index in range(3000)]
+        sut = WaveformPyramid(samples)
+
+        result = sut.window(0.25, 0.5, 100)
+
+        self.assertEqual(len(result.minimums), 100)
+        self.assertLessEqual(min(result.minimums), min(samples[750:1500]))
+        self.assertGreaterEqual(max(result.maximums), max(samples[750:1500]))
+        # pixels are aligned to the buckets of the chosen level (4 samples)
+        self.assertGreaterEqual(result.maximums[0], max(samples[750:758]))
+        self.assertLessEqual(result.maximums[0], max(samples[748:760]))
+
+
+class WaveformCacheTests(IsolatedAsyncioTestCase):
+    async def test_that_pyramid_is_rebuilt_when_track_was_updated(self):
+        # Arrange
+        hearthis = AsyncMock()
+        hearthis.get_waveform_samples.return_value = [1, 2, 3, 4]
+        track = mocks.create_single_track()
+        sut = WaveformCache(hearthis)
+
+        # Act
+        await sut.build_many([track, track])
+        await sut.window(track, 0.0, 1.0, 2)
+        await sut.get(track._replace(update_timestamp=1))
+
+        # Assert
+        self.assertEqual(hearthis.get_waveform_samples.await_count, 2)
+        self.assertEqual(len(sut), 1)
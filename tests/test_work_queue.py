@@ -0,0 +1,209 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from pyhearthis.work_queue import (
+    CallbackSink,
+    CrawlWorker,
+    JsonLinesSink,
+    QueueStats,
+    SqliteWorkQueue,
+    TaskKind,
+    TaskStatus,
+    WorkQueue,
+)
+from tests import mocks
+
+
+class ArtistClient:
+    # 45 tracks per artist, the first request of "flaky" fails
+    def __init__(self) -> None:
+        self.requests = []
+        self.failures = {"flaky"}
+
+    async def get_artist_tracks(self, user, permalink, page, count):
+        self.requests.append((permalink, page))
+        await asyncio.sleep(0)
+        if permalink in self.failures:
+            self.failures.discard(permalink)
+            raise ConnectionError(permalink)
+
+        track = mocks.create_single_track()
+        ids = range((page - 1) * count, min(page * count, 45))
+        return [track._replace(id=f"{permalink}-{i}") for i in ids]
+
+
+class SlowClient(ArtistClient):
+    async def get_artist_tracks(self, user, permalink, page, count):
+        await asyncio.sleep(0.1)
+        return await super().get_artist_tracks(user, permalink, page, count)
+
+
+class BusyQueue(SqliteWorkQueue):
+    # the first lease extension finds the database locked
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self.extensions = 0
+
+    def extend(self, task, owner, visibility_timeout) -> bool:
+        self.extensions += 1
+        if self.extensions == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return super().extend(task, owner, visibility_timeout)
+
+
+class SqliteWorkQueueTests(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "queue.sqlite")
+        self.sut = SqliteWorkQueue(self.path, max_attempts=2)
+
+    def tearDown(self) -> None:
+        self.sut.close()
+        self.directory.cleanup()
+
+    def test_that_expired_leases_move_to_other_workers(self):
+        # Arrange
+        other = SqliteWorkQueue(self.path, max_attempts=2)
+        added = [self.sut.put_artist_tracks("first"), other.put_artist_tracks("first")]
+        [task] = self.sut.lease("dead", visibility_timeout=0.01)
+
+        # Act
+        time.sleep(0.02)
+        [released] = other.lease("alive", visibility_timeout=60)
+
+        # Assert
+        self.assertEqual(added, [True, False])
+        self.assertEqual(released.id, task.id)
+        self.assertEqual(released.attempts, 2)
+        self.assertFalse(self.sut.complete(task, "dead"))
+        self.assertIsNone(self.sut.fail(task, "dead", "late"))
+        self.assertEqual(other.fail(released, "alive", "error"), TaskStatus.FAILED)
+        self.assertEqual(self.sut.stats(), QueueStats(0, 0, 0, 1))
+        other.close()
+
+    def test_that_leased_tasks_are_invisible_until_released(self):
+        # Arrange
+        self.sut.put_artist_tracks("first", priority=1)
+        self.sut.put_artist_tracks("second", priority=5)
+        [task] = self.sut.lease("worker", visibility_timeout=60)
+
+        # Act
+        hidden = self.sut.lease("other", visibility_timeout=60, count=5)
+        self.sut.release(task, "worker")
+        visible = self.sut.lease("other", visibility_timeout=60, count=5)
+
+        # Assert
+        self.assertEqual(task.payload["permalink"], "second")
+        self.assertEqual([t.payload["permalink"] for t in hidden], ["first"])
+        self.assertEqual([t.id for t in visible], [task.id])
+        self.assertEqual(visible[0].attempts, 1)
+
+    def test_that_work_queue_is_abstract(self):
+        with self.assertRaises(TypeError):
+            WorkQueue()
+
+
+class CrawlWorkerTests(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "queue.sqlite")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    async def test_that_workers_share_the_crawl_and_retry_failures(self):
+        # Arrange
+        client = ArtistClient()
+        queues = [SqliteWorkQueue(self.path) for _ in range(2)]
+        for artist in ["first", "second", "flaky"]:
+            queues[0].put_artist_tracks(artist, count=20)
+        results = []
+        output = os.path.join(self.directory.name, "results.jsonl")
+        sinks = [
+            CallbackSink(lambda task, result: results.extend(result)),
+            JsonLinesSink(output),
+        ]
+        options = dict(concurrency=2, retry_delay=0.05, poll_interval=0.01)
+        workers = [
+            CrawlWorker(client, None, queue, sinks, **options) for queue in queues
+        ]
+
+        # Act
+        stats = await asyncio.gather(*[worker.run() for worker in workers])
+        sinks[1].close()
+
+        # Assert
+        track_ids = [track.id for track in results]
+        self.assertEqual(len(track_ids), 3 * 45)
+        self.assertEqual(len(set(track_ids)), 3 * 45)
+        self.assertEqual(sum(s.completed for s in stats), 9)
+        self.assertEqual(sum(s.failed for s in stats), 1)
+        self.assertEqual(queues[0].stats(), QueueStats(0, 0, 9, 0))
+        self.assertEqual(client.requests.count(("flaky", 1)), 2)
+        with open(output) as file:
+            lines = [json.loads(line) for line in file]
+        self.assertEqual(len(lines), 9)
+        self.assertEqual(lines[0]["kind"], TaskKind.ARTIST_TRACKS_PAGE.value)
+        for queue in queues:
+            queue.close()
+
+    async def test_that_a_locked_database_does_not_block_the_event_loop(self):
+        # Arrange
+        queue = SqliteWorkQueue(self.path, timeout=5)
+        queue.put_artist_tracks("first", count=50)
+        blocker = sqlite3.connect(self.path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        worker = CrawlWorker(ArtistClient(), None, queue, concurrency=1)
+
+        # Act
+        run = asyncio.ensure_future(worker.run())
+        started = time.monotonic()
+        await asyncio.sleep(0.05)
+        waited = time.monotonic() - started
+        blocker.execute("COMMIT")
+        stats = await run
+
+        # Assert
+        self.assertLess(waited, 1)
+        self.assertEqual(stats.completed, 1)
+        blocker.close()
+        queue.close()
+
+    async def test_that_leases_are_renewed_after_a_locked_database(self):
+        # Arrange
+        queue = BusyQueue(self.path)
+        queue.put_artist_tracks("first", count=50)
+        worker = CrawlWorker(
+            SlowClient(), None, queue, concurrency=1, visibility_timeout=0.03
+        )
+
+        # Act
+        stats = await worker.run()
+
+        # Assert
+        self.assertEqual(stats.completed, 1)
+        self.assertEqual(worker.renewal_errors, 1)
+        self.assertGreater(queue.extensions, 1)
+        queue.close()
+
+    async def test_that_workers_wait_for_delayed_retries(self):
+        # Arrange
+        client = ArtistClient()
+        queue = SqliteWorkQueue(self.path)
+        queue.put_artist_tracks("flaky", count=20)
+        worker = CrawlWorker(
+            client, None, queue, concurrency=2, retry_delay=0.05, poll_interval=0.01
+        )
+
+        # Act
+        stats = await worker.run()
+
+        # Assert
+        self.assertEqual((stats.completed, stats.failed), (3, 1))
+        self.assertEqual(queue.stats(), QueueStats(0, 0, 3, 0))
+        queue.close()